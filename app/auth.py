@@ -1,40 +1,165 @@
 # app/auth.py
 import hashlib
+import hmac
+import logging
+import os
+import secrets
+import threading
 import time
-from fastapi import Request, HTTPException, status
-from starlette.middleware.base import BaseHTTPMiddleware
+from typing import Dict, Optional
+
+from starlette.requests import HTTPConnection
 from starlette.responses import RedirectResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from .storage import DATA_DIR, add_user, load_users, users_version  # ← импортируем из storage
+
+logger = logging.getLogger(__name__)
+
+SESSION_COOKIE = "session"
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", "86400"))
+SESSION_SECRET_FILE = DATA_DIR / ".session_secret"
+
+PUBLIC_PATHS = frozenset({"/login", "/register", "/docs", "/openapi.json", "/health", "/metrics"})
 
-from .storage import load_users  # ← импортируем из storage
 
 def hash_password(password: str) -> str:
     salt = "local_salt_2026_secure"
     return hashlib.sha256((salt + password).encode()).hexdigest()
 
+
+class UserCache:
+    """Пользователи в памяти процесса.
+
+    Регистрации через `add` записываются в хранилище и сразу в кэш (write-through);
+    изменения из других процессов замечаются по `users_version()` хранилища
+    (mtime файла или состояние таблицы) — список перечитывается только тогда.
+    """
+
+    def __init__(self):
+        self._users: Dict[str, str] = {}
+        self._version = object()  # заведомо не совпадает ни с одной версией хранилища
+        self._lock = threading.Lock()
+
+    def _refresh(self) -> None:
+        version = users_version()
+        if version == self._version:
+            return
+        with self._lock:
+            if version != self._version:
+                self._users = load_users()
+                self._version = version
+
+    def get_hash(self, username: str) -> Optional[str]:
+        self._refresh()
+        return self._users.get(username)
+
+    def count(self) -> int:
+        self._refresh()
+        return len(self._users)
+
+    def add(self, username: str, password_hash: str) -> bool:
+        with self._lock:
+            if not add_user(username, password_hash):
+                return False
+            # Новый пользователь виден сразу; версия хранилища не обновляется —
+            # при следующем обращении список один раз сверится с хранилищем
+            self._users = dict(self._users, **{username: password_hash})
+            return True
+
+
+_user_cache = UserCache()
+
+
 def verify_user(username: str, password: str) -> bool:
-    users = load_users()
-    return username in users and users[username] == hash_password(password)
+    stored = _user_cache.get_hash(username)
+    return stored is not None and hmac.compare_digest(stored, hash_password(password))
 
 def create_user(username: str, password: str) -> bool:
-    from .storage import save_users
-    users = load_users()
-    if username in users:
-        return False
-    users[username] = hash_password(password)
-    save_users(users)
-    return True
-
-class AuthMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        public_paths = {"/login", "/register", "/docs", "/openapi.json", "/health"}
-        if request.url.path in public_paths:
-            return await call_next(request)
-
-        session = request.cookies.get("session")
-        if not session or ":" not in session:
-            return RedirectResponse("/login")
-
-        username, _ = session.split(":", 1)
-        request.state.username = username
-        response = await call_next(request)
-        return response
+    return _user_cache.add(username, hash_password(password))
+
+def count_users() -> int:
+    return _user_cache.count()
+
+
+def _load_session_secret() -> bytes:
+    """Ключ подписи сессий: `SESSION_SECRET` или случайный ключ, сохранённый в `data/`.
+
+    Ключ в файле общий для API и UI и переживает перезапуск — выданные сессии остаются действительными.
+    """
+    secret = os.getenv("SESSION_SECRET")
+    if secret:
+        return secret.encode("utf-8")
+    try:
+        return SESSION_SECRET_FILE.read_bytes().strip()
+    except FileNotFoundError:
+        pass
+    secret = secrets.token_hex(32)
+    try:
+        fd = os.open(SESSION_SECRET_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        # Другой процесс (API или UI) создал ключ одновременно с нами
+        return SESSION_SECRET_FILE.read_bytes().strip()
+    with os.fdopen(fd, "w") as f:
+        f.write(secret)
+    logger.info(f"Создан ключ подписи сессий {SESSION_SECRET_FILE}")
+    return secret.encode("utf-8")
+
+
+_session_secret: Optional[bytes] = None
+
+
+def _sign(payload: str) -> str:
+    global _session_secret
+    if _session_secret is None:
+        _session_secret = _load_session_secret()
+    return hmac.new(_session_secret, payload.encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+def create_session_token(username: str) -> str:
+    """Токен сессии `username:timestamp:подпись` (HMAC-SHA256)."""
+    payload = f"{username}:{int(time.time())}"
+    return f"{payload}:{_sign(payload)}"
+
+
+def verify_session_token(token: Optional[str]) -> Optional[str]:
+    """Проверяет подпись и срок действия токена без обращения к диску; возвращает имя пользователя."""
+    if not token or token.count(":") != 2:
+        return None
+    username, ts, signature = token.split(":")
+    if not hmac.compare_digest(signature, _sign(f"{username}:{ts}")):
+        return None
+    try:
+        issued_at = int(ts)
+    except ValueError:
+        return None
+    if time.time() - issued_at > SESSION_TTL_SECONDS:
+        return None
+    return username
+
+
+class AuthMiddleware:
+    """ASGI-middleware авторизации по подписанной cookie `session`.
+
+    В отличие от `BaseHTTPMiddleware` не оборачивает тело ответа: потоковые
+    ответы проходят без буферизации. Имя пользователя кладётся в
+    `scope["state"]` и доступно в обработчиках как `request.state.username`.
+    """
+
+    def __init__(self, app: ASGIApp, public_paths: frozenset = PUBLIC_PATHS):
+        self.app = app
+        self.public_paths = public_paths
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] not in ("http", "websocket") or scope["path"] in self.public_paths:
+            await self.app(scope, receive, send)
+            return
+
+        username = verify_session_token(HTTPConnection(scope).cookies.get(SESSION_COOKIE))
+        if username is None:
+            response = RedirectResponse("/login")
+            await response(scope, receive, send)
+            return
+
+        scope.setdefault("state", {})["username"] = username
+        await self.app(scope, receive, send)
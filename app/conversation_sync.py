@@ -0,0 +1,178 @@
+import json
+import logging
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import quote
+
+import requests
+
+from app.storage import (
+    _message_hash,
+    delete_user_conversation,
+    get_conversation_messages,
+    get_storage,
+    iter_conversation_export,
+    save_user_conversation,
+    save_user_conversations,
+    split_conversation,
+)
+
+logger = logging.getLogger(__name__)
+
+Fingerprint = Tuple[int, Optional[str], str]
+
+
+def dialog_fingerprint(conversation: Any) -> Fingerprint:
+    """Дешёвый отпечаток диалога: число сообщений, хэш последнего и остальные поля.
+
+    UI только дописывает сообщения, поэтому сравнивать всю историю не нужно —
+    так же изменения определяет и само хранилище.
+    """
+    messages, fields = split_conversation(conversation)
+    last_hash = _message_hash(messages[-1]) if messages else None
+    return len(messages), last_hash, json.dumps(fields, ensure_ascii=False, sort_keys=True)
+
+
+class LocalConversations:
+    """Диалоги пользователя в локальном хранилище (`app.storage`)."""
+
+    def __init__(self, username: str):
+        self.username = username
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        return get_storage().load_conversations(self.username)
+
+    def save_all(self, data: Dict[str, Any]) -> None:
+        save_user_conversations(self.username, data)
+
+    def save(self, name: str, conversation: Any) -> None:
+        save_user_conversation(self.username, name, conversation)
+
+    def delete(self, name: str) -> None:
+        delete_user_conversation(self.username, name)
+
+    def load_messages(self, name: str, offset: int, limit: int) -> Optional[Tuple[List[Any], int]]:
+        return get_conversation_messages(self.username, name, offset, limit)
+
+    def export(self, name: str) -> Optional[Iterator[str]]:
+        return iter_conversation_export(self.username, name)
+
+
+class ApiConversations:
+    """Диалоги пользователя через API бэкенда (`/api/conversations`) — UI не пишет на диск сам."""
+
+    def __init__(self, base_url: str, cookies: Dict[str, str], timeout: float = 10.0):
+        self.base_url = base_url.rstrip("/")
+        self.cookies = cookies
+        self.timeout = timeout
+
+    def _url(self, name: str) -> str:
+        return f"{self.base_url}/api/conversations/{quote(name, safe='')}"
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        response = requests.get(f"{self.base_url}/api/conversations", cookies=self.cookies, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def save_all(self, data: Dict[str, Any]) -> None:
+        response = requests.post(
+            f"{self.base_url}/api/conversations", json=data, cookies=self.cookies, timeout=self.timeout
+        )
+        response.raise_for_status()
+
+    def save(self, name: str, conversation: Any) -> None:
+        response = requests.put(self._url(name), json=conversation, cookies=self.cookies, timeout=self.timeout)
+        response.raise_for_status()
+
+    def delete(self, name: str) -> None:
+        response = requests.delete(self._url(name), cookies=self.cookies, timeout=self.timeout)
+        if response.status_code != 404:
+            response.raise_for_status()
+
+    def load_messages(self, name: str, offset: int, limit: int) -> Optional[Tuple[List[Any], int]]:
+        response = requests.get(
+            f"{self._url(name)}/messages",
+            params={"offset": offset, "limit": limit},
+            cookies=self.cookies,
+            timeout=self.timeout,
+        )
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        page = response.json()
+        return page["messages"], page["total"]
+
+    def export(self, name: str) -> Optional[Iterator[str]]:
+        response = requests.get(f"{self._url(name)}/export", cookies=self.cookies, timeout=self.timeout, stream=True)
+        if response.status_code == 404:
+            response.close()
+            return None
+        response.raise_for_status()
+        response.encoding = "utf-8"
+        return response.iter_content(chunk_size=64 * 1024, decode_unicode=True)
+
+
+class ConversationSync:
+    """Сохранение диалогов из UI только при изменениях.
+
+    Streamlit перезапускает скрипт на каждое действие в интерфейсе, поэтому
+    `flush` вызывается часто и должен ничего не стоить, если ничего не
+    изменилось: отпечатки диалогов сравниваются с сохранёнными, запись идёт
+    только для изменённых и удалённых диалогов. Без `force` запись выполняется
+    не чаще раза в `min_interval_seconds` (например, пока двигают ползунок
+    температуры); отложенные изменения уходят при следующем `flush` после
+    интервала или при `flush(force=True)` — после ответа модели, создания и
+    удаления диалога, выхода. Если изменился порядок диалогов, сохраняется
+    весь набор.
+    """
+
+    def __init__(self, target, min_interval_seconds: float = 2.0, clock: Callable[[], float] = time.monotonic):
+        self.target = target
+        self.min_interval_seconds = min_interval_seconds
+        self.clock = clock
+        self._saved: Dict[str, Fingerprint] = {}
+        self._order: List[str] = []
+        self._last_write = float("-inf")
+        self.writes = 0
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        """Загружает диалоги и запоминает их как сохранённые; `None`, если данных нет."""
+        data = self.target.load()
+        self.mark_clean(data or {})
+        return data
+
+    def mark_clean(self, data: Dict[str, Any]) -> None:
+        self._saved = {name: dialog_fingerprint(c) for name, c in data.items()}
+        self._order = list(self._saved)
+
+    def flush(self, data: Dict[str, Any], force: bool = False) -> bool:
+        """Сохраняет изменения в `data`; `True`, если что-то было записано."""
+        current = {name: dialog_fingerprint(c) for name, c in data.items()}
+        changed = [name for name, fp in current.items() if self._saved.get(name) != fp]
+        removed = [name for name in self._saved if name not in current]
+        if not changed and not removed and list(current) == self._order:
+            return False
+        now = self.clock()
+        if not force and now - self._last_write < self.min_interval_seconds:
+            return False
+
+        # Поштучное сохранение добавляет новые диалоги в конец — иной порядок сохраняем целиком
+        expected_order = [name for name in self._order if name in current] + [n for n in current if n not in self._saved]
+        try:
+            if list(current) != expected_order:
+                self.target.save_all(data)
+            else:
+                for name in removed:
+                    self.target.delete(name)
+                for name in changed:
+                    self.target.save(name, data[name])
+        except Exception as e:
+            # Изменения остаются несохранёнными — повторим при следующем flush
+            logger.warning(f"Ошибка сохранения диалогов: {e}")
+            return False
+
+        self._saved = current
+        self._order = list(current)
+        self._last_write = now
+        self.writes += 1
+        return True
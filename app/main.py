@@ -1,28 +1,92 @@
 # app/main.py
-import time
-from fastapi import FastAPI, Request, Form, HTTPException
-from fastapi.responses import JSONResponse
-
-from app.auth import AuthMiddleware, verify_user, create_user, load_users
-from app.storage import get_user_conversations, save_user_conversations
+import os
+from urllib.parse import quote
+from fastapi import FastAPI, Request, Form, HTTPException, Query
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+from app.auth import AuthMiddleware, SESSION_COOKIE, SESSION_TTL_SECONDS, verify_user, create_user, count_users, create_session_token
+from app.storage import (
+    get_user_conversations,
+    save_user_conversations,
+    save_user_conversation,
+    delete_user_conversation,
+    get_conversation_messages,
+    iter_conversation_export,
+)
+from utils import metrics
+from utils.admission import AdmissionMiddleware
 from utils.utils import configure_logging
 
 from ollama_client.endpoint.ollama_router import ollama_router
 from transformers_client.endpoint.qwen3_router import qwen3_router
+from openai_client.endpoint.openai_router import openai_router
+from openai_client.endpoint.openai_settings import get_openai_settings
 
-MAX_USERS = 10
+MAX_USERS = int(os.getenv("MAX_USERS", "10"))
 configure_logging()
 
+# Движки: имя — префикс путей API и ключ в app.state (`<name>_client`, `<name>_admission`), см. llm_engine
+ENGINE_ROUTERS = {
+    "ollama": ollama_router,
+    "qwen3": qwen3_router,
+}
+# OpenAI-совместимый сервер (llama.cpp, vLLM) подключается только явно: без него приложение не стартует
+if get_openai_settings().openai_enabled:
+    ENGINE_ROUTERS["openai"] = openai_router
+
 app = FastAPI(title="Multi-User LLM Chat API")
+# Порядок: последний добавленный — внешний. Допуск выполняется после авторизации,
+# чтобы лимиты считались по имени пользователя
+app.add_middleware(AdmissionMiddleware, routes={f"/{name}/chat": f"{name}_admission" for name in ENGINE_ROUTERS})
 app.add_middleware(AuthMiddleware)
 
-app.include_router(ollama_router)
-app.include_router(qwen3_router)
+for engine_router in ENGINE_ROUTERS.values():
+    app.include_router(engine_router)
 
 
 @app.get("/health")
 async def health():
-    return {"status": "ok"}
+    """Живость API и состояние каждого подключённого движка.
+
+    `engines` — список подключённых движков (по нему UI строит выбор движка).
+    Для каждого движка — кэш ответов, краткое содержание, контроль допуска и
+    собственное состояние из `LLMEngine.health()` (у Qwen3 — готовность модели:
+    `ready`, `loading`, `unloaded`, `error`).
+    """
+    engines = {}
+    for name in ENGINE_ROUTERS:
+        client = getattr(app.state, f"{name}_client", None)
+        engines[name] = {
+            "response_cache": _cache_stats(client),
+            "summary": _summary_stats(client),
+            "admission": _admission_stats(f"{name}_admission"),
+            **(client.health() if client is not None else {}),
+        }
+    return {"status": "ok", "engines": list(engines), **engines}
+
+
+def _cache_stats(client) -> dict:
+    cache = getattr(client, "response_cache", None)
+    return cache.stats() if cache is not None else {}
+
+
+def _summary_stats(client) -> dict:
+    summarizer = getattr(client, "summarizer", None)
+    return summarizer.stats() if summarizer is not None else {}
+
+
+def _admission_stats(attribute: str) -> dict:
+    controller = getattr(app.state, attribute, None)
+    return controller.stats() if controller is not None else {}
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Метрики в формате Prometheus: задержки, токены, очереди, кэши, хранилище."""
+    if not metrics.available():
+        raise HTTPException(status_code=503, detail="prometheus_client не установлен")
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
 
 
 # === Вход: только проверка, без редиректа ===
@@ -37,12 +101,11 @@ async def login(username: str = Form(...), password: str = Form(...)):
 
     # Устанавливаем cookie даже в JSON-ответе
     response = JSONResponse(content={"status": "success", "username": username})
-    session = f"{username}:{int(time.time())}"
     response.set_cookie(
-        key="session",
-        value=session,
+        key=SESSION_COOKIE,
+        value=create_session_token(username),
         httponly=True,
-        max_age=86400,
+        max_age=SESSION_TTL_SECONDS,
         secure=False,  # True только для HTTPS
         samesite="lax"
     )
@@ -62,15 +125,12 @@ async def register(username: str = Form(...), password: str = Form(...)):
     if not username.replace("_", "").replace("-", "").isalnum() or len(username) < 2 or len(username) > 20:
         raise HTTPException(status_code=400, detail="Некорректный формат логина")
 
-    users = load_users()
-    if len(users) >= MAX_USERS:
+    if count_users() >= MAX_USERS:
         raise HTTPException(status_code=403, detail=f"Достигнут лимит в {MAX_USERS} пользователей")
-    if username in users:
-        raise HTTPException(status_code=400, detail="Пользователь с таким именем уже существует")
 
     if create_user(username, password):
         return {"status": "success", "message": "Пользователь создан"}
-    raise HTTPException(status_code=500, detail="Ошибка при создании пользователя")
+    raise HTTPException(status_code=400, detail="Пользователь с таким именем уже существует")
 
 
 # === API для диалогов (опционально) ===
@@ -89,3 +149,58 @@ async def save_conversations(request: Request, data: dict):
         raise HTTPException(status_code=401)
     save_user_conversations(username, data)
     return {"status": "saved"}
+
+
+@app.put("/api/conversations/{name:path}")
+async def save_conversation(request: Request, name: str, conversation: dict):
+    """Сохраняет один диалог — клиент присылает только изменённые, остальные не перезаписываются."""
+    username = getattr(request.state, "username", None)
+    if not username:
+        raise HTTPException(status_code=401)
+    save_user_conversation(username, name, conversation)
+    return {"status": "saved"}
+
+
+@app.delete("/api/conversations/{name:path}")
+async def delete_conversation(request: Request, name: str):
+    username = getattr(request.state, "username", None)
+    if not username:
+        raise HTTPException(status_code=401)
+    if not delete_user_conversation(username, name):
+        raise HTTPException(status_code=404, detail="Диалог не найден")
+    return {"status": "deleted"}
+
+
+@app.get("/api/conversations/{name}/messages")
+async def get_messages(
+    request: Request,
+    name: str,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=500),
+):
+    """Страница сообщений диалога; `total` — чтобы клиент мог запросить последние сообщения."""
+    username = getattr(request.state, "username", None)
+    if not username:
+        raise HTTPException(status_code=401)
+    page = get_conversation_messages(username, name, offset, limit)
+    if page is None:
+        raise HTTPException(status_code=404, detail="Диалог не найден")
+    messages, total = page
+    return {"messages": messages, "offset": offset, "limit": limit, "total": total}
+
+
+@app.get("/api/conversations/{name}/export")
+async def export_conversation(request: Request, name: str):
+    """Диалог в TXT; текст отдаётся потоком по страницам сообщений, без сборки целиком."""
+    username = getattr(request.state, "username", None)
+    if not username:
+        raise HTTPException(status_code=401)
+    lines = iter_conversation_export(username, name)
+    if lines is None:
+        raise HTTPException(status_code=404, detail="Диалог не найден")
+    filename = quote(f"chat_{name}.txt", safe="")
+    return StreamingResponse(
+        lines,
+        media_type="text/plain; charset=utf-8",
+        headers={"Content-Disposition": f"attachment; filename*=UTF-8''{filename}"},
+    )
@@ -1,7 +1,21 @@
+import copy
+import hashlib
 import json
 import logging
+import os
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Dict, Any
+from typing import BinaryIO, Dict, Any, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: межпроцессная блокировка недоступна
+    fcntl = None
+
+from utils import metrics
 
 logger = logging.getLogger(__name__)
 
@@ -9,32 +23,720 @@ DATA_DIR = Path("data")
 CONV_DIR = DATA_DIR / "conversations"
 USERS_FILE = DATA_DIR / "users.json"
 
+# json — файлы в data/ (по умолчанию), sqlite — одна база data/chat.db в режиме WAL
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "json").lower()
+SQLITE_PATH = Path(os.getenv("STORAGE_SQLITE_PATH", str(DATA_DIR / "chat.db")))
+
 DATA_DIR.mkdir(exist_ok=True)
 CONV_DIR.mkdir(exist_ok=True)
 
-def load_users() -> Dict[str, str]:
-    if USERS_FILE.exists():
-        with open(USERS_FILE, "r", encoding="utf-8") as f:
+DEFAULT_CONVERSATIONS: Dict[str, Any] = {
+    "Диалог 1": {"messages": [], "meta": {"model_choice": "ollama", "ollama_variant": "phi3", "temperature": 0.0, "max_tokens": 512}}
+}
+
+
+def _atomic_write(path: Path, content: str) -> None:
+    """Пишет файл целиком через временный файл и `os.replace` — читатель не увидит половину."""
+    tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(content)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _message_hash(message: Any) -> str:
+    return hashlib.sha1(json.dumps(message, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _history_digest(messages: List[Any], digest: str = "") -> str:
+    """Цепочка хэшей сообщений: `digest` истории плюс `messages` — дописывание стоит O(новые сообщения)."""
+    for message in messages:
+        digest = hashlib.sha1((digest + _message_hash(message)).encode("utf-8")).hexdigest()
+    return digest
+
+
+def _message_line(message: Any) -> str:
+    return json.dumps(message, ensure_ascii=False) + "\n"
+
+
+RESET_RECORD: Dict[str, bool] = {"_reset": True}
+
+
+class AppendOnlyConversationStore:
+    """Хранилище диалогов: журнал JSONL на каждый диалог плюс небольшой индекс.
+
+    Структура каталога пользователя `{root}/{username}/`:
+
+    - `index.json` — порядок диалогов, их метаданные и состояние журналов
+      (число сообщений, цепочка хэшей сохранённой истории, размер файла и
+      смещение `start`, с которого в журнале идёт текущая история);
+    - `{dialog_id}.jsonl` — по сообщению на строку.
+
+    При сохранении новые сообщения дописываются в конец журнала, поэтому ход
+    диалога стоит O(сообщения), а не O(все диалоги): «история только дополнилась»
+    проверяется по числу сообщений и цепочке хэшей всей сохранённой истории
+    (`_history_digest`), так что правка любого сообщения замечается. Если история изменилась не
+    только добавлением (правка, удаление), в журнал пишется запись сброса и
+    история целиком; когда мусора становится много, журнал уплотняется
+    (переписывается атомарно). Индекс перезаписывается только при изменениях.
+
+    Страница, хвост и выгрузка диалога (`read_page`, `read_recent`,
+    `iter_messages`) читают журнал с `start` и разбирают только нужные строки.
+    """
+
+    INDEX_NAME = "index.json"
+
+    def __init__(self, root: Path, compaction_min_records: int = 64, compaction_factor: float = 2.0):
+        self.root = root
+        self.compaction_min_records = compaction_min_records
+        self.compaction_factor = compaction_factor
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        self._held = threading.local()
+
+    # --- служебное ---
+
+    def _user_dir(self, username: str) -> Path:
+        return self.root / username
+
+    def _legacy_file(self, username: str) -> Path:
+        return self.root / f"{username}.json"
+
+    @contextmanager
+    def lock(self, username: str) -> Iterator[None]:
+        """Блокировка пользователя внутри процесса и, где возможно, между процессами (UI и API).
+
+        Повторный вход из того же потока не блокируется — внутри можно вызывать `save`.
+        """
+        held = self._held.__dict__.setdefault("users", set())
+        if username in held:
+            yield
+            return
+        with self._locks_guard:
+            lock = self._locks.setdefault(username, threading.Lock())
+        with lock:
+            held.add(username)
+            try:
+                user_dir = self._user_dir(username)
+                user_dir.mkdir(parents=True, exist_ok=True)
+                if fcntl is None:
+                    yield
+                    return
+                with open(user_dir / ".lock", "w") as lock_file:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                    try:
+                        yield
+                    finally:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+            finally:
+                held.discard(username)
+
+    def _read_index(self, username: str) -> Optional[Dict[str, Any]]:
+        path = self._user_dir(username) / self.INDEX_NAME
+        if not path.exists():
+            return None
+        with open(path, "r", encoding="utf-8") as f:
             return json.load(f)
-    return {}
+
+    def _replay(self, path: Path) -> List[Any]:
+        messages: List[Any] = []
+        if not path.exists():
+            return messages
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Оборванная последняя строка (сбой во время записи) — пропускаем
+                    logger.warning(f"Повреждённая запись в журнале {path.name}, пропускаем")
+                    continue
+                if record == RESET_RECORD:
+                    messages = []
+                else:
+                    messages.append(record)
+        return messages
+
+    def _write_log(self, path: Path, messages: List[Any]) -> None:
+        _atomic_write(path, "".join(_message_line(m) for m in messages))
+
+    def _append_log(self, path: Path, records: List[Any]) -> None:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write("".join(_message_line(r) for r in records))
+            f.flush()
+            os.fsync(f.fileno())
+
+    # --- публичный API ---
+
+    def load(self, username: str) -> Optional[Dict[str, Any]]:
+        """Загружает все диалоги пользователя; `None`, если данных нет."""
+        index = self._read_index(username)
+        if index is None:
+            legacy = self._legacy_file(username)
+            if legacy.exists():
+                with open(legacy, "r", encoding="utf-8") as f:
+                    return json.load(f)
+            return None
+
+        user_dir = self._user_dir(username)
+        result: Dict[str, Any] = {}
+        for name, entry in index.get("dialogs", {}).items():
+            conversation = dict(entry.get("fields", {}))
+            conversation["messages"] = self._replay(user_dir / f"{entry['id']}.jsonl")
+            result[name] = conversation
+        return result
+
+    def load_one(self, username: str, name: str) -> Optional[Any]:
+        """Загружает один диалог — читается только его журнал; `None`, если диалога нет."""
+        index = self._read_index(username)
+        if index is None:
+            data = self.load(username)
+            return None if data is None else data.get(name)
+        entry = index.get("dialogs", {}).get(name)
+        if entry is None:
+            return None
+        conversation = dict(entry.get("fields", {}))
+        conversation["messages"] = self._replay(self._user_dir(username) / f"{entry['id']}.jsonl")
+        return conversation
+
+    def _open_history(self, username: str, name: str) -> Optional[Tuple[BinaryIO, int, int, int]]:
+        """Открывает журнал диалога для чтения текущей истории: `(файл, start, конец, число сообщений)`.
+
+        `None`, если так читать нельзя (диалога нет, старый формат, журнал расходится с индексом) —
+        тогда читается весь диалог. Файл открывается под блокировкой пользователя, а читается
+        уже без неё: дописывание не трогает байты до `конец`, а уплотнение подменяет файл,
+        не меняя открытого. Закрывает файл вызывающий.
+        """
+        with self.lock(username):
+            index = self._read_index(username)
+            entry = None if index is None else index.get("dialogs", {}).get(name)
+            if entry is None:
+                return None
+            # Журнал без сбросов и мусора целиком состоит из текущей истории
+            start = entry.get("start", 0 if entry["records"] == entry["count"] else None)
+            if start is None:
+                return None
+            try:
+                f = open(self._user_dir(username) / f"{entry['id']}.jsonl", "rb")
+            except FileNotFoundError:
+                return None
+            if os.fstat(f.fileno()).st_size != entry["size"]:
+                f.close()
+                return None
+            return f, start, entry["size"], entry["count"]
+
+    def _load_messages(self, username: str, name: str) -> Optional[List[Any]]:
+        conversation = self.load_one(username, name)
+        return None if conversation is None else split_conversation(conversation)[0]
+
+    def read_page(self, username: str, name: str, offset: int, limit: int) -> Optional[Tuple[List[Any], int]]:
+        """Страница сообщений диалога и их общее число; `None`, если диалога нет.
+
+        Разбираются только строки страницы, предыдущие лишь пропускаются.
+        """
+        history = self._open_history(username, name)
+        if history is None:
+            messages = self._load_messages(username, name)
+            return None if messages is None else (messages[offset:offset + limit], len(messages))
+
+        f, start, end, count = history
+        with f:
+            f.seek(start)
+            page: List[Any] = []
+            for i, line in enumerate(iter(f.readline, b"")):
+                if i >= offset + limit or f.tell() > end:
+                    break
+                if i >= offset:
+                    page.append(json.loads(line))
+        return page, count
+
+    def read_recent(self, username: str, name: str, limit: int) -> Optional[List[Any]]:
+        """Последние `limit` сообщений диалога; журнал читается с конца блоками. `None`, если диалога нет."""
+        history = self._open_history(username, name)
+        if history is None:
+            messages = self._load_messages(username, name)
+            return None if messages is None else (messages[-limit:] if limit > 0 else [])
+
+        f, start, end, _ = history
+        with f:
+            data = b""
+            pos = end
+            # Больше `limit` переводов строки — в прочитанном не меньше `limit` целых строк
+            while pos > start and limit > 0 and data.count(b"\n") <= limit:
+                step = min(64 * 1024, pos - start)
+                pos -= step
+                f.seek(pos)
+                data = f.read(step) + data
+        lines = data.split(b"\n")
+        if pos > start:
+            lines = lines[1:]  # первая строка блока может быть неполной
+        lines = [line for line in lines if line.strip()]
+        return [json.loads(line) for line in lines[-limit:]] if limit > 0 else []
+
+    def iter_messages(self, username: str, name: str) -> Optional[Iterator[Any]]:
+        """Сообщения диалога по одному за один проход по журналу; `None`, если диалога нет."""
+        history = self._open_history(username, name)
+        if history is None:
+            messages = self._load_messages(username, name)
+            return None if messages is None else iter(messages)
+
+        def messages() -> Iterator[Any]:
+            f, start, end, _ = history
+            with f:
+                f.seek(start)
+                for line in iter(f.readline, b""):
+                    if f.tell() > end:
+                        return
+                    yield json.loads(line)
+
+        return messages()
+
+    def save(self, username: str, data: Dict[str, Any]) -> None:
+        """Сохраняет диалоги пользователя, записывая на диск только изменения."""
+        with self.lock(username):
+            user_dir = self._user_dir(username)
+            old_index = self._read_index(username)
+            migrating = old_index is None and self._legacy_file(username).exists()
+            old_dialogs: Dict[str, Any] = (old_index or {}).get("dialogs", {})
+
+            new_dialogs: Dict[str, Any] = {}
+            for name, conversation in data.items():
+                messages, fields = split_conversation(conversation)
+                new_dialogs[name] = self._save_dialog(user_dir, old_dialogs.get(name), messages, fields)
+
+            for name, entry in old_dialogs.items():
+                if name not in new_dialogs or new_dialogs[name]["id"] != entry["id"]:
+                    (user_dir / f"{entry['id']}.jsonl").unlink(missing_ok=True)
+
+            new_index = {"version": 1, "dialogs": new_dialogs}
+            # Порядок диалогов тоже важен, а сравнение словарей его не учитывает
+            if new_index != old_index or list(new_dialogs) != list(old_dialogs):
+                _atomic_write(user_dir / self.INDEX_NAME, json.dumps(new_index, ensure_ascii=False, indent=2))
+
+            if migrating:
+                legacy = self._legacy_file(username)
+                os.replace(legacy, legacy.with_suffix(".json.migrated"))
+                logger.info(f"Диалоги пользователя {username} переведены в формат журналов")
+
+    def save_one(self, username: str, name: str, conversation: Any) -> None:
+        """Сохраняет один диалог, не трогая остальные; новый диалог становится последним."""
+        with self.lock(username):
+            old_index = self._read_index(username)
+            if old_index is None:
+                # Данных ещё нет или они в старом формате — обычное сохранение всех диалогов
+                data = self.load(username) or {}
+                data[name] = conversation
+                self.save(username, data)
+                return
+
+            dialogs = dict(old_index.get("dialogs", {}))
+            messages, fields = split_conversation(conversation)
+            dialogs[name] = self._save_dialog(self._user_dir(username), dialogs.get(name), messages, fields)
+            new_index = {"version": 1, "dialogs": dialogs}
+            if new_index != old_index:
+                _atomic_write(self._user_dir(username) / self.INDEX_NAME, json.dumps(new_index, ensure_ascii=False, indent=2))
+
+    def append_one(self, username: str, name: str, messages: List[Any]) -> bool:
+        """Дописывает сообщения в конец диалога — читается и пишется только индекс и журнал этого диалога.
+
+        `False`, если диалога нет.
+        """
+        with self.lock(username):
+            old_index = self._read_index(username)
+            entry = None if old_index is None else old_index.get("dialogs", {}).get(name)
+            path = None if entry is None else self._user_dir(username) / f"{entry['id']}.jsonl"
+            if entry is None or "digest" not in entry or not path.exists() or path.stat().st_size != entry["size"]:
+                # Старый формат или журнал расходится с индексом — через полное сохранение диалога
+                conversation = self.load_one(username, name)
+                if conversation is None:
+                    return False
+                if isinstance(conversation, dict):
+                    conversation = dict(conversation, messages=list(conversation.get("messages", [])) + list(messages))
+                else:
+                    conversation = list(conversation) + list(messages)
+                self.save_one(username, name, conversation)
+                return True
+
+            if messages:
+                self._append_log(path, messages)
+                dialogs = dict(old_index["dialogs"])
+                dialogs[name] = dict(
+                    entry,
+                    count=entry["count"] + len(messages),
+                    records=entry["records"] + len(messages),
+                    digest=_history_digest(messages, entry["digest"]),
+                    size=path.stat().st_size,
+                )
+                _atomic_write(
+                    self._user_dir(username) / self.INDEX_NAME,
+                    json.dumps({"version": 1, "dialogs": dialogs}, ensure_ascii=False, indent=2),
+                )
+            return True
+
+    def delete_one(self, username: str, name: str) -> bool:
+        """Удаляет диалог; `False`, если его нет."""
+        with self.lock(username):
+            old_index = self._read_index(username)
+            if old_index is None:
+                data = self.load(username)
+                if data is None or name not in data:
+                    return False
+                del data[name]
+                self.save(username, data)
+                return True
+
+            dialogs = dict(old_index.get("dialogs", {}))
+            entry = dialogs.pop(name, None)
+            if entry is None:
+                return False
+            _atomic_write(
+                self._user_dir(username) / self.INDEX_NAME,
+                json.dumps({"version": 1, "dialogs": dialogs}, ensure_ascii=False, indent=2),
+            )
+            (self._user_dir(username) / f"{entry['id']}.jsonl").unlink(missing_ok=True)
+            return True
+
+    def _save_dialog(
+        self,
+        user_dir: Path,
+        old: Optional[Dict[str, Any]],
+        messages: List[Any],
+        fields: Dict[str, Any],
+    ) -> Dict[str, Any]:
+        """Синхронизирует журнал одного диалога и возвращает его запись для индекса."""
+        count = len(messages)
+
+        if old is None:
+            dialog_id = uuid.uuid4().hex[:12]
+            path = user_dir / f"{dialog_id}.jsonl"
+            self._write_log(path, messages)
+            return {"id": dialog_id, "fields": fields, "count": count, "digest": _history_digest(messages),
+                    "records": count, "start": 0, "size": path.stat().st_size}
+
+        entry = dict(old, fields=fields)
+        entry.pop("last_hash", None)
+        path = user_dir / f"{old['id']}.jsonl"
+        size_on_disk = path.stat().st_size if path.exists() else -1
+        old_count = old["count"]
+        # Индекс старого формата (только хэш последнего сообщения) цепочки не содержит — историю сбросим один раз
+        prefix_digest = _history_digest(messages[:old_count]) if count >= old_count else None
+        digest = (
+            _history_digest(messages[old_count:], prefix_digest)
+            if prefix_digest is not None else _history_digest(messages)
+        )
+
+        if size_on_disk != old["size"]:
+            # Журнал не совпадает с индексом (сбой между записью журнала и индекса) — переписываем
+            self._write_log(path, messages)
+            entry["records"] = count
+            entry["start"] = 0
+        elif prefix_digest is not None and prefix_digest == old.get("digest"):
+            # Обычный случай: история только дополнилась
+            if count > old_count:
+                self._append_log(path, messages[old_count:])
+                entry["records"] = old["records"] + count - old_count
+        else:
+            # История изменена не только добавлением — сбрасываем её в журнале
+            self._append_log(path, [RESET_RECORD] + messages)
+            entry["records"] = old["records"] + 1 + count
+            entry["start"] = size_on_disk + len(_message_line(RESET_RECORD).encode("utf-8"))
+
+        if entry["records"] > self.compaction_factor * count + self.compaction_min_records:
+            logger.debug(f"Уплотнение журнала {path.name}: {entry['records']} записей, {count} сообщений")
+            self._write_log(path, messages)
+            entry["records"] = count
+            entry["start"] = 0
+
+        entry["count"] = count
+        entry["digest"] = digest
+        entry["size"] = path.stat().st_size
+        return entry
+
+
+def split_conversation(conversation: Any) -> Tuple[List[Any], Dict[str, Any]]:
+    """Разделяет диалог на сообщения и остальные поля (`meta` и т. п.); поддерживает старый формат-список."""
+    if isinstance(conversation, dict):
+        return conversation.get("messages", []), {k: v for k, v in conversation.items() if k != "messages"}
+    return (conversation if isinstance(conversation, list) else []), {}
+
+
+class StorageBackend(ABC):
+    """Хранилище пользователей и диалогов.
+
+    Наследники реализуют абстрактные методы (иначе экземпляр не создаётся);
+    `save_conversation` и `delete_conversation` по умолчанию работают через
+    загрузку и сохранение всех диалогов. Выбор реализации — `STORAGE_BACKEND`
+    (см. `get_storage`). `load_conversations` возвращает `None`, если данных
+    пользователя нет, — подстановка диалога по умолчанию делается снаружи.
+    """
+
+    name: str = "base"
+
+    @abstractmethod
+    def load_users(self) -> Dict[str, str]:
+        """Все пользователи: имя -> хэш пароля."""
+
+    @abstractmethod
+    def save_users(self, users: Dict[str, str]) -> None:
+        """Заменяет список пользователей целиком."""
+
+    @abstractmethod
+    def add_user(self, username: str, password_hash: str) -> bool:
+        """Добавляет пользователя; `False`, если такой уже есть."""
+
+    @abstractmethod
+    def count_users(self) -> int:
+        """Число зарегистрированных пользователей."""
+
+    @abstractmethod
+    def users_version(self) -> Any:
+        """Дешёвый признак изменения списка пользователей — по нему сбрасываются кэши."""
+
+    @abstractmethod
+    def load_conversations(self, username: str) -> Optional[Dict[str, Any]]:
+        """Все диалоги пользователя по порядку; `None`, если данных нет."""
+
+    @abstractmethod
+    def save_conversations(self, username: str, data: Dict[str, Any]) -> None:
+        """Сохраняет все диалоги пользователя; отсутствующие в `data` удаляются."""
+
+    def save_conversation(self, username: str, name: str, conversation: Any) -> None:
+        """Сохраняет один диалог (новый — в конец списка), остальные не меняются."""
+        data = self.load_conversations(username) or {}
+        data[name] = conversation
+        self.save_conversations(username, data)
+
+    def delete_conversation(self, username: str, name: str) -> bool:
+        """Удаляет диалог; `False`, если его нет."""
+        data = self.load_conversations(username)
+        if data is None or name not in data:
+            return False
+        del data[name]
+        self.save_conversations(username, data)
+        return True
+
+    @abstractmethod
+    def load_messages(self, username: str, name: str, offset: int, limit: int) -> Optional[Tuple[List[Any], int]]:
+        """Страница сообщений диалога и их общее число; `None`, если диалога нет."""
+
+    @abstractmethod
+    def load_recent_messages(self, username: str, name: str, limit: int) -> Optional[List[Any]]:
+        """Последние `limit` сообщений диалога; `None`, если диалога нет."""
+
+    @abstractmethod
+    def append_messages(self, username: str, name: str, messages: List[Any]) -> bool:
+        """Дописывает сообщения в конец диалога; `False`, если диалога нет."""
+
+    def iter_messages(self, username: str, name: str, page_size: int = 500) -> Optional[Iterator[Any]]:
+        """Все сообщения диалога по одному, страницами `load_messages`; `None`, если диалога нет."""
+        first = self.load_messages(username, name, 0, page_size)
+        if first is None:
+            return None
+
+        def messages() -> Iterator[Any]:
+            page, total = first
+            offset = 0
+            while page:
+                yield from page
+                offset += len(page)
+                if offset >= total:
+                    return
+                loaded = self.load_messages(username, name, offset, page_size)
+                if loaded is None:
+                    return
+                page, total = loaded
+
+        return messages()
+
+
+class FileStorageBackend(StorageBackend):
+    """Пользователи в `users.json`, диалоги — журналы `AppendOnlyConversationStore`."""
+
+    name = "json"
+
+    def __init__(self, users_file: Path, conv_dir: Path):
+        self.users_file = users_file
+        self.conversations = AppendOnlyConversationStore(conv_dir)
+        self._users_lock = threading.Lock()
+
+    def load_users(self) -> Dict[str, str]:
+        if self.users_file.exists():
+            with open(self.users_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        return {}
+
+    def save_users(self, users: Dict[str, str]) -> None:
+        with self._users_lock:
+            _atomic_write(self.users_file, json.dumps(users, ensure_ascii=False, indent=2))
+
+    def add_user(self, username: str, password_hash: str) -> bool:
+        with self._users_lock:
+            users = self.load_users()
+            if username in users:
+                return False
+            users[username] = password_hash
+            _atomic_write(self.users_file, json.dumps(users, ensure_ascii=False, indent=2))
+            return True
+
+    def count_users(self) -> int:
+        return len(self.load_users())
+
+    def users_version(self) -> Any:
+        try:
+            stat = self.users_file.stat()
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def load_conversations(self, username: str) -> Optional[Dict[str, Any]]:
+        return self.conversations.load(username)
+
+    def save_conversations(self, username: str, data: Dict[str, Any]) -> None:
+        self.conversations.save(username, data)
+
+    def save_conversation(self, username: str, name: str, conversation: Any) -> None:
+        self.conversations.save_one(username, name, conversation)
+
+    def delete_conversation(self, username: str, name: str) -> bool:
+        return self.conversations.delete_one(username, name)
+
+    def load_messages(self, username: str, name: str, offset: int, limit: int) -> Optional[Tuple[List[Any], int]]:
+        return self.conversations.read_page(username, name, offset, limit)
+
+    def load_recent_messages(self, username: str, name: str, limit: int) -> Optional[List[Any]]:
+        return self.conversations.read_recent(username, name, limit)
+
+    def iter_messages(self, username: str, name: str, page_size: int = 500) -> Optional[Iterator[Any]]:
+        # Один проход по журналу вместо чтения страниц с начала
+        return self.conversations.iter_messages(username, name)
+
+    def append_messages(self, username: str, name: str, messages: List[Any]) -> bool:
+        return self.conversations.append_one(username, name, messages)
+
+
+def _import_from_files(target: StorageBackend) -> None:
+    """Переносит пользователей и диалоги из файлового хранилища в пустое новое (при смене `STORAGE_BACKEND`)."""
+    source = FileStorageBackend(USERS_FILE, CONV_DIR)
+    users = source.load_users()
+    target.save_users(users)
+    for username in users:
+        data = source.load_conversations(username)
+        if data is not None:
+            target.save_conversations(username, data)
+    logger.info(f"Данные {len(users)} пользователей перенесены из {DATA_DIR} в хранилище {target.name}")
+
+
+_storage: Optional[StorageBackend] = None
+_storage_lock = threading.Lock()
+
+
+def get_storage() -> StorageBackend:
+    """Хранилище процесса, выбранное переменной `STORAGE_BACKEND` (`json` или `sqlite`)."""
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                if STORAGE_BACKEND == "sqlite":
+                    from app.storage_sqlite import SQLiteStorageBackend
+                    _storage = SQLiteStorageBackend(SQLITE_PATH)
+                    if _storage.count_users() == 0 and USERS_FILE.exists():
+                        _import_from_files(_storage)
+                elif STORAGE_BACKEND == "json":
+                    _storage = FileStorageBackend(USERS_FILE, CONV_DIR)
+                else:
+                    raise ValueError(f"Неизвестное хранилище STORAGE_BACKEND={STORAGE_BACKEND!r}: ожидается json или sqlite")
+                logger.info(f"Хранилище данных: {_storage.name}")
+    return _storage
+
+
+def load_users() -> Dict[str, str]:
+    return get_storage().load_users()
 
 def save_users(users: Dict[str, str]) -> None:
-    with open(USERS_FILE, "w", encoding="utf-8") as f:
-        json.dump(users, f, ensure_ascii=False, indent=2)
+    storage = get_storage()
+    with metrics.time_storage(storage.name, "save_users"):
+        storage.save_users(users)
+
+def add_user(username: str, password_hash: str) -> bool:
+    storage = get_storage()
+    with metrics.time_storage(storage.name, "add_user"):
+        return storage.add_user(username, password_hash)
+
+def count_users() -> int:
+    return get_storage().count_users()
+
+def users_version() -> Any:
+    return get_storage().users_version()
+
 
 def get_user_conversations(username: str) -> Dict[str, Any]:
-    path = CONV_DIR / f"{username}.json"
-    if path.exists():
-        try:
-            with open(path, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except Exception as e:
-            logger.warning(f"Ошибка открытия файла диалога: {e}")
-            pass
-    return {"Диалог 1": {"messages": [], "meta": {"model_choice": "ollama", "ollama_variant": "phi3", "temperature": 0.0, "max_tokens": 512}}}
+    try:
+        data = get_storage().load_conversations(username)
+        if data is not None:
+            return data
+    except Exception as e:
+        logger.warning(f"Ошибка открытия файла диалога: {e}")
+    return copy.deepcopy(DEFAULT_CONVERSATIONS)
 
 def save_user_conversations(username: str, data: Dict[str, Any]) -> None:
-    path = CONV_DIR / f"{username}.json"
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-        
\ No newline at end of file
+    storage = get_storage()
+    with metrics.time_storage(storage.name, "save_conversations"):
+        storage.save_conversations(username, data)
+
+def save_user_conversation(username: str, name: str, conversation: Any) -> None:
+    """Сохраняет один диалог пользователя, не перечитывая и не переписывая остальные."""
+    storage = get_storage()
+    with metrics.time_storage(storage.name, "save_conversation"):
+        storage.save_conversation(username, name, conversation)
+
+def delete_user_conversation(username: str, name: str) -> bool:
+    storage = get_storage()
+    with metrics.time_storage(storage.name, "delete_conversation"):
+        return storage.delete_conversation(username, name)
+
+def get_recent_messages(username: str, name: str, limit: int) -> Optional[List[Any]]:
+    """Последние `limit` сообщений диалога — история для модели; `None`, если диалога нет."""
+    storage = get_storage()
+    with metrics.time_storage(storage.name, "load_recent_messages"):
+        return storage.load_recent_messages(username, name, limit)
+
+def append_conversation_messages(username: str, name: str, messages: List[Any]) -> bool:
+    """Дописывает сообщения (например, вопрос и ответ модели) в диалог; `False`, если диалога нет."""
+    storage = get_storage()
+    with metrics.time_storage(storage.name, "append_messages"):
+        return storage.append_messages(username, name, messages)
+
+def get_conversation_messages(
+    username: str, name: str, offset: int = 0, limit: int = 50
+) -> Optional[Tuple[List[Any], int]]:
+    """Страница сообщений диалога `name` (с `offset`, не больше `limit`) и общее число сообщений."""
+    return get_storage().load_messages(username, name, max(0, offset), max(0, limit))
+
+
+def format_message_line(message: Any) -> str:
+    """Строка сообщения в текстовой выгрузке диалога."""
+    if not isinstance(message, dict):
+        return f"{message}\n"
+    author = "Пользователь" if message.get("role") == "user" else "Ассистент"
+    return f"[{author}]: {message.get('text', '')}\n"
+
+def iter_conversation_export(username: str, name: str, page_size: int = 500) -> Optional[Iterator[str]]:
+    """Текст диалога частями по `page_size` сообщений — целиком в памяти не собирается; `None`, если диалога нет."""
+    messages = get_storage().iter_messages(username, name, page_size)
+    if messages is None:
+        return None
+
+    def lines() -> Iterator[str]:
+        batch: List[str] = []
+        for message in messages:
+            batch.append(format_message_line(message))
+            if len(batch) >= page_size:
+                yield "".join(batch)
+                batch = []
+        if batch:
+            yield "".join(batch)
+
+    return lines()
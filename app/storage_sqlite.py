@@ -0,0 +1,273 @@
+import json
+import logging
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from app.storage import StorageBackend, _history_digest, split_conversation
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    username      TEXT PRIMARY KEY,
+    password_hash TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS conversations (
+    id            INTEGER PRIMARY KEY AUTOINCREMENT,
+    username      TEXT    NOT NULL,
+    name          TEXT    NOT NULL,
+    position      INTEGER NOT NULL,
+    fields        TEXT    NOT NULL DEFAULT '{}',
+    message_count INTEGER NOT NULL DEFAULT 0,
+    digest        TEXT,
+    UNIQUE (username, name)
+);
+CREATE INDEX IF NOT EXISTS idx_conversations_user ON conversations (username, position);
+
+CREATE TABLE IF NOT EXISTS messages (
+    conversation_id INTEGER NOT NULL REFERENCES conversations (id) ON DELETE CASCADE,
+    seq             INTEGER NOT NULL,
+    body            TEXT    NOT NULL,
+    PRIMARY KEY (conversation_id, seq)
+) WITHOUT ROWID;
+"""
+
+
+class SQLiteStorageBackend(StorageBackend):
+    """Пользователи и диалоги в одной базе SQLite (режим WAL).
+
+    - `conversations` — диалог пользователя: порядок, поля (`meta` и т. п.),
+      число сообщений и цепочка хэшей всей истории (`_history_digest`);
+    - `messages` — по строке на сообщение, ключ `(conversation_id, seq)`,
+      поэтому страница сообщений читается по индексу без разбора всего диалога.
+
+    Сохранение выполняется одной транзакцией `BEGIN IMMEDIATE`: конкурентные
+    записи (UI и API, в том числе из разных процессов) сериализуются самой
+    SQLite, а читатели в режиме WAL не блокируются. Как и файловое хранилище,
+    дописывает только новые сообщения, если история лишь дополнилась.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: Path, busy_timeout_seconds: float = 30.0):
+        self.path = path
+        self.busy_timeout_seconds = busy_timeout_seconds
+        self._local = threading.local()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = self._connection()
+        conn.executescript(SCHEMA)
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(conversations)")}
+        if "digest" not in columns:
+            # База прежней версии хранила только хэш последнего сообщения; такие диалоги перепишутся при сохранении
+            conn.execute("ALTER TABLE conversations ADD COLUMN digest TEXT")
+
+    # --- служебное ---
+
+    def _connection(self) -> sqlite3.Connection:
+        """Соединение на поток: `sqlite3.Connection` нельзя делить между потоками."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout_seconds, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _insert_messages(self, conn: sqlite3.Connection, conversation_id: int, start: int, messages: List[Any]) -> None:
+        conn.executemany(
+            "INSERT INTO messages (conversation_id, seq, body) VALUES (?, ?, ?)",
+            ((conversation_id, start + i, json.dumps(m, ensure_ascii=False)) for i, m in enumerate(messages)),
+        )
+
+    # --- пользователи ---
+
+    def load_users(self) -> Dict[str, str]:
+        rows = self._connection().execute("SELECT username, password_hash FROM users ORDER BY rowid")
+        return {username: password_hash for username, password_hash in rows}
+
+    def save_users(self, users: Dict[str, str]) -> None:
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM users")
+            conn.executemany("INSERT INTO users (username, password_hash) VALUES (?, ?)", users.items())
+
+    def add_user(self, username: str, password_hash: str) -> bool:
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO users (username, password_hash) VALUES (?, ?)", (username, password_hash)
+            )
+            return cursor.rowcount == 1
+
+    def count_users(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+    def users_version(self) -> Any:
+        # Пользователи только добавляются, а save_users вставляет строки заново — rowid растёт при любой записи
+        return tuple(self._connection().execute("SELECT COUNT(*), MAX(rowid) FROM users").fetchone())
+
+    # --- диалоги ---
+
+    def load_conversations(self, username: str) -> Optional[Dict[str, Any]]:
+        conn = self._connection()
+        # Один снимок базы на всё чтение — иначе параллельное сохранение может попасть между запросами
+        conn.execute("BEGIN")
+        try:
+            dialogs = conn.execute(
+                "SELECT id, name, fields FROM conversations WHERE username = ? ORDER BY position", (username,)
+            ).fetchall()
+            if not dialogs:
+                return None
+
+            messages: Dict[int, List[Any]] = {dialog_id: [] for dialog_id, _, _ in dialogs}
+            rows = conn.execute(
+                "SELECT m.conversation_id, m.body FROM messages m "
+                "JOIN conversations c ON c.id = m.conversation_id "
+                "WHERE c.username = ? ORDER BY m.conversation_id, m.seq",
+                (username,),
+            )
+            for dialog_id, body in rows:
+                messages[dialog_id].append(json.loads(body))
+        finally:
+            conn.execute("COMMIT")
+
+        result: Dict[str, Any] = {}
+        for dialog_id, name, fields in dialogs:
+            conversation = json.loads(fields)
+            conversation["messages"] = messages[dialog_id]
+            result[name] = conversation
+        return result
+
+    def _save_dialog(
+        self,
+        conn: sqlite3.Connection,
+        username: str,
+        name: str,
+        position: int,
+        conversation: Any,
+        existing: Optional[Tuple[int, int, Optional[str]]],
+    ) -> None:
+        """Синхронизирует один диалог; `existing` — его `(id, message_count, digest)` или `None`."""
+        messages, fields = split_conversation(conversation)
+        count = len(messages)
+        fields_json = json.dumps(fields, ensure_ascii=False)
+
+        if existing is None:
+            dialog_id = conn.execute(
+                "INSERT INTO conversations (username, name, position, fields, message_count, digest) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (username, name, position, fields_json, count, _history_digest(messages)),
+            ).lastrowid
+            self._insert_messages(conn, dialog_id, 0, messages)
+            return
+
+        dialog_id, old_count, old_digest = existing
+        prefix_digest = _history_digest(messages[:old_count]) if count >= old_count else None
+        if prefix_digest is not None and prefix_digest == old_digest:
+            # Обычный случай: история только дополнилась
+            self._insert_messages(conn, dialog_id, old_count, messages[old_count:])
+            digest = _history_digest(messages[old_count:], prefix_digest)
+        else:
+            # Правка, удаление или диалог без цепочки хэшей — переписываем сообщения целиком
+            conn.execute("DELETE FROM messages WHERE conversation_id = ?", (dialog_id,))
+            self._insert_messages(conn, dialog_id, 0, messages)
+            digest = _history_digest(messages)
+
+        conn.execute(
+            "UPDATE conversations SET position = ?, fields = ?, message_count = ?, digest = ? WHERE id = ?",
+            (position, fields_json, count, digest, dialog_id),
+        )
+
+    def save_conversations(self, username: str, data: Dict[str, Any]) -> None:
+        with self._transaction() as conn:
+            existing = {
+                name: (dialog_id, count, digest)
+                for dialog_id, name, count, digest in conn.execute(
+                    "SELECT id, name, message_count, digest FROM conversations WHERE username = ?", (username,)
+                )
+            }
+
+            removed = [dialog_id for name, (dialog_id, _, _) in existing.items() if name not in data]
+            if removed:
+                conn.executemany("DELETE FROM conversations WHERE id = ?", ((dialog_id,) for dialog_id in removed))
+
+            for position, (name, conversation) in enumerate(data.items()):
+                self._save_dialog(conn, username, name, position, conversation, existing.get(name))
+
+    def save_conversation(self, username: str, name: str, conversation: Any) -> None:
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT id, message_count, digest, position FROM conversations WHERE username = ? AND name = ?",
+                (username, name),
+            ).fetchone()
+            if row is None:
+                (position,) = conn.execute(
+                    "SELECT COALESCE(MAX(position), -1) + 1 FROM conversations WHERE username = ?", (username,)
+                ).fetchone()
+                self._save_dialog(conn, username, name, position, conversation, None)
+            else:
+                self._save_dialog(conn, username, name, row[3], conversation, row[:3])
+
+    def delete_conversation(self, username: str, name: str) -> bool:
+        with self._transaction() as conn:
+            cursor = conn.execute("DELETE FROM conversations WHERE username = ? AND name = ?", (username, name))
+            return cursor.rowcount > 0
+
+    def load_messages(self, username: str, name: str, offset: int, limit: int) -> Optional[Tuple[List[Any], int]]:
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT id, message_count FROM conversations WHERE username = ? AND name = ?", (username, name)
+        ).fetchone()
+        if row is None:
+            return None
+        dialog_id, total = row
+        rows = conn.execute(
+            "SELECT body FROM messages WHERE conversation_id = ? AND seq >= ? ORDER BY seq LIMIT ?",
+            (dialog_id, offset, limit),
+        )
+        return [json.loads(body) for body, in rows], total
+
+    def load_recent_messages(self, username: str, name: str, limit: int) -> Optional[List[Any]]:
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT id FROM conversations WHERE username = ? AND name = ?", (username, name)
+        ).fetchone()
+        if row is None:
+            return None
+        rows = conn.execute(
+            "SELECT body FROM (SELECT seq, body FROM messages WHERE conversation_id = ? ORDER BY seq DESC LIMIT ?) "
+            "ORDER BY seq",
+            (row[0], limit),
+        )
+        return [json.loads(body) for body, in rows]
+
+    def append_messages(self, username: str, name: str, messages: List[Any]) -> bool:
+        if not messages:
+            return self.load_messages(username, name, 0, 0) is not None
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT id, message_count, digest FROM conversations WHERE username = ? AND name = ?", (username, name)
+            ).fetchone()
+            if row is None:
+                return False
+            dialog_id, count, digest = row
+            self._insert_messages(conn, dialog_id, count, messages)
+            conn.execute(
+                "UPDATE conversations SET message_count = ?, digest = ? WHERE id = ?",
+                (count + len(messages), _history_digest(messages, digest) if digest is not None else None, dialog_id),
+            )
+            return True
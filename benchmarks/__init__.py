@@ -0,0 +1 @@
+# Benchmarks: нагрузочный тест API и микробенчмарки (работают офлайн)
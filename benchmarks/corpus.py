@@ -0,0 +1,70 @@
+# benchmarks/corpus.py
+"""Корпус запросов для нагрузочного теста: JSONL, одна строка — тело запроса к `/*/chat`.
+
+Генерация детерминирована (`--seed`): один и тот же корпус на любой машине, поэтому
+результаты разных коммитов сравнимы. Свой корпус — тот же формат:
+`{"prompt": ..., "history": [{"role": ..., "text": ...}], "max_tokens": ..., "temperature": ...}`.
+
+Запуск: `python -m benchmarks.corpus --count 200 --out data/bench/corpus.jsonl`
+"""
+import argparse
+import json
+import random
+from typing import Dict, Iterator, List
+
+SAMPLE_TEXTS: List[str] = [
+    "Привет, как дела? Расскажи о погоде в Москве.",
+    "Объясни разницу между процессом и потоком в операционной системе.",
+    "Напиши функцию на Python, которая переворачивает строку.",
+    "Какие есть способы ускорить инференс языковой модели на CPU?",
+    "Сравни SQLite и PostgreSQL для небольшого веб-приложения.",
+    "Что такое KV-кэш в трансформерах и зачем он нужен?",
+    "Hello world, this is a test of tokenization.",
+    "Summarize the main ideas of the previous answer in two sentences.",
+    "Почему асинхронный код не ускоряет вычисления, ограниченные процессором?",
+    "Дай три совета по отладке утечек памяти в долгоживущем сервисе.",
+]
+
+
+def generate_requests(count: int, seed: int = 42, max_history: int = 12, max_tokens: int = 32) -> Iterator[Dict]:
+    """Запросы разной длины: от одиночного вопроса до диалога из `max_history` сообщений."""
+    rng = random.Random(seed)
+    for _ in range(count):
+        history_len = rng.choice([0, 0, 2, 4, max_history])
+        history = []
+        for i in range(history_len):
+            # Ответы ассистента длиннее вопросов — как в реальных диалогах
+            repeats = 1 if i % 2 == 0 else rng.randint(2, 6)
+            history.append({
+                "role": "user" if i % 2 == 0 else "assistant",
+                "text": " ".join(rng.choice(SAMPLE_TEXTS) for _ in range(repeats)),
+            })
+        yield {
+            "prompt": rng.choice(SAMPLE_TEXTS),
+            "history": history,
+            "max_tokens": max_tokens,
+            "temperature": 0.0,
+        }
+
+
+def load_corpus(path: str) -> List[Dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Генерация корпуса запросов для benchmarks.load_test")
+    parser.add_argument("--count", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--max-tokens", type=int, default=32)
+    parser.add_argument("--out", required=True)
+    args = parser.parse_args()
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        for request in generate_requests(args.count, args.seed, max_tokens=args.max_tokens):
+            f.write(json.dumps(request, ensure_ascii=False) + "\n")
+    print(f"{args.count} запросов записано в {args.out}")
+
+
+if __name__ == "__main__":
+    main()
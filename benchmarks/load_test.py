@@ -0,0 +1,284 @@
+# benchmarks/load_test.py
+"""Нагрузочный тест чата: прогон корпуса запросов через `/ollama/chat`, `/qwen3/chat` и `/openai/chat`.
+
+По умолчанию всё поднимается локально и офлайн: заглушка Ollama и
+OpenAI-совместимого сервера (`benchmarks.stub_ollama`), крошечная Qwen3 со случайными весами
+(`benchmarks.tiny_model`) и само приложение в отдельном процессе с данными во
+временной папке. Для каждого движка и уровня конкурентности печатается p50/p95/p99
+задержки, пропускная способность и — в потоковом режиме — время до первого
+фрагмента (TTFT).
+
+Примеры:
+    python -m benchmarks.load_test
+    python -m benchmarks.load_test --engines qwen3 --concurrency 1 4 8 --requests 100 --stream
+    python -m benchmarks.load_test --base-url http://localhost:8000 --username bench --password bench
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+import httpx
+
+from benchmarks.corpus import generate_requests, load_corpus
+from benchmarks.tiny_model import build_tiny_qwen3
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+@dataclass
+class Sample:
+    latency: float
+    ttft: Optional[float]
+    ok: bool
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Перцентиль с линейной интерполяцией; `None` для пустого списка."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_ready(url: str, process: subprocess.Popen, log_path: Path, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Процесс завершился при старте, лог: {log_path}\n{log_path.read_text()[-2000:]}")
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} не ответил за {timeout} с, лог: {log_path}")
+
+
+def _spawn(args: List[str], cwd: Path, env: Dict[str, str], log_path: Path) -> subprocess.Popen:
+    log = open(log_path, "w")
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", *args, "--host", "127.0.0.1", "--log-level", "warning"],
+        cwd=cwd,
+        env={**os.environ, "PYTHONPATH": str(REPO_ROOT), **env},
+        stdout=log,
+        stderr=subprocess.STDOUT,
+    )
+
+
+@contextmanager
+def local_servers(workdir: Path, model_path: str, response_cache: bool, startup_timeout: float) -> Iterator[str]:
+    """Запускает заглушку Ollama и приложение; возвращает базовый URL приложения."""
+    stub_port, app_port = _free_port(), _free_port()
+    processes: List[subprocess.Popen] = []
+    try:
+        stub_log = workdir / "stub_ollama.log"
+        processes.append(_spawn(["benchmarks.stub_ollama:app", "--port", str(stub_port)], REPO_ROOT, {}, stub_log))
+        _wait_ready(f"http://127.0.0.1:{stub_port}/api/tags", processes[-1], stub_log, startup_timeout)
+
+        app_log = workdir / "app.log"
+        # Рабочая папка — временная: data/ (пользователи, диалоги) не смешивается с настоящими
+        processes.append(_spawn(["app.main:app", "--port", str(app_port)], workdir, {
+            "OLLAMA_URL": f"http://127.0.0.1:{stub_port}",
+            "OPENAI_ENABLED": "true",
+            "OPENAI_URL": f"http://127.0.0.1:{stub_port}/v1",
+            "MODEL_NAME": model_path,
+            "LAZY_LOAD": "false",
+            "STARTUP_BENCHMARK_TOKENS": "0",
+            "RESPONSE_CACHE_ENABLED": "true" if response_cache else "false",
+            "SESSION_SECRET": "benchmark",
+            # Все запросы идут от одного пользователя — лимит на пользователя не должен их отсекать
+            "ADMISSION_PER_USER_LIMIT": "100000",
+        }, app_log))
+        _wait_ready(f"http://127.0.0.1:{app_port}/health", processes[-1], app_log, startup_timeout)
+        yield f"http://127.0.0.1:{app_port}"
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+async def _login(client: httpx.AsyncClient, username: str, password: str) -> None:
+    credentials = {"username": username, "password": password}
+    await client.post("/register", data=credentials)  # пользователь может уже существовать
+    response = await client.post("/login", data=credentials)
+    response.raise_for_status()
+
+
+async def _send(client: httpx.AsyncClient, path: str, body: Dict, stream: bool) -> Sample:
+    started = time.perf_counter()
+    ttft = None
+    try:
+        if not stream:
+            response = await client.post(path, json=body)
+            return Sample(time.perf_counter() - started, None, response.status_code == 200)
+
+        ok = False
+        async with client.stream("POST", f"{path}/stream", json=body) as response:
+            if response.status_code != 200:
+                return Sample(time.perf_counter() - started, None, False)
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if ttft is None and chunk.get("delta"):
+                    ttft = time.perf_counter() - started
+                if chunk.get("error"):
+                    break
+                if chunk.get("done"):
+                    ok = True
+                    break
+        return Sample(time.perf_counter() - started, ttft, ok)
+    except httpx.HTTPError:
+        return Sample(time.perf_counter() - started, ttft, False)
+
+
+async def run_scenario(
+    client: httpx.AsyncClient,
+    engine: str,
+    corpus: List[Dict],
+    concurrency: int,
+    total: int,
+    stream: bool,
+    warmup: int,
+) -> Dict:
+    """`total` запросов из корпуса по кругу, не больше `concurrency` одновременно."""
+    path = f"/{engine}/chat"
+    for i in range(warmup):
+        await _send(client, path, corpus[i % len(corpus)], stream)
+
+    samples: List[Sample] = []
+    next_index = 0
+
+    async def worker() -> None:
+        nonlocal next_index
+        while next_index < total:
+            body = corpus[next_index % len(corpus)]
+            next_index += 1
+            samples.append(await _send(client, path, body, stream))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - started
+
+    latencies = [s.latency * 1000 for s in samples if s.ok]
+    ttfts = [s.ttft * 1000 for s in samples if s.ok and s.ttft is not None]
+
+    def rounded(value: Optional[float]) -> Optional[float]:
+        return round(value, 1) if value is not None else None
+
+    return {
+        "engine": engine,
+        "mode": "stream" if stream else "chat",
+        "concurrency": concurrency,
+        "requests": len(samples),
+        "errors": sum(1 for s in samples if not s.ok),
+        "throughput_rps": round(len(latencies) / wall, 2) if wall > 0 else 0.0,
+        "latency_ms": {f"p{q}": rounded(percentile(latencies, q)) for q in (50, 95, 99)},
+        "ttft_ms": {f"p{q}": rounded(percentile(ttfts, q)) for q in (50, 95, 99)} if stream else None,
+    }
+
+
+def print_report(results: List[Dict]) -> None:
+    header = f"{'engine':<8} {'mode':<7} {'conc':>4} {'n':>5} {'err':>4} {'rps':>8} " \
+             f"{'p50':>8} {'p95':>8} {'p99':>8} {'ttft50':>8} {'ttft95':>8} {'ttft99':>8}"
+    print(header)
+    print("-" * len(header))
+
+    def fmt(value: Optional[float]) -> str:
+        return f"{value:>8.1f}" if value is not None else f"{'-':>8}"
+
+    for r in results:
+        ttft = r["ttft_ms"] or {}
+        print(
+            f"{r['engine']:<8} {r['mode']:<7} {r['concurrency']:>4} {r['requests']:>5} {r['errors']:>4} "
+            f"{r['throughput_rps']:>8.2f} "
+            + " ".join(fmt(r["latency_ms"][k]) for k in ("p50", "p95", "p99")) + " "
+            + " ".join(fmt(ttft.get(k)) for k in ("p50", "p95", "p99"))
+        )
+    print("Задержки в миллисекундах, rps — успешных запросов в секунду")
+
+
+async def run_all(base_url: str, args: argparse.Namespace, corpus: List[Dict]) -> List[Dict]:
+    limits = httpx.Limits(max_connections=max(args.concurrency) + 4)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=args.timeout) as client:
+        await _login(client, args.username, args.password)
+        results = []
+        for engine in args.engines:
+            for concurrency in args.concurrency:
+                result = await run_scenario(
+                    client, engine, corpus, concurrency, args.requests, args.stream, args.warmup
+                )
+                results.append(result)
+                print(f"готово: {engine} x{concurrency}", file=sys.stderr)
+        return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Нагрузочный тест /ollama/chat, /qwen3/chat и /openai/chat")
+    parser.add_argument("--engines", nargs="+", default=["ollama", "qwen3", "openai"], choices=["ollama", "qwen3", "openai"])
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 4])
+    parser.add_argument("--requests", type=int, default=50, help="запросов на сценарий")
+    parser.add_argument("--warmup", type=int, default=2, help="запросов для прогрева (не учитываются)")
+    parser.add_argument("--stream", action="store_true", help="потоковые эндпоинты, с замером TTFT")
+    parser.add_argument("--corpus", help="JSONL с запросами (по умолчанию — сгенерированный с --seed)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--output", help="записать результаты в JSON")
+    parser.add_argument("--base-url", help="готовый сервер вместо локального запуска")
+    parser.add_argument("--username", default="bench")
+    parser.add_argument("--password", default="bench")
+    parser.add_argument("--model", help="модель Qwen3 для локального сервера (по умолчанию — крошечная случайная)")
+    parser.add_argument("--response-cache", action="store_true", help="не отключать кэш ответов на локальном сервере")
+    parser.add_argument("--startup-timeout", type=float, default=180.0)
+    parser.add_argument("--keep-workdir", action="store_true")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus) if args.corpus else list(generate_requests(200, args.seed))
+
+    if args.base_url:
+        results = asyncio.run(run_all(args.base_url, args, corpus))
+    else:
+        workdir = Path(tempfile.mkdtemp(prefix="llm-bench-"))
+        try:
+            model = args.model or build_tiny_qwen3(str(workdir / "tiny-qwen3"), seed=args.seed)
+            with local_servers(workdir, model, args.response_cache, args.startup_timeout) as base_url:
+                results = asyncio.run(run_all(base_url, args, corpus))
+        finally:
+            if args.keep_workdir:
+                print(f"Рабочая папка: {workdir}", file=sys.stderr)
+            else:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+    print_report(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            settings = {k: v for k, v in vars(args).items() if k != "password"}
+            json.dump({"args": settings, "results": results}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
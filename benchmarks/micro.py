@@ -0,0 +1,143 @@
+# benchmarks/micro.py
+"""Микробенчмарки горячих путей запроса: подсчёт токенов, обрезка истории, сохранение диалогов.
+
+Каждая функция вызывается `--number` раз подряд, замер повторяется `--repeat` раз;
+печатается медиана и минимум времени одного вызова. «Холодный» вариант —
+без кэша числа токенов (новое сообщение), «тёплый» — с кэшем (следующий ход того же диалога).
+
+Запуск: `python -m benchmarks.micro [--repeat 5] [--number 200] [--output micro.json]`
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict
+
+from benchmarks.corpus import SAMPLE_TEXTS
+
+
+def measure(fn: Callable[[], object], number: int, repeat: int) -> Dict[str, float]:
+    """Время одного вызова `fn` в микросекундах: медиана и минимум по повторам."""
+    fn()  # прогрев: ленивые инициализации, загрузка словарей
+    per_call = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        per_call.append((time.perf_counter() - started) / number * 1e6)
+    return {"median_us": round(statistics.median(per_call), 2), "min_us": round(min(per_call), 2)}
+
+
+def _history(messages: int):
+    from llm_engine.entities import ChatMessage
+
+    return [
+        ChatMessage(role="user" if i % 2 == 0 else "assistant", text=f"{i}: " + " ".join(SAMPLE_TEXTS[: 1 + i % 5]))
+        for i in range(messages)
+    ]
+
+
+def bench_count_tokens(number: int, repeat: int) -> Dict[str, Dict[str, float]]:
+    from utils.token_counter import TiktokenCounter, count_tokens
+
+    short, long = SAMPLE_TEXTS[0], " ".join(SAMPLE_TEXTS) * 20
+    cold = TiktokenCounter(cache_size=0)
+    return {
+        "count_tokens[short,warm]": measure(lambda: count_tokens(short), number, repeat),
+        "count_tokens[long,warm]": measure(lambda: count_tokens(long), number, repeat),
+        "count_tokens[short,cold]": measure(lambda: cold.count(short), number, repeat),
+        "count_tokens[long,cold]": measure(lambda: cold.count(long), number, repeat),
+    }
+
+
+def bench_truncate_history(number: int, repeat: int) -> Dict[str, Dict[str, float]]:
+    from llm_engine.prompt import truncate_history
+    from utils.token_counter import TiktokenCounter
+
+    results = {}
+    for size in (20, 200):
+        history = _history(size)
+        warm = TiktokenCounter()
+        cold = TiktokenCounter(cache_size=0)
+        results[f"truncate_history[{size} msgs,warm]"] = measure(
+            lambda: truncate_history(history, "Новый вопрос", 4096, 512, counter=warm), number, repeat
+        )
+        results[f"truncate_history[{size} msgs,cold]"] = measure(
+            lambda: truncate_history(history, "Новый вопрос", 4096, 512, counter=cold), max(1, number // 10), repeat
+        )
+    return results
+
+
+def bench_save_conversations(number: int, repeat: int, workdir: Path) -> Dict[str, Dict[str, float]]:
+    """`save_user_conversations` на обоих хранилищах: дописать ход и переписать весь диалог."""
+    from app.storage import FileStorageBackend
+    from app.storage_sqlite import SQLiteStorageBackend
+
+    backends = {
+        "json": FileStorageBackend(workdir / "users.json", workdir / "conversations"),
+        "sqlite": SQLiteStorageBackend(workdir / "chat.db"),
+    }
+    base = [{"role": m.role, "text": m.text} for m in _history(200)]
+    meta = {"model_choice": "ollama", "temperature": 0.0, "max_tokens": 512}
+
+    results = {}
+    for name, backend in backends.items():
+        username = f"bench-{name}"
+        messages = list(base)
+        backend.save_conversations(username, {"Диалог 1": {"messages": list(messages), "meta": meta}})
+
+        def append_turn() -> None:
+            messages.append({"role": "user", "text": "Ещё вопрос"})
+            messages.append({"role": "assistant", "text": "Ещё ответ"})
+            backend.save_conversations(username, {"Диалог 1": {"messages": list(messages), "meta": meta}})
+
+        def rewrite() -> None:
+            # Каждый вызов меняет последнее сообщение при том же их числе — дописыванием не обойтись,
+            # хранилище каждый раз переписывает все 200 сообщений
+            edited = base[:-1] + [{"role": "assistant", "text": f"Правка {time.perf_counter()}"}]
+            backend.save_conversations(username, {"Диалог 1": {"messages": edited, "meta": meta}})
+
+        results[f"save_user_conversations[{name},append turn]"] = measure(append_turn, number, repeat)
+        results[f"save_user_conversations[{name},rewrite 200 msgs]"] = measure(rewrite, max(1, number // 10), repeat)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Микробенчмарки: count_tokens, truncate_history, save_user_conversations")
+    parser.add_argument("--number", type=int, default=200, help="вызовов в одном замере")
+    parser.add_argument("--repeat", type=int, default=5, help="число замеров")
+    parser.add_argument("--only", nargs="+", choices=["tokens", "truncate", "storage"])
+    parser.add_argument("--output", help="записать результаты в JSON")
+    args = parser.parse_args()
+    selected = set(args.only or ["tokens", "truncate", "storage"])
+
+    results: Dict[str, Dict[str, float]] = {}
+    with tempfile.TemporaryDirectory(prefix="llm-micro-") as workdir:
+        # app.storage создаёт data/ относительно рабочей папки при импорте — не трогаем настоящие данные
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        try:
+            if "tokens" in selected:
+                results.update(bench_count_tokens(args.number, args.repeat))
+            if "truncate" in selected:
+                results.update(bench_truncate_history(args.number, args.repeat))
+            if "storage" in selected:
+                results.update(bench_save_conversations(args.number, args.repeat, Path(workdir)))
+        finally:
+            os.chdir(cwd)
+
+    width = max(len(name) for name in results)
+    print(f"{'benchmark':<{width}} {'median, мкс':>12} {'min, мкс':>12}")
+    for name, timing in results.items():
+        print(f"{name:<{width}} {timing['median_us']:>12.2f} {timing['min_us']:>12.2f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
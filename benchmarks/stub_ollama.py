@@ -0,0 +1,120 @@
+# benchmarks/stub_ollama.py
+"""Заглушка Ollama для бенчмарков: `/api/tags` и `/api/chat` с детерминированной задержкой.
+
+Те же ответы отдаются по протоколу OpenAI (`/v1/models`, `/v1/chat/completions`,
+стрим — Server-Sent Events) — для движка OpenAI-совместимого сервера.
+
+Задержка моделируется как prefill (`STUB_PREFILL_MS`) плюс `STUB_TOKEN_MS` на каждый
+токен ответа; длина ответа — `min(max_tokens, STUB_REPLY_TOKENS)` слов. Так замеры
+отражают накладные расходы API (пул соединений, сериализация, хранилище), а не
+скорость настоящей модели.
+
+Запуск: `python -m uvicorn benchmarks.stub_ollama:app --port 11434`
+"""
+import asyncio
+import json
+import os
+import time
+
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+
+PREFILL_MS = float(os.getenv("STUB_PREFILL_MS", "20"))
+TOKEN_MS = float(os.getenv("STUB_TOKEN_MS", "5"))
+REPLY_TOKENS = int(os.getenv("STUB_REPLY_TOKENS", "64"))
+MODELS = os.getenv("STUB_MODELS", "phi3:latest,llama3.1:8b").split(",")
+
+WORDS = ["Это", " тестовый", " ответ", " заглушки", " Ollama", " для", " бенчмарка", "."]
+
+app = FastAPI(title="Ollama stub")
+
+
+def _reply_tokens(body: dict) -> int:
+    num_predict = body.get("options", {}).get("num_predict") or body.get("max_tokens") or REPLY_TOKENS
+    return max(1, min(int(num_predict), REPLY_TOKENS))
+
+
+def _prompt_tokens(body: dict) -> int:
+    # Грубая оценка: ~4 символа на токен
+    return sum(len(m.get("content", "")) for m in body.get("messages", [])) // 4 + 1
+
+
+def _final_chunk(body: dict, tokens: int, started: float, prefill_done: float) -> dict:
+    now = time.perf_counter()
+    return {
+        "model": body.get("model"),
+        "message": {"role": "assistant", "content": ""},
+        "done": True,
+        "prompt_eval_count": _prompt_tokens(body),
+        "prompt_eval_duration": int((prefill_done - started) * 1e9),
+        "eval_count": tokens,
+        "eval_duration": int((now - prefill_done) * 1e9),
+        "total_duration": int((now - started) * 1e9),
+    }
+
+
+@app.get("/api/tags")
+async def tags():
+    return {"models": [{"name": name} for name in MODELS]}
+
+
+@app.post("/api/chat")
+async def chat(body: dict):
+    tokens = _reply_tokens(body)
+    started = time.perf_counter()
+    await asyncio.sleep(PREFILL_MS / 1000)
+    prefill_done = time.perf_counter()
+
+    if not body.get("stream", True):
+        await asyncio.sleep(tokens * TOKEN_MS / 1000)
+        final = _final_chunk(body, tokens, started, prefill_done)
+        final["message"]["content"] = "".join(WORDS[i % len(WORDS)] for i in range(tokens))
+        return final
+
+    async def generate():
+        for i in range(tokens):
+            await asyncio.sleep(TOKEN_MS / 1000)
+            chunk = {"model": body.get("model"), "message": {"role": "assistant", "content": WORDS[i % len(WORDS)]}, "done": False}
+            yield json.dumps(chunk, ensure_ascii=False) + "\n"
+        yield json.dumps(_final_chunk(body, tokens, started, prefill_done)) + "\n"
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
+@app.get("/v1/models")
+async def openai_models():
+    return {"object": "list", "data": [{"id": name, "object": "model"} for name in MODELS]}
+
+
+@app.post("/v1/chat/completions")
+async def openai_chat(body: dict):
+    tokens = _reply_tokens(body)
+    usage = {"prompt_tokens": _prompt_tokens(body), "completion_tokens": tokens,
+             "total_tokens": _prompt_tokens(body) + tokens}
+    await asyncio.sleep(PREFILL_MS / 1000)
+
+    if not body.get("stream", False):
+        await asyncio.sleep(tokens * TOKEN_MS / 1000)
+        content = "".join(WORDS[i % len(WORDS)] for i in range(tokens))
+        return {
+            "object": "chat.completion",
+            "model": body.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "length"}],
+            "usage": usage,
+        }
+
+    def event(payload: dict) -> str:
+        return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+    async def generate():
+        for i in range(tokens):
+            await asyncio.sleep(TOKEN_MS / 1000)
+            yield event({"object": "chat.completion.chunk", "model": body.get("model"),
+                         "choices": [{"index": 0, "delta": {"content": WORDS[i % len(WORDS)]}, "finish_reason": None}]})
+        yield event({"object": "chat.completion.chunk", "model": body.get("model"),
+                     "choices": [{"index": 0, "delta": {}, "finish_reason": "length"}]})
+        if (body.get("stream_options") or {}).get("include_usage"):
+            yield event({"object": "chat.completion.chunk", "model": body.get("model"), "choices": [], "usage": usage})
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(generate(), media_type="text/event-stream")
@@ -0,0 +1,80 @@
+# benchmarks/tiny_model.py
+"""Крошечная Qwen3 со случайными весами и BPE-токенизатором — для бенчмарков без скачивания моделей.
+
+Архитектура та же (`Qwen3ForCausalLM`, chat-шаблон с `<|im_start|>`/`<|im_end|>`),
+поэтому через `Qwen3Client` проходит весь путь запроса: обрезка истории, chat-шаблон,
+батчинг, KV-кэш. Веса случайные — текст ответа бессмысленный, важна только скорость.
+
+Запуск: `python -m benchmarks.tiny_model data/bench/tiny-qwen3`
+"""
+import argparse
+from pathlib import Path
+
+from benchmarks.corpus import SAMPLE_TEXTS
+
+CHAT_TEMPLATE = (
+    "{% for m in messages %}<|im_start|>{{ m['role'] }}\n{{ m['content'] }}<|im_end|>\n{% endfor %}"
+    "{% if add_generation_prompt %}<|im_start|>assistant\n{% endif %}"
+)
+
+
+def build_tiny_qwen3(
+    output_dir: str,
+    hidden_size: int = 64,
+    num_layers: int = 2,
+    vocab_size: int = 1000,
+    seed: int = 0,
+) -> str:
+    """Создаёт модель в `output_dir` (если её там ещё нет) и возвращает путь."""
+    path = Path(output_dir)
+    if (path / "config.json").exists():
+        return str(path)
+
+    import torch
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers, trainers
+    from transformers import PreTrainedTokenizerFast, Qwen3Config, Qwen3ForCausalLM
+
+    special_tokens = ["<|endoftext|>", "<|im_start|>", "<|im_end|>"]
+    bpe = Tokenizer(models.BPE(unk_token=None))
+    bpe.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    bpe.decoder = decoders.ByteLevel()
+    trainer = trainers.BpeTrainer(
+        vocab_size=vocab_size,
+        special_tokens=special_tokens,
+        initial_alphabet=pre_tokenizers.ByteLevel.alphabet(),
+    )
+    bpe.train_from_iterator(SAMPLE_TEXTS * 20, trainer)
+    bpe.add_tokens(["<think>", "</think>"])
+
+    tokenizer = PreTrainedTokenizerFast(tokenizer_object=bpe, eos_token="<|im_end|>", pad_token="<|endoftext|>")
+    tokenizer.chat_template = CHAT_TEMPLATE
+    tokenizer.save_pretrained(path)
+
+    config = Qwen3Config(
+        vocab_size=len(tokenizer),
+        hidden_size=hidden_size,
+        intermediate_size=hidden_size * 2,
+        num_hidden_layers=num_layers,
+        num_attention_heads=4,
+        num_key_value_heads=2,
+        head_dim=hidden_size // 4,
+        max_position_embeddings=32768,
+        eos_token_id=tokenizer.eos_token_id,
+        pad_token_id=tokenizer.pad_token_id,
+    )
+    torch.manual_seed(seed)
+    Qwen3ForCausalLM(config).save_pretrained(path)
+    return str(path)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("output_dir")
+    parser.add_argument("--hidden-size", type=int, default=64)
+    parser.add_argument("--layers", type=int, default=2)
+    args = parser.parse_args()
+    print(build_tiny_qwen3(args.output_dir, hidden_size=args.hidden_size, num_layers=args.layers))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,48 +1,53 @@
 # chat_ui.py
+import os
+
 import streamlit as st
 import requests
 import json
-import os
 from datetime import datetime
 
-# === Настройка путей ===
-DATA_DIR = "data"
-CONV_DIR = os.path.join(DATA_DIR, "conversations")
-os.makedirs(CONV_DIR, exist_ok=True)
+from app.conversation_sync import ApiConversations, ConversationSync, LocalConversations, dialog_fingerprint
 
 FASTAPI_URL = "http://localhost:8000"
+# local — диалоги пишутся в хранилище напрямую, api — через /api/conversations бэкенда
+CONVERSATION_SYNC = os.getenv("CONVERSATION_SYNC", "local").lower()
+# Не чаще одной записи за столько секунд, пока меняются только настройки диалога
+CONVERSATION_SAVE_INTERVAL = float(os.getenv("CONVERSATION_SAVE_INTERVAL", "2"))
+# Сообщений на странице истории; более ранние подгружаются кнопкой
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "50"))
 
 
-def get_conv_file_path(username: str) -> str:
-    """Возвращает путь к файлу диалогов пользователя."""
-    return os.path.join(CONV_DIR, f"{username}.json")
-
-
-def load_conversations(username: str) -> dict:
-    """Загружает диалоги пользователя из файла."""
-    conv_file = get_conv_file_path(username)
-    if os.path.exists(conv_file):
-        try:
-            with open(conv_file, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                migrated = {}
-                default_meta = {
-                    "model_choice": "ollama",
-                    "ollama_variant": "phi3",
-                    "temperature": 0.0,
-                    "max_tokens": 512
+def create_conversation_sync(username: str, session_cookie: str) -> ConversationSync:
+    if CONVERSATION_SYNC == "api":
+        target = ApiConversations(FASTAPI_URL, {"session": session_cookie})
+    else:
+        target = LocalConversations(username)
+    return ConversationSync(target, min_interval_seconds=CONVERSATION_SAVE_INTERVAL)
+
+
+def load_conversations(sync: ConversationSync) -> dict:
+    """Загружает диалоги пользователя из хранилища."""
+    try:
+        data = sync.load() or {}
+        migrated = {}
+        default_meta = {
+            "model_choice": "ollama",
+            "ollama_variant": "phi3",
+            "temperature": 0.0,
+            "max_tokens": 512
+        }
+        for name, val in data.items():
+            if isinstance(val, dict) and "messages" in val:
+                migrated[name] = val
+            else:
+                migrated[name] = {
+                    "messages": val if isinstance(val, list) else [],
+                    "meta": default_meta
                 }
-                for name, val in data.items():
-                    if isinstance(val, dict) and "messages" in val:
-                        migrated[name] = val
-                    else:
-                        migrated[name] = {
-                            "messages": val if isinstance(val, list) else [],
-                            "meta": default_meta
-                        }
-                return migrated
-        except Exception:
-            pass
+        if migrated:
+            return migrated
+    except Exception:
+        pass
     return {
         "Диалог 1": {
             "messages": [],
@@ -56,14 +61,99 @@ def load_conversations(username: str) -> dict:
     }
 
 
-def save_conversations(username: str, data: dict) -> None:
-    """Сохраняет диалоги пользователя в файл."""
-    conv_file = get_conv_file_path(username)
+def load_history_window(name: str):
+    """Последние сообщения диалога для страницы истории: окно растёт кнопкой «более ранние».
+
+    Страницы запрашиваются у хранилища (или API), а не из всего диалога в памяти;
+    результат кэшируется, пока не изменились диалог и размер окна.
+    """
+    window = st.session_state.get("history_windows", {}).get(name, HISTORY_PAGE_SIZE)
+    convo = st.session_state.conversations.get(name, {})
+    key = (name, window, dialog_fingerprint(convo))
+    cached = st.session_state.get("history_page")
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    target = st.session_state.conversation_sync.target
+    page = None
+    try:
+        head = target.load_messages(name, 0, 1)
+        if head is not None:
+            total = head[1]
+            offset = max(0, total - window)
+            messages: list = []
+            # Бэкенд отдаёт не больше 500 сообщений за запрос
+            while offset + len(messages) < total:
+                chunk, total = target.load_messages(name, offset + len(messages), min(500, window - len(messages)))
+                if not chunk:
+                    break
+                messages.extend(chunk)
+            page = (messages, total)
+    except Exception as e:
+        st.error(f"⚠️ Не удалось загрузить сообщения: {e}")
+        return None
+    st.session_state.history_page = (key, page)
+    return page
+
+
+def save_conversations(force: bool = False) -> None:
+    """Сохраняет изменённые диалоги; без изменений диск и бэкенд не трогаются."""
+    st.session_state.conversation_sync.flush(st.session_state.conversations, force=force)
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def fetch_ollama_models(session_cookie: str) -> list:
+    """Список моделей Ollama с бэкенда (кэшируется на минуту); при ошибке — модель по умолчанию."""
+    try:
+        resp = requests.get(f"{FASTAPI_URL}/ollama/models", cookies={"session": session_cookie}, timeout=5)
+        if resp.status_code == 200:
+            models = resp.json().get("models", [])
+            if models:
+                return models
+    except Exception:
+        pass
+    return ["phi3"]
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def fetch_engines() -> list:
+    """Движки, подключённые на бэкенде (по /health, кэшируется на минуту); при ошибке — Ollama и Qwen3."""
     try:
-        with open(conv_file, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        resp = requests.get(f"{FASTAPI_URL}/health", timeout=5)
+        if resp.status_code == 200:
+            engines = resp.json().get("engines")
+            if engines:
+                return engines
     except Exception:
         pass
+    return ["ollama", "qwen3"]
+
+
+def stream_chat_response(endpoint: str, payload: dict, cookies: dict):
+    """Отправляет запрос в потоковый эндпоинт и отдаёт фрагменты ответа по мере генерации.
+
+    Бэкенд отвечает NDJSON-строками вида `{"delta": "..."}`, `{"done": true}` или `{"error": "..."}`.
+    """
+    with requests.post(endpoint, json=payload, cookies=cookies, stream=True, timeout=600) as resp:
+        if resp.status_code in (429, 503):
+            # Контроль допуска: лимит запросов пользователя или перегрузка сервера
+            detail = resp.json().get("detail", "Сервер занят")
+            yield f"⏳ {detail}. Повторите через {resp.headers.get('Retry-After', '?')} с"
+            return
+        if resp.status_code != 200:
+            yield f"❌ Ошибка API: {resp.status_code}"
+            return
+        for line in resp.iter_lines(decode_unicode=True):
+            if not line:
+                continue
+            chunk = json.loads(line)
+            if chunk.get("error"):
+                yield f"❌ Ошибка модели: {chunk['error']}"
+                return
+            if chunk.get("done"):
+                return
+            if chunk.get("delta"):
+                yield chunk["delta"]
 
 
 # === Экран авторизации ===
@@ -96,7 +186,8 @@ if "logged_in" not in st.session_state or not st.session_state.get("logged_in",
                                 st.session_state.logged_in = True
                                 st.session_state.username = username
                                 st.session_state.session_cookie = session_cookie
-                                st.session_state.conversations = load_conversations(username)
+                                st.session_state.conversation_sync = create_conversation_sync(username, session_cookie)
+                                st.session_state.conversations = load_conversations(st.session_state.conversation_sync)
                                 st.session_state.active_convo = list(st.session_state.conversations.keys())[0]
                                 st.rerun()
                             else:
@@ -119,6 +210,7 @@ if "logged_in" not in st.session_state or not st.session_state.get("logged_in",
 
 # === Кнопка выхода (всегда доступна) ===
 if st.sidebar.button("🚪 Выйти"):
+    save_conversations(force=True)
     st.session_state.clear()
     st.rerun()
 
@@ -132,6 +224,7 @@ if page == "О проекте":
     ### 🧠 Гибридный локальный LLM-чат
     - **Ollama**: `phi3` — быстро.
     - **Qwen3**: локальная модель — мощно.
+    - **OpenAI-совместимый сервер**: llama.cpp server, vLLM и т. п. (если подключён на бэкенде).
     - Все данные хранятся локально в `data/conversations/`.
     - Полная изоляция между пользователями.
     """)
@@ -162,8 +255,8 @@ elif page == "Чат":
     meta = convo_entry.get("meta", default_meta)
 
     # === Выбор модели с опцией "не выбрано" ===
-    model_opts = ["unset", "ollama", "qwen3"]
-    model_labels = {"unset": "— Выберите модель —", "ollama": "Ollama", "qwen3": "Qwen3"}
+    model_opts = ["unset"] + fetch_engines()
+    model_labels = {"unset": "— Выберите модель —", "ollama": "Ollama", "qwen3": "Qwen3", "openai": "OpenAI-совместимый"}
     model_choice = st.sidebar.selectbox(
         "Модель:",
         options=model_opts,
@@ -174,13 +267,17 @@ elif page == "Чат":
 
     ollama_variant = None
     if model_choice == "ollama":
-        ollama_opts = ["phi3"]
+        # "auto" — бэкенд сам выберет быструю или большую модель по длине запроса
+        ollama_opts = ["auto"] + fetch_ollama_models(st.session_state.session_cookie)
         ov_default = meta.get("ollama_variant", "phi3")
+        if ov_default not in ollama_opts:
+            ov_default = f"{ov_default}:latest"
         ov_index = ollama_opts.index(ov_default) if ov_default in ollama_opts else 0
         ollama_variant = st.sidebar.selectbox(
             "Ollama модель:",
             ollama_opts,
             index=ov_index,
+            format_func=lambda x: "Авто (по длине запроса)" if x == "auto" else x,
             key=f"ollama_{selected}"
         )
 
@@ -206,7 +303,7 @@ elif page == "Чат":
         "temperature": float(temperature),
         "max_tokens": int(max_tokens_response),
     }
-    save_conversations(st.session_state.username, st.session_state.conversations)
+    save_conversations()
 
     # === Управление диалогами ===
     rename_value = st.sidebar.text_input("Переименовать текущий диалог", value=st.session_state.active_convo)
@@ -222,6 +319,7 @@ elif page == "Чат":
         else:
             st.session_state.conversations[newn] = st.session_state.conversations.pop(old)
             st.session_state.active_convo = newn
+            save_conversations(force=True)
             st.rerun()  # ← перезагрузка для отображения нового имени
 
     if st.sidebar.button("🗑️ Удалить диалог"):
@@ -250,7 +348,7 @@ elif page == "Чат":
         }
         st.session_state.active_convo = new_name
 
-        save_conversations(st.session_state.username, st.session_state.conversations)
+        save_conversations(force=True)
         st.rerun()
 
     new_name = st.sidebar.text_input("Имя нового диалога", "")
@@ -269,9 +367,15 @@ elif page == "Чат":
                 "meta": {"model_choice": "unset", "ollama_variant": None, "temperature": 0.7, "max_tokens": 512}
             }
             st.session_state.active_convo = name
-            save_conversations(st.session_state.username, st.session_state.conversations)
+            save_conversations(force=True)
             st.rerun()
 
+    # Отображение истории
+    convo = st.session_state.conversations[st.session_state.active_convo].get("messages", [])
+    for msg in convo[-30:]:
+        with st.chat_message(msg["role"]):
+            st.write(msg["text"])
+
     # === Отправка запроса ===
     if prompt := st.chat_input("Ваш вопрос..."):
         if model_choice == "unset":
@@ -279,38 +383,35 @@ elif page == "Чат":
         else:
             convo_msgs = st.session_state.conversations[st.session_state.active_convo].setdefault("messages", [])
             convo_msgs.append({"role": "user", "text": prompt})
+            with st.chat_message("user"):
+                st.write(prompt)
 
+            # История берётся бэкендом из хранилища по имени диалога, он же дописывает вопрос и ответ;
+            # локальное сохранение ниже в этом случае ничего не меняет на диске
             payload = {
                 "prompt": prompt,
-                "history": convo_msgs[:-1],
+                "conversation_id": st.session_state.active_convo,
                 "temperature": temperature,
                 "max_tokens": max_tokens_response,
             }
             if model_choice == "ollama":
                 payload["model_name"] = ollama_variant
 
-            endpoint = f"{FASTAPI_URL}/ollama/chat" if model_choice == "ollama" else f"{FASTAPI_URL}/qwen3/chat"
+            endpoint = f"{FASTAPI_URL}/{model_choice}/chat/stream"
 
             cookies = {"session": st.session_state.session_cookie}
 
-            with st.spinner("Генерация ответа..."):
+            # Токены выводятся по мере генерации — без ожидания полного ответа
+            with st.chat_message("assistant"):
                 try:
-                    resp = requests.post(endpoint, json=payload, cookies=cookies, timeout=600)
-                    if resp.status_code == 200:
-                        response = resp.json().get("response", "").strip() or "❌ Пустой ответ от модели"
-                    else:
-                        response = f"❌ Ошибка API: {resp.status_code}"
+                    response = st.write_stream(stream_chat_response(endpoint, payload, cookies))
                 except Exception as e:
                     response = f"❌ Нет связи с бэкендом: {str(e)}"
+                    st.write(response)
+            response = (response if isinstance(response, str) else "").strip() or "❌ Пустой ответ от модели"
 
             convo_msgs.append({"role": "assistant", "text": response})
-            save_conversations(st.session_state.username, st.session_state.conversations)
-
-    # Отображение истории
-    convo = st.session_state.conversations[st.session_state.active_convo].get("messages", [])
-    for msg in convo[-30:]:
-        with st.chat_message(msg["role"]):
-            st.write(msg["text"])
+            save_conversations(force=True)
 
     # Подпись
     if model_choice == "unset":
@@ -318,7 +419,7 @@ elif page == "Чат":
     else:
         extra = f" (variant={ollama_variant})" if ollama_variant else ""
         st.caption(
-            f"Модель: {model_labels[model_choice]}{extra} | Диалог: {st.session_state.active_convo} | Температура: {temperature}")
+            f"Модель: {model_labels.get(model_choice, model_choice)}{extra} | Диалог: {st.session_state.active_convo} | Температура: {temperature}")
 
 elif page == "История диалога":
     st.title("📜 История диалогов")
@@ -329,20 +430,41 @@ elif page == "История диалога":
         default_idx = convo_names.index(
             st.session_state.active_convo) if st.session_state.active_convo in convo_names else 0
         sel = st.selectbox("Выберите диалог для просмотра:", convo_names, index=default_idx)
-        msgs = st.session_state.conversations.get(sel, {}).get("messages", [])
         st.subheader(sel)
+
+        # Сообщения читаются из хранилища постранично — несохранённые изменения сначала сохраняем
+        save_conversations(force=True)
+        page = load_history_window(sel)
+        if page is None:
+            st.warning("Диалог ещё не сохранён")
+            msgs, total = [], 0
+        else:
+            msgs, total = page
         if not msgs:
             st.write("(пустой)")
+        elif total > len(msgs):
+            st.caption(f"Показаны последние {len(msgs)} из {total} сообщений")
+            if st.button(f"⬆️ Загрузить более ранние ({min(HISTORY_PAGE_SIZE, total - len(msgs))})"):
+                windows = st.session_state.setdefault("history_windows", {})
+                windows[sel] = len(msgs) + HISTORY_PAGE_SIZE
+                st.rerun()
         for msg in msgs:
             role_emoji = "👤" if msg["role"] == "user" else "🤖"
             st.markdown(f"**{role_emoji} {msg['role'].title()}:** {msg['text']}")
 
-        history_text = "\n".join(
-            f"[{'Пользователь' if m['role'] == 'user' else 'Ассистент'}]: {m['text']}" for m in msgs
-        )
-        st.download_button(
-            "📥 Скачать диалог в TXT",
-            history_text,
-            f"chat_{sel}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt",
-            "text/plain"
-        )
\ No newline at end of file
+        # Выгрузка собирается только по запросу, из потока бэкенда/хранилища
+        export_key = (sel, total)
+        prepared = st.session_state.get("history_export")
+        if prepared is None or prepared[0] != export_key:
+            if st.button("📄 Подготовить TXT"):
+                with st.spinner("Готовим выгрузку..."):
+                    chunks = st.session_state.conversation_sync.target.export(sel)
+                    st.session_state.history_export = (export_key, "".join(chunks or []))
+                st.rerun()
+        else:
+            st.download_button(
+                "📥 Скачать диалог в TXT",
+                prepared[1],
+                f"chat_{sel}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt",
+                "text/plain"
+            )
@@ -0,0 +1,6 @@
+# Общая часть движков LLM: интерфейс, сущности API, сборка промпта, роутер и lifespan
+from llm_engine.engine import LLMEngine
+from llm_engine.entities import ChatMessage, ChatRequest, ChatResponse, ChatStreamChunk, GenerationStats
+from llm_engine.prompt import SYSTEM_PROMPT, truncate_and_build_messages, truncate_history
+from llm_engine.router import create_engine_router
+from llm_engine.settings import EngineSettings
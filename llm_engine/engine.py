@@ -0,0 +1,129 @@
+from abc import ABC, abstractmethod
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from llm_engine.entities import ChatMessage, ChatRequest, GenerationStats
+from llm_engine.prompt import SYSTEM_PROMPT, truncate_and_build_messages, truncate_history
+from llm_engine.settings import EngineSettings
+from utils.response_cache import ResponseCache, make_cache_key
+from utils.summarizer import HistorySummarizer, create_history_summarizer
+from utils.token_counter import TokenCounter
+
+
+class LLMEngine(ABC):
+    """Движок генерации: общий контракт для роутера, lifespan, метрик и контроля допуска.
+
+    Всё, что не зависит от модели, написано один раз вокруг этого интерфейса:
+    история из хранилища и её краткое содержание, NDJSON-стрим, запись хода в
+    диалог, кэш ответов и метрики запросов (`create_engine_router`), контроль
+    допуска и регистрация в /metrics (`engine_lifespan`). Движок отвечает только за
+    генерацию — `chat`, `chat_stream` и служебный `generate_text`; промпт
+    собирается `_prompt_messages`, ключ кэша ответов — `response_cache_key`.
+
+    Новый движок (llama.cpp, OpenAI-совместимый сервер) — наследник этого класса
+    плюс `create_engine_router(name, factory)`; копировать роутер не нужно.
+    """
+
+    # Имя движка: префикс путей API, ключ в app.state и метка метрик
+    name: str = "engine"
+    settings: EngineSettings
+    response_cache: Optional[ResponseCache] = None
+    summarizer: Optional[HistorySummarizer] = None
+
+    def _create_summarizer(self, counter: Optional[Callable[[], TokenCounter]] = None) -> Optional[HistorySummarizer]:
+        """Суммаризатор истории по настройкам движка; сжимает через `generate_text`."""
+        return create_history_summarizer(
+            self.name, self.settings, self.generate_text, truncate_history, ChatMessage, SYSTEM_PROMPT,
+            counter=counter,
+        )
+
+    @property
+    def queue_depth(self) -> Optional[int]:
+        """Запросы, ожидающие генерации внутри движка; `None`, если очереди нет."""
+        return None
+
+    def cache_stats(self) -> Dict[str, Dict[str, object]]:
+        """Счётчики кэшей движка (для /metrics)."""
+        return {"response": self.response_cache.stats()} if self.response_cache is not None else {}
+
+    def health(self) -> Dict[str, object]:
+        """Состояние движка для /health сверх общих счётчиков (готовность модели и т. п.)."""
+        return {}
+
+    async def start(self) -> None:
+        """Подготовка при старте приложения; исключение останавливает запуск."""
+        if self.summarizer is not None:
+            self.summarizer.start()
+
+    async def aclose(self) -> None:
+        """Освобождает ресурсы при остановке приложения."""
+        if self.summarizer is not None:
+            await self.summarizer.aclose()
+        if self.response_cache is not None:
+            self.response_cache.close()
+
+    def _prompt_messages(self, prompt: str, history: List[ChatMessage], max_tokens: int) -> List[Dict[str, str]]:
+        """Сообщения для модели: системный промпт, обрезанная по контексту история и запрос."""
+        messages, _ = truncate_and_build_messages(
+            prompt=prompt,
+            history=history,
+            max_total_tokens=self.settings.max_context_length,
+            reserved_for_response=max_tokens,
+        )
+        return messages
+
+    def _cache_model(self, **options: Any) -> str:
+        """Модель в ключе кэша ответов — ответы разных моделей не смешиваются."""
+        return self.name
+
+    async def response_cache_key(
+        self,
+        prompt: str,
+        history: List[ChatMessage],
+        temperature: float,
+        max_tokens: int,
+        **options: Any,
+    ) -> Optional[str]:
+        """Ключ кэша ответов; `None`, если кэш выключен или генерация недетерминирована (temperature > 0).
+
+        Строится по сообщениям, которые уйдут модели (после обрезки истории), — кэшем пользуется роутер.
+        """
+        if self.response_cache is None or temperature > 0.0:
+            return None
+        return make_cache_key(
+            self.name, self._cache_model(**options), self._prompt_messages(prompt, history, max_tokens), max_tokens
+        )
+
+    async def resolve_options(self, request: ChatRequest, history: List[ChatMessage]) -> Dict[str, Any]:
+        """Параметры генерации, специфичные для движка (передаются в `chat`/`chat_stream` как `**options`).
+
+        `ValueError` — ошибка клиента (400). Значение `model_name` попадает в ответ как `model`.
+        """
+        return {}
+
+    @abstractmethod
+    async def chat(
+        self,
+        prompt: str,
+        history: List[ChatMessage],
+        temperature: float,
+        max_tokens: int,
+        stats: Optional[GenerationStats] = None,
+        **options: Any,
+    ) -> str:
+        """Полный ответ на запрос."""
+
+    @abstractmethod
+    def chat_stream(
+        self,
+        prompt: str,
+        history: List[ChatMessage],
+        temperature: float,
+        max_tokens: int,
+        stats: Optional[GenerationStats] = None,
+        **options: Any,
+    ) -> AsyncIterator[str]:
+        """Ответ фрагментами по мере генерации; `stats` заполняется к концу потока."""
+
+    @abstractmethod
+    async def generate_text(self, messages: List[Dict[str, str]], max_tokens: int) -> str:
+        """Служебная генерация по готовому списку сообщений (краткое содержание истории)."""
@@ -0,0 +1,78 @@
+from pydantic import BaseModel, Field
+from typing import List, Optional
+
+class ChatMessage(BaseModel):
+    """
+    Представление одного сообщения в диалоге.
+    """
+    role: str = Field(
+        ...,
+        description="'user' или 'assistant'; 'summary' — краткое содержание старой части диалога (ставится после системного промпта)"
+    )
+    text: str
+    tokens: Optional[int] = Field(
+        default=None,
+        ge=0,
+        description="Число токенов в тексте, если уже известно клиенту (экономит пересчёт при обрезке истории)"
+    )
+
+
+class ChatRequest(BaseModel):
+    """
+    Запрос к endpoint движка. Движки с собственными параметрами расширяют его наследованием.
+    """
+    prompt: str
+    history: List[ChatMessage] = Field(
+        default_factory=list,
+        description="История диалога; не нужна, если указан conversation_id"
+    )
+    conversation_id: Optional[str] = Field(
+        default=None,
+        description="Имя сохранённого диалога: история берётся из хранилища, вопрос и ответ дописываются в него"
+    )
+    temperature: float = Field(
+        default=0.0,
+        ge=0.0,
+        le=1.0,
+        description="Температура модели"
+    )
+    max_tokens: int = Field(
+        default=512,
+        ge=1,
+        le=4096,
+        description="Максимальное количество токенов на ответ"
+    )
+
+
+class GenerationStats(BaseModel):
+    """
+    Статистика генерации одного запроса; поля, которые движок не знает, остаются по умолчанию.
+    """
+    new_tokens: int = 0
+    elapsed_seconds: float = 0.0
+    tokens_per_second: float = 0.0
+    speculative: Optional[str] = Field(default=None, description="Режим speculative decoding: 'draft' или 'prompt_lookup'")
+    draft_tokens: Optional[int] = Field(default=None, description="Сколько черновых токенов предложено (оценка)")
+    accepted_tokens: Optional[int] = Field(default=None, description="Сколько из них принято целевой моделью (оценка)")
+    acceptance_rate: Optional[float] = None
+    cached: bool = Field(default=False, description="Ответ взят из кэша ответов, генерации не было")
+
+
+class ChatResponse(BaseModel):
+    """
+    Ответ от LLM модели
+    """
+    response: str
+    error: Optional[str] = None
+    model: Optional[str] = Field(default=None, description="Модель, ответившая на запрос (если движок их различает)")
+    stats: Optional[GenerationStats] = None
+
+
+class ChatStreamChunk(BaseModel):
+    """
+    Одна строка потокового ответа (NDJSON).
+    """
+    delta: str = ""
+    done: bool = False
+    error: Optional[str] = None
+    stats: Optional[GenerationStats] = None
@@ -0,0 +1,44 @@
+import logging
+from contextlib import contextmanager
+from typing import Iterator
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def translate_http_errors(target: str, timeout_seconds: float) -> Iterator[None]:
+    """Приводит ошибки httpx и формата ответа к `RuntimeError` с понятным сообщением.
+
+    Общий для движков, которые ходят к серверу модели по HTTP. `target` — сервер
+    в дательном падеже («Ollama», «OpenAI-совместимому серверу»),
+    `timeout_seconds` — таймаут чтения для сообщения о таймауте.
+    """
+    try:
+        yield
+
+    except httpx.ConnectError as e:
+        error_msg = f"Не удалось подключиться к {target} (ConnectError)"
+        logger.error(f"{error_msg}: {e}")
+        raise RuntimeError(error_msg) from e
+
+    except httpx.TimeoutException as e:
+        error_msg = f"Таймаут при обращении к {target} (таймаут: {timeout_seconds} сек)"
+        logger.error(f"{error_msg}: {e}")
+        raise RuntimeError(error_msg) from e
+
+    except httpx.HTTPStatusError as e:
+        error_msg = f"Ошибка HTTP-запроса к {target}: статус {e.response.status_code}"
+        logger.error(f"{error_msg}: {e}")
+        raise RuntimeError(error_msg) from e
+
+    except httpx.HTTPError as e:
+        error_msg = f"Ошибка HTTP-запроса к {target}: статус unknown"
+        logger.error(f"{error_msg}: {e}")
+        raise RuntimeError(error_msg) from e
+
+    except (ValueError, KeyError, TypeError, IndexError) as e:
+        error_msg = f"Некорректный формат ответа при обращении к {target}"
+        logger.error(f"{error_msg}: {e}")
+        raise RuntimeError(error_msg) from e
@@ -0,0 +1,35 @@
+from contextlib import asynccontextmanager
+from typing import Callable
+
+from fastapi import FastAPI
+
+from llm_engine.engine import LLMEngine
+from utils import metrics
+from utils.admission import create_admission_controller
+
+
+def engine_lifespan(name: str, factory: Callable[[], LLMEngine]):
+    """
+    Lifespan для роутера движка `name`.
+    Создаёт движок через `factory`, запускает его (`start`) и сохраняет вместе с
+    контролем допуска запросов в app.state (`<name>_client`, `<name>_admission`),
+    регистрирует в /metrics; при остановке — `aclose`.
+    """
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        engine = factory()
+        await engine.start()
+
+        # Сохраняем движок в состоянии приложения под уникальным ключом
+        setattr(app.state, f"{name}_client", engine)
+        setattr(app.state, f"{name}_admission", create_admission_controller(name, engine.settings))
+        metrics.register_engine(name, engine)
+
+        try:
+            yield
+        finally:
+            metrics.unregister_engine(name)
+            await engine.aclose()
+
+    return lifespan
@@ -1,7 +1,9 @@
 import logging
 from typing import List, Dict, Optional, Tuple
 
-from ollama_client.endpoint.ollama_entities import ChatMessage
+from llm_engine.entities import ChatMessage
+from utils.summarizer import SUMMARY_HEADER, SUMMARY_ROLE
+from utils.token_counter import TokenCounter, get_default_counter
 
 logger = logging.getLogger(__name__)
 
@@ -10,43 +12,35 @@ SYSTEM_PROMPT: str = (
     "Если вопрос неясен — уточни. Не выдумывай фактов."
 )
 
-try:
-    import tiktoken
-except Exception as e:
-    logger.warning(f"Ошибка импорта библиотеки tiktoken: {e}")
-    tiktoken = None
-
-
-def count_tokens(text: str) -> int:
-    """Подсчитывает токены текста с использованием `tiktoken`.
-
-    Если `tiktoken` недоступен — возвращает оценку по количеству символов.
-    """
-    if tiktoken is None:
-        return max(1, len(text) // 4)
-    enc = tiktoken.get_encoding("cl100k_base")
-    return len(enc.encode(text))
-
 
 def truncate_history(
         history: List[ChatMessage],
         prompt: str,
         max_total_tokens: int = 30720,
         reserved_for_response: int = 512,
+        counter: Optional[TokenCounter] = None,
 ) -> List[ChatMessage]:
     """Обрезает историю так, чтобы вместиться в лимит токенов.
 
-    Сохраняются самые свежие сообщения.
+    Сохраняются самые свежие сообщения. `counter` — бэкенд подсчёта токенов
+    (по умолчанию `tiktoken`).
     """
-    available_tokens = max_total_tokens - reserved_for_response - count_tokens(prompt)
+    if counter is None:
+        counter = get_default_counter()
+
+    available_tokens = max_total_tokens - reserved_for_response - counter.count(prompt)
     if available_tokens <= 0:
         return []
 
+    # Считаем всю историю одним батчем; присланные клиентом числа токенов не пересчитываются
+    counted = iter(counter.count_many([msg.text for msg in history if msg.tokens is None]))
+    text_tokens = [msg.tokens if msg.tokens is not None else next(counted) for msg in history]
+
     truncated: List[ChatMessage] = []
     total = 0
     # Идём с конца — сохраняем новые сообщения
-    for msg in reversed(history):
-        msg_tokens = count_tokens(msg.text) + 3  # +3 для учёта метаданных роли
+    for msg, msg_text_tokens in zip(reversed(history), reversed(text_tokens)):
+        msg_tokens = msg_text_tokens + 3  # +3 для учёта метаданных роли
         if total + msg_tokens > available_tokens:
             break
         truncated.append(msg)
@@ -61,23 +55,38 @@ def truncate_and_build_messages(
         max_total_tokens: int,
         reserved_for_response: int,
         system_prompt: Optional[str] = None,
+        counter: Optional[TokenCounter] = None,
 ) -> Tuple[List[Dict[str, str]], List[ChatMessage]]:
     """Обрезает историю и формирует список сообщений для send-пейлоада.
 
-    Возвращает кортеж `(messages, safe_history)`.
+    Сообщения истории с ролью `SUMMARY_ROLE` (краткое содержание вытесненной
+    части диалога) не обрезаются: они идут отдельным системным сообщением сразу
+    после системного промпта. Возвращает кортеж `(messages, safe_history)`.
     """
     if system_prompt is None:
         system_prompt = SYSTEM_PROMPT
+    if counter is None:
+        counter = get_default_counter()
+
+    messages: List[Dict[str, str]] = [{"role": "system", "content": system_prompt}]
+    # Системный промпт тоже занимает место в контексте
+    used_tokens = counter.count(system_prompt)
+
+    summaries = [msg.text for msg in history if msg.role == SUMMARY_ROLE]
+    if summaries:
+        history = [msg for msg in history if msg.role != SUMMARY_ROLE]
+        summary = SUMMARY_HEADER + "\n".join(summaries)
+        messages.append({"role": "system", "content": summary})
+        used_tokens += counter.count(summary) + 3
 
     safe_history = truncate_history(
         history=history,
         prompt=prompt,
-        max_total_tokens=max_total_tokens,
+        max_total_tokens=max_total_tokens - used_tokens,
         reserved_for_response=reserved_for_response,
+        counter=counter,
     )
 
-    messages: List[Dict[str, str]] = [{"role": "system", "content": system_prompt}]
-
     for msg in safe_history:
         role = "user" if msg.role == "user" else "assistant"
         messages.append({"role": role, "content": msg.text})
@@ -85,4 +94,4 @@ def truncate_and_build_messages(
     messages.append({"role": "user", "content": prompt})
 
     logger.debug(f"Prepared messages (count={len(messages)}) after truncation")
-    return messages, safe_history
\ No newline at end of file
+    return messages, safe_history
@@ -0,0 +1,227 @@
+import logging
+import time
+from typing import Any, AsyncGenerator, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, Type
+
+from fastapi import APIRouter, Request, HTTPException
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+from utils import metrics
+from app.storage import append_conversation_messages, get_recent_messages
+from llm_engine.engine import LLMEngine
+from llm_engine.entities import ChatMessage, ChatRequest, ChatResponse, ChatStreamChunk, GenerationStats
+from llm_engine.lifespan import engine_lifespan
+
+logger = logging.getLogger(__name__)
+
+
+async def _ndjson_stream(
+    name: str,
+    chunks: AsyncGenerator[str, None],
+    on_complete: Optional[Callable[[str], Awaitable[None]]] = None,
+    stats: Optional[GenerationStats] = None,
+) -> AsyncIterator[str]:
+    """Оборачивает фрагменты ответа в строки NDJSON; ошибка передаётся последней строкой.
+
+    `on_complete` получает полный текст ответа до строки `done`; `stats` отдаются в строке `done`.
+    """
+    with metrics.track_request(name, "stream") as observer:
+        try:
+            parts: List[str] = []
+            async for delta in chunks:
+                observer.first_chunk()
+                parts.append(delta)
+                yield ChatStreamChunk(delta=delta).model_dump_json(exclude_defaults=True) + "\n"
+            if on_complete is not None:
+                await on_complete("".join(parts))
+            yield ChatStreamChunk(done=True, stats=stats).model_dump_json(exclude_defaults=True) + "\n"
+        except Exception as e:
+            observer.status = "error"
+            yield ChatStreamChunk(error=str(e)).model_dump_json(exclude_defaults=True) + "\n"
+        finally:
+            # Клиент оборвал соединение — сразу закрываем поток фрагментов, а не при сборке мусора
+            await chunks.aclose()
+
+
+async def _cache_get(engine: LLMEngine, key: Optional[str], stats: GenerationStats) -> Optional[str]:
+    """Готовый ответ из кэша ответов движка; `None`, если его нет или запрос не кэшируется (`key is None`)."""
+    if key is None:
+        return None
+    started = time.perf_counter()
+    cached = await engine.response_cache.aget(key)
+    if cached is not None:
+        logger.info(f"Ответ {engine.name} взят из кэша (длина: {len(cached)} символов)")
+        stats.cached = True
+        stats.elapsed_seconds = round(time.perf_counter() - started, 4)
+    return cached
+
+
+async def _cached_stream(
+    engine: LLMEngine, request: ChatRequest, history: List[ChatMessage], options: Dict[str, Any], stats: GenerationStats
+) -> AsyncIterator[str]:
+    """`engine.chat_stream` через кэш ответов: готовый ответ отдаётся одним фрагментом.
+
+    В кэш попадает только полностью полученный ответ.
+    """
+    cache_key = await engine.response_cache_key(
+        request.prompt, history, request.temperature, request.max_tokens, **options
+    )
+    cached = await _cache_get(engine, cache_key, stats)
+    if cached is not None:
+        yield cached
+        return
+
+    chunks = engine.chat_stream(
+        prompt=request.prompt,
+        history=history,
+        temperature=request.temperature,
+        max_tokens=request.max_tokens,
+        stats=stats,
+        **options,
+    )
+    parts: List[str] = []
+    try:
+        async for delta in chunks:
+            parts.append(delta)
+            yield delta
+    finally:
+        # Клиент ушёл — закрытие генератора движка останавливает генерацию
+        await chunks.aclose()
+
+    if cache_key is not None:
+        await engine.response_cache.aput(cache_key, "".join(parts))
+
+
+def _load_history(engine: LLMEngine, request: ChatRequest, username: Optional[str]) -> List[ChatMessage]:
+    """История для модели: из хранилища, если указан `conversation_id`, иначе — присланная клиентом."""
+    if request.conversation_id is None:
+        return request.history
+
+    if not username:
+        raise HTTPException(status_code=401)
+    messages = get_recent_messages(username, request.conversation_id, engine.settings.conversation_history_messages)
+    if messages is None:
+        raise HTTPException(status_code=404, detail="Диалог не найден")
+    # Данные из своего хранилища повторно не валидируем
+    history = [
+        ChatMessage.model_construct(role=m.get("role", "user"), text=m.get("text", ""))
+        for m in messages if isinstance(m, dict)
+    ]
+    if engine.summarizer is None:
+        return history
+    # Не вошедшая в контекст часть диалога — кратким содержанием (готовым или после фонового обновления)
+    return engine.summarizer.apply(
+        f"{username}/{request.conversation_id}",
+        history,
+        request.prompt,
+        engine.settings.max_context_length,
+        request.max_tokens,
+    )
+
+
+def _save_turn(request: ChatRequest, username: Optional[str], reply: str) -> None:
+    """Дописывает вопрос и ответ в сохранённый диалог (только для запросов с `conversation_id`)."""
+    reply = reply.strip()
+    if request.conversation_id is None or not reply:
+        return
+    try:
+        append_conversation_messages(
+            username,
+            request.conversation_id,
+            [{"role": "user", "text": request.prompt}, {"role": "assistant", "text": reply}],
+        )
+    except Exception as e:
+        # Ответ уже получен — не теряем его из-за ошибки записи
+        logger.warning(f"Не удалось сохранить ход диалога {request.conversation_id}: {e}")
+
+
+def create_engine_router(
+    name: str,
+    factory: Callable[[], LLMEngine],
+    title: str,
+    request_model: Type[ChatRequest] = ChatRequest,
+) -> APIRouter:
+    """Роутер движка с эндпоинтами `/{name}/chat` и `/{name}/chat/stream`.
+
+    Ответы на детерминированные запросы берутся из кэша ответов движка и
+    сохраняются в него (ключ — `LLMEngine.response_cache_key`).
+
+    Движок создаётся `factory` при старте приложения (`engine_lifespan`).
+    `request_model` — модель запроса, если у движка есть свои параметры
+    (их разбирает `LLMEngine.resolve_options`). Дополнительные эндпоинты движка
+    добавляются к возвращённому роутеру.
+    """
+    router = APIRouter(
+        prefix=f"/{name}",
+        tags=[title],
+        lifespan=engine_lifespan(name, factory)
+    )
+
+    def _engine(req: Request) -> LLMEngine:
+        engine = getattr(req.app.state, f"{name}_client", None)
+        if engine is None:
+            raise HTTPException(status_code=500, detail=f"{title} client not initialized")
+        return engine
+
+    async def _prepare(
+        engine: LLMEngine, request: ChatRequest, username: Optional[str]
+    ) -> Tuple[List[ChatMessage], Dict[str, Any]]:
+        """История (чтение хранилища — в пуле потоков) и параметры движка; неверные параметры — 400."""
+        history = await run_in_threadpool(_load_history, engine, request, username)
+        try:
+            options = await engine.resolve_options(request, history)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return history, options
+
+    @router.post("/chat", response_model=ChatResponse)
+    async def chat(request: request_model, req: Request):
+        engine = _engine(req)
+        username = getattr(req.state, "username", None)
+        history, options = await _prepare(engine, request, username)
+        stats = GenerationStats()
+
+        with metrics.track_request(name, "chat"):
+            try:
+                cache_key = await engine.response_cache_key(
+                    request.prompt, history, request.temperature, request.max_tokens, **options
+                )
+                cached = await _cache_get(engine, cache_key, stats)
+                if cached is not None:
+                    response_text = cached.strip()
+                else:
+                    response_text = await engine.chat(
+                        prompt=request.prompt,
+                        history=history,
+                        temperature=request.temperature,
+                        max_tokens=request.max_tokens,
+                        stats=stats,
+                        **options,
+                    )
+                    if cache_key is not None:
+                        await engine.response_cache.aput(cache_key, response_text)
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=str(e))
+
+        await run_in_threadpool(_save_turn, request, username, response_text)
+        return ChatResponse(response=response_text, model=options.get("model_name"), stats=stats)
+
+    @router.post("/chat/stream")
+    async def stream_chat(request: request_model, req: Request):
+        """Потоковый вариант `/chat`: ответ приходит построчно в формате NDJSON."""
+        engine = _engine(req)
+        username = getattr(req.state, "username", None)
+        history, options = await _prepare(engine, request, username)
+        stats = GenerationStats()
+
+        async def on_complete(reply: str) -> None:
+            await run_in_threadpool(_save_turn, request, username, reply)
+
+        return StreamingResponse(
+            _ndjson_stream(
+                name, _cached_stream(engine, request, history, options, stats), on_complete=on_complete, stats=stats
+            ),
+            media_type="application/x-ndjson",
+        )
+
+    return router
@@ -0,0 +1,132 @@
+from typing import ClassVar, Optional
+from pydantic import Field
+from pydantic_settings import BaseSettings, DotEnvSettingsSource, EnvSettingsSource, SettingsConfigDict
+
+class EngineSettings(BaseSettings):
+    """
+    Настройки, общие для всех движков: контекст, история диалогов, краткое
+    содержание, кэш ответов и контроль допуска. Настройки движка наследуются от
+    них и переопределяют значения по умолчанию, если нужно.
+
+    Любую настройку можно задать отдельно для движка — переменной с префиксом
+    `engine_env_prefix` (`QWEN3_ADMISSION_MAX_CONCURRENT`); переменная без
+    префикса (`ADMISSION_MAX_CONCURRENT`) действует на все движки, где префиксной нет.
+    Поля с `alias` читаются только по нему.
+    """
+
+    # Префикс переменных окружения движка, например "qwen3_"
+    engine_env_prefix: ClassVar[str] = ""
+
+    max_context_length: int = Field(
+        default=4096,
+        description="Максимальное число токенов в контексте модели"
+    )
+
+    reserved_tokens_for_response: int = Field(
+        default=512,
+        description="Зарезервировано под ответ (используется в truncate)"
+    )
+
+    conversation_history_messages: int = Field(
+        default=200,
+        ge=0,
+        description="Сколько последних сообщений загружать из хранилища для запросов с conversation_id"
+    )
+
+    summary_enabled: bool = Field(
+        default=True,
+        description="Сжимать вытесненную из контекста историю диалогов (conversation_id) в краткое содержание"
+    )
+
+    summary_max_tokens: int = Field(
+        default=256,
+        ge=16,
+        description="Длина краткого содержания; столько токенов контекста резервируется под него"
+    )
+
+    summary_max_input_tokens: int = Field(
+        default=2048,
+        ge=128,
+        description="Сколько токенов вытесненных сообщений сворачивается за один вызов модели"
+    )
+
+    summary_cache_max_entries: int = Field(
+        default=1024,
+        ge=1,
+        description="Для скольких диалогов держать краткое содержание в памяти (LRU)"
+    )
+
+    response_cache_enabled: bool = Field(
+        default=True,
+        description="Кэшировать ответы на запросы с temperature=0"
+    )
+
+    response_cache_max_entries: int = Field(
+        default=1024,
+        ge=1,
+        description="Сколько ответов держать в памяти (LRU)"
+    )
+
+    response_cache_ttl_seconds: int = Field(
+        default=3600,
+        ge=0,
+        description="Срок жизни ответа в кэше (0 — без ограничения)"
+    )
+
+    response_cache_path: Optional[str] = Field(
+        default=None,
+        description="Файл SQLite для дискового уровня кэша ответов (по умолчанию — только память)"
+    )
+
+    response_cache_disk_max_entries: int = Field(
+        default=100_000,
+        ge=1,
+        description="Сколько ответов хранить на диске"
+    )
+
+    admission_max_concurrent: int = Field(
+        default=8,
+        ge=1,
+        description="Сколько запросов к движку выполняется одновременно; остальные ждут в очереди"
+    )
+
+    admission_max_queue: int = Field(
+        default=64,
+        ge=0,
+        description="Максимум ожидающих запросов; сверх — сразу 503 с Retry-After"
+    )
+
+    admission_per_user_limit: int = Field(
+        default=2,
+        ge=1,
+        description="Максимум одновременных (выполняемых и ожидающих) запросов одного пользователя; сверх — 429"
+    )
+
+    admission_queue_timeout_seconds: float = Field(
+        default=60,
+        ge=0,
+        description="Сколько запрос может ждать слота, прежде чем получит 503 (0 — без ограничения)"
+    )
+
+    model_config = SettingsConfigDict(
+        frozen=True,
+        case_sensitive=False,
+        env_nested_delimiter="__",
+        env_file=".env",
+        # В общем .env лежат и настройки других движков и приложения
+        extra="ignore"
+    )
+
+    @classmethod
+    def settings_customise_sources(cls, settings_cls, init_settings, env_settings, dotenv_settings, file_secret_settings):
+        """Переменные с префиксом движка важнее переменных без префикса (и в окружении, и в .env)."""
+        if not cls.engine_env_prefix:
+            return init_settings, env_settings, dotenv_settings, file_secret_settings
+        return (
+            init_settings,
+            EnvSettingsSource(settings_cls, env_prefix=cls.engine_env_prefix),
+            env_settings,
+            DotEnvSettingsSource(settings_cls, env_prefix=cls.engine_env_prefix),
+            dotenv_settings,
+            file_secret_settings,
+        )
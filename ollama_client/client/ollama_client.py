@@ -1,100 +1,237 @@
 # client/ollama_client.py
+import json
 import logging
-from typing import List, Optional
-from requests.exceptions import RequestException, Timeout, ConnectionError
-import requests
+from typing import Any, AsyncIterator, Dict, List, Optional
 
-from ollama_client.endpoint.ollama_entities import ChatMessage
+import httpx
+
+from llm_engine.engine import LLMEngine
+from llm_engine.http_errors import translate_http_errors
+from ollama_client.endpoint.ollama_entities import ChatMessage, GenerationStats, OllamaChatRequest
 from ollama_client.endpoint.ollama_settings import OllamaSettings
 from ollama_client.client.ollama_connection import ollama_connection
-from ollama_client.client.ollama_utils import truncate_and_build_messages
+from ollama_client.client.ollama_models import OllamaModelRegistry
+from utils import metrics
+from utils.response_cache import ResponseCache, create_response_cache
+from utils.summarizer import HistorySummarizer
 
 logger = logging.getLogger(__name__)
 
 
-class OllamaClient:
+class OllamaClient(LLMEngine):
+    """Асинхронный клиент Ollama: запросы не блокируют event loop FastAPI.
+
+    Все запросы идут через один `httpx.AsyncClient` с пулом keep-alive соединений,
+    который создаётся в `connect` и закрывается в `aclose`. Ответы на запросы
+    с temperature=0 кэширует роутер в `response_cache`.
+    """
+
+    name = "ollama"
+
     def __init__(self, settings: OllamaSettings):
         self.settings = settings
         self.is_connected = False
+        self._http: Optional[httpx.AsyncClient] = None
+        self.models: Optional[OllamaModelRegistry] = None
+        self.response_cache: Optional[ResponseCache] = create_response_cache(settings)
+        # Краткое содержание вытесненной истории диалогов; обновляется в фоне
+        self.summarizer: Optional[HistorySummarizer] = self._create_summarizer()
+
+    def _create_http_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            base_url=self.settings.ollama_url,
+            limits=httpx.Limits(
+                max_connections=self.settings.pool_max_connections,
+                max_keepalive_connections=self.settings.pool_max_keepalive_connections,
+                keepalive_expiry=self.settings.keepalive_expiry_seconds,
+            ),
+            timeout=httpx.Timeout(
+                connect=self.settings.connect_timeout_seconds,
+                read=self.settings.request_timeout_seconds,
+                write=self.settings.write_timeout_seconds,
+                pool=self.settings.pool_timeout_seconds,
+            ),
+        )
 
-    def connect(self) -> bool:
-        """Проверяет подключение к Ollama и устанавливает флаг готовности."""
-        self.is_connected = ollama_connection(self.settings)
+    async def connect(self) -> bool:
+        """Создаёт пул соединений, проверяет подключение к Ollama и устанавливает флаг готовности."""
+        if self._http is None:
+            self._http = self._create_http_client()
+            self.models = OllamaModelRegistry(self.settings, self._http)
+        self.is_connected = await ollama_connection(self._http)
         return self.is_connected
 
-    def query(
+    async def start(self) -> None:
+        """Подключается к Ollama при старте приложения; без сервера приложение не запускается."""
+        if not await self.connect():
+            await self.aclose()
+            raise RuntimeError(
+                f"Не удалось подключиться к Ollama по адресу {self.settings.ollama_url}. "
+                "Убедитесь, что сервер запущен и доступен."
+            )
+        await super().start()
+
+    async def aclose(self) -> None:
+        """Останавливает сжатие истории, закрывает пул соединений и дисковый уровень кэша ответов."""
+        await super().aclose()
+        self.is_connected = False
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+            self.models = None
+
+    async def resolve_options(self, request: OllamaChatRequest, history: List[ChatMessage]) -> Dict[str, Any]:
+        """Модель для запроса (`model_name`, 'auto' или модель из настроек); неизвестная модель — `ValueError`."""
+        return {"model_name": await self.models.resolve(request.model_name, request.prompt, history)}
+
+    def _build_payload(
         self,
         prompt: str,
         history: List[ChatMessage],
         temperature: float,
         max_tokens: int,
-        model_name: Optional[str] = None,
-    ) -> str:
-        if not self.is_connected:
-            raise RuntimeError("Ollama client is not connected")
-
+        model_name: Optional[str],
+        stream: bool,
+    ) -> dict:
+        """Обрезает историю и формирует тело запроса к `/api/chat`."""
         engine_name = f"Ollama/{model_name or self.settings.model_name}"
         logger.info(f"Запрос к движку: {engine_name}")
-        logger.debug(f"Параметры генерации: temperature={temperature}, max_tokens={max_tokens}")
-
-        messages, _ = truncate_and_build_messages(
-            prompt=prompt,
-            history=history,
-            max_total_tokens=self.settings.max_context_length,
-            reserved_for_response=max_tokens,
-        )
+        logger.debug(f"Параметры генерации: temperature={temperature}, max_tokens={max_tokens}, stream={stream}")
 
-        payload = {
+        return {
             "model": model_name or self.settings.model_name,
-            "messages": messages,
-            "stream": False,
+            "messages": self._prompt_messages(prompt, history, max_tokens),
+            "stream": stream,
+            "keep_alive": self.settings.keep_alive,
             "options": {
                 "temperature": temperature,
                 "num_predict": max_tokens,
             }
         }
 
-        try:
-            url = f"{self.settings.ollama_url}/api/chat"
-            logger.debug(f"Отправка POST-запроса к {url}")
-            response = requests.post(
-                url=url,
-                json=payload,
-                timeout=self.settings.request_timeout_seconds
-            )
-            response.raise_for_status()
+    @staticmethod
+    def _observe_generation(data: dict, stats: Optional[GenerationStats] = None) -> None:
+        """Метрики и `stats` генерации из статистики, которую Ollama отдаёт в ответе (длительности — в наносекундах)."""
+        def seconds(key: str) -> Optional[float]:
+            value = data.get(key)
+            return value / 1e9 if isinstance(value, (int, float)) else None
+
+        metrics.observe_generation(
+            "ollama",
+            prompt_tokens=data.get("prompt_eval_count"),
+            completion_tokens=data.get("eval_count"),
+            prefill_seconds=seconds("prompt_eval_duration"),
+            decode_seconds=seconds("eval_duration"),
+        )
+        if stats is not None:
+            stats.new_tokens = data.get("eval_count") or 0
+            stats.elapsed_seconds = round(seconds("total_duration") or 0.0, 3)
+            decode = seconds("eval_duration")
+            if decode:
+                stats.tokens_per_second = round(stats.new_tokens / decode, 2)
 
-            response_data = response.json()
-            content = response_data.get("message", {}).get("content", "").strip()
+    def _cache_model(self, model_name: Optional[str] = None, **options: Any) -> str:
+        return model_name or self.settings.model_name
 
-            if not content:
-                raise ValueError("Пустой ответ от Ollama")
+    async def chat(
+        self,
+        prompt: str,
+        history: List[ChatMessage],
+        temperature: float,
+        max_tokens: int,
+        stats: Optional[GenerationStats] = None,
+        model_name: Optional[str] = None,
+    ) -> str:
+        if not self.is_connected:
+            raise RuntimeError("Ollama client is not connected")
 
-            logger.info(f"Успешно получен ответ от Ollama (длина: {len(content)} символов)")
-            return content
+        payload = self._build_payload(prompt, history, temperature, max_tokens, model_name, stream=False)
 
-        except ConnectionError as e:
-            error_msg = "Не удалось подключиться к Ollama (ConnectionError)"
-            logger.error(f"{error_msg}: {e}")
-            raise RuntimeError(error_msg) from e
+        try:
+            with translate_http_errors("Ollama", self.settings.request_timeout_seconds):
+                logger.debug(f"Отправка POST-запроса к {self.settings.ollama_url}/api/chat")
+                response = await self._http.post("/api/chat", json=payload)
+                response.raise_for_status()
 
-        except Timeout as e:
-            error_msg = f"Таймаут при обращении к Ollama (таймаут: {self.settings.request_timeout_seconds} сек)"
-            logger.error(f"{error_msg}: {e}")
-            raise RuntimeError(error_msg) from e
+                response_data = response.json()
+                content = response_data.get("message", {}).get("content", "").strip()
+                self._observe_generation(response_data, stats)
 
-        except RequestException as e:
-            status = e.response.status_code if e.response else "unknown"
-            error_msg = f"Ошибка HTTP-запроса к Ollama: статус {status}"
-            logger.error(f"{error_msg}: {e}")
-            raise RuntimeError(error_msg) from e
+                if not content:
+                    raise ValueError("Пустой ответ от Ollama")
 
-        except (ValueError, KeyError, TypeError) as e:
-            error_msg = "Некорректный формат ответа от Ollama"
-            logger.error(f"{error_msg}: {e}")
-            raise RuntimeError(error_msg) from e
+                logger.info(f"Успешно получен ответ от Ollama (длина: {len(content)} символов)")
+
+            return content
+
+        except RuntimeError:
+            raise
 
         except Exception as e:
             error_msg = "Неожиданная ошибка при работе с Ollama"
             logger.error(f"{error_msg}: {e}")
             raise RuntimeError(error_msg) from e
+
+    async def generate_text(self, messages: List[Dict[str, str]], max_tokens: int) -> str:
+        """Служебная генерация по готовому списку сообщений (краткое содержание истории).
+
+        Модель — `summary_model`, иначе маленькая модель маршрутизации или модель по умолчанию;
+        кэш ответов и метрики запросов не используются.
+        """
+        if not self.is_connected:
+            raise RuntimeError("Ollama client is not connected")
+
+        payload = {
+            "model": self.settings.summary_model or self.settings.routing_small_model or self.settings.model_name,
+            "messages": messages,
+            "stream": False,
+            "keep_alive": self.settings.keep_alive,
+            "options": {"temperature": 0.0, "num_predict": max_tokens},
+        }
+        with translate_http_errors("Ollama", self.settings.request_timeout_seconds):
+            response = await self._http.post("/api/chat", json=payload)
+            response.raise_for_status()
+            return response.json()["message"]["content"]
+
+    async def chat_stream(
+        self,
+        prompt: str,
+        history: List[ChatMessage],
+        temperature: float,
+        max_tokens: int,
+        stats: Optional[GenerationStats] = None,
+        model_name: Optional[str] = None,
+    ) -> AsyncIterator[str]:
+        """Потоковая генерация: отдаёт фрагменты ответа по мере их прихода от Ollama.
+
+        Ollama в режиме `stream=True` возвращает NDJSON — по одному JSON-объекту на строку,
+        последний объект содержит `"done": true`.
+        """
+        if not self.is_connected:
+            raise RuntimeError("Ollama client is not connected")
+
+        payload = self._build_payload(prompt, history, temperature, max_tokens, model_name, stream=True)
+
+        with translate_http_errors("Ollama", self.settings.request_timeout_seconds):
+            logger.debug(f"Отправка потокового POST-запроса к {self.settings.ollama_url}/api/chat")
+            async with self._http.stream("POST", "/api/chat", json=payload) as response:
+                response.raise_for_status()
+
+                total_chars = 0
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    if chunk.get("error"):
+                        raise ValueError(chunk["error"])
+
+                    delta = chunk.get("message", {}).get("content", "")
+                    if delta:
+                        total_chars += len(delta)
+                        yield delta
+
+                    if chunk.get("done"):
+                        self._observe_generation(chunk, stats)
+                        break
+
+            logger.info(f"Потоковый ответ от Ollama завершён (длина: {total_chars} символов)")
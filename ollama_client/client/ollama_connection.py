@@ -1,13 +1,11 @@
-import requests
-from requests.exceptions import ConnectionError, Timeout
-from ollama_client.endpoint.ollama_settings import OllamaSettings
+import httpx
 
-def ollama_connection(settings: OllamaSettings) -> bool:
+async def ollama_connection(http: httpx.AsyncClient) -> bool:
     """
     Проверяет доступность Ollama сервера по endpoint.
     """
     try:
-        response = requests.get(f"{settings.ollama_url}/api/tags", timeout=5)
+        response = await http.get("/api/tags", timeout=5)
         return response.status_code == 200
-    except (ConnectionError, Timeout):
-        return False
\ No newline at end of file
+    except httpx.HTTPError:
+        return False
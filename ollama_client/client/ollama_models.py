@@ -0,0 +1,89 @@
+import asyncio
+import logging
+import time
+from typing import List, Optional
+
+import httpx
+
+from ollama_client.endpoint.ollama_entities import ChatMessage
+from ollama_client.endpoint.ollama_settings import OllamaSettings
+from utils.token_counter import get_default_counter
+
+logger = logging.getLogger(__name__)
+
+AUTO_MODEL: str = "auto"
+
+
+def normalize_model_name(name: str) -> str:
+    """Ollama считает `phi3` и `phi3:latest` одной моделью."""
+    return name if ":" in name else f"{name}:latest"
+
+
+class OllamaModelRegistry:
+    """Список доступных моделей Ollama (`/api/tags`) с кэшированием и правилами маршрутизации.
+
+    Список обновляется не чаще раза в `models_cache_ttl_seconds`; конкурентные
+    запросы во время обновления ждут один общий вызов.
+    """
+
+    def __init__(self, settings: OllamaSettings, http: httpx.AsyncClient):
+        self.settings = settings
+        self.http = http
+        self._models: List[str] = []
+        self._fetched_at: float = 0.0
+        self._lock = asyncio.Lock()
+
+    async def list_models(self, force: bool = False) -> List[str]:
+        """Возвращает имена моделей, загруженных в Ollama."""
+        if not force and self._models and time.monotonic() - self._fetched_at < self.settings.models_cache_ttl_seconds:
+            return self._models
+
+        async with self._lock:
+            if not force and self._models and time.monotonic() - self._fetched_at < self.settings.models_cache_ttl_seconds:
+                return self._models
+            try:
+                response = await self.http.get("/api/tags", timeout=5)
+                response.raise_for_status()
+                self._models = [m["name"] for m in response.json().get("models", []) if m.get("name")]
+                self._fetched_at = time.monotonic()
+                logger.debug(f"Список моделей Ollama обновлён: {self._models}")
+            except (httpx.HTTPError, ValueError, KeyError, TypeError) as e:
+                # Оставляем прежний список: недоступность /api/tags не должна ломать чат
+                logger.warning(f"Не удалось получить список моделей Ollama: {e}")
+        return self._models
+
+    def route_by_length(self, prompt: str, history: List[ChatMessage]) -> str:
+        """Короткие запросы — в быструю модель, длинные — в большую."""
+        small = self.settings.routing_small_model or self.settings.model_name
+        large = self.settings.routing_large_model or self.settings.model_name
+
+        counter = get_default_counter()
+        counted = iter(counter.count_many([msg.text for msg in history if msg.tokens is None]))
+        input_tokens = counter.count(prompt) + sum(
+            msg.tokens if msg.tokens is not None else next(counted) for msg in history
+        )
+        model = small if input_tokens <= self.settings.routing_threshold_tokens else large
+        logger.debug(f"Маршрутизация: {input_tokens} входных токенов → {model}")
+        return model
+
+    async def resolve(self, requested: Optional[str], prompt: str, history: List[ChatMessage]) -> str:
+        """Определяет, какой моделью выполнять запрос.
+
+        - не указана — модель из настроек;
+        - `auto` — выбор по длине входа (`routing_*` в настройках);
+        - иначе — указанная модель, если Ollama её знает.
+
+        :raises ValueError: запрошенной модели нет в Ollama
+        """
+        if not requested:
+            return self.settings.model_name
+        if requested == AUTO_MODEL:
+            return self.route_by_length(prompt, history)
+
+        available = await self.list_models()
+        if available and normalize_model_name(requested) not in {normalize_model_name(m) for m in available}:
+            # Модель могли только что загрузить — перечитываем список перед отказом
+            available = await self.list_models(force=True)
+            if available and normalize_model_name(requested) not in {normalize_model_name(m) for m in available}:
+                raise ValueError(f"Модель '{requested}' не найдена в Ollama")
+        return requested
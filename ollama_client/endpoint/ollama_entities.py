@@ -1,37 +1,26 @@
 from pydantic import BaseModel, Field
 from typing import List, Optional
 
-class ChatMessage(BaseModel):
-    """
-    Представление одного сообщения в диалоге.
-    """
-    role: str = Field(..., description="Должно быть 'user' или 'assistant'")
-    text: str
+# Общие для всех движков сущности API
+from llm_engine.entities import ChatMessage, ChatRequest, ChatResponse, ChatStreamChunk, GenerationStats
 
 
-class ChatRequest(BaseModel):
+class OllamaChatRequest(ChatRequest):
     """
-    Запрос к endpoint.
+    Запрос к endpoint Ollama: общий запрос плюс выбор модели.
     """
-    prompt: str
-    history: List[ChatMessage]
-    temperature: float = Field(
-        default=0.0,
-        ge=0.0,
-        le=1.0,
-        description="Температура модели"
-    )
-    max_tokens: int = Field(
-        default=512,
-        ge=1,
-        le=4096,
-        description="Максимальное количество токенов на ответ"
+    model_name: Optional[str] = Field(
+        default=None,
+        description="Модель Ollama; 'auto' — выбор по длине запроса; не указана — модель из настроек"
     )
 
 
-class ChatResponse(BaseModel):
+class ModelsResponse(BaseModel):
     """
-    Ответ от LLM модели
+    Доступные модели Ollama и правила маршрутизации.
     """
-    response: str
-    error: Optional[str] = None
+    models: List[str]
+    default: str
+    routing_small_model: str
+    routing_large_model: str
+    routing_threshold_tokens: int
@@ -1,27 +1,34 @@
-from fastapi import APIRouter, Request, HTTPException
-from ollama_client.endpoint.ollama_entities import ChatRequest, ChatResponse
-from ollama_client.endpoint.ollama_lifespan import ollama_lifespan
+import logging
 
-ollama_router = APIRouter(
-    prefix="/ollama",
-    tags=["Ollama"],
-    lifespan=ollama_lifespan
+from fastapi import Request, HTTPException
+
+from llm_engine.router import create_engine_router
+from ollama_client.client.ollama_client import OllamaClient
+from ollama_client.endpoint.ollama_entities import ModelsResponse, OllamaChatRequest
+from ollama_client.endpoint.ollama_settings import get_ollama_settings
+
+logger = logging.getLogger(__name__)
+
+# /ollama/chat и /ollama/chat/stream — общие для всех движков; запрос дополнен выбором модели
+ollama_router = create_engine_router(
+    "ollama",
+    lambda: OllamaClient(get_ollama_settings()),
+    title="Ollama",
+    request_model=OllamaChatRequest,
 )
 
-@ollama_router.post("/chat", response_model=ChatResponse)
-async def chat_with_ollama(request: ChatRequest, req: Request):
+
+@ollama_router.get("/models", response_model=ModelsResponse)
+async def list_ollama_models(req: Request):
     client = getattr(req.app.state, "ollama_client", None)
     if client is None:
         raise HTTPException(status_code=500, detail="Ollama client not initialized")
 
-    try:
-        response_text = client.query(
-            prompt=request.prompt,
-            history=request.history,
-            temperature=request.temperature,
-            max_tokens=request.max_tokens,
-#            model_name=request.model_name,
-        )
-        return ChatResponse(response=response_text)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    settings = client.settings
+    return ModelsResponse(
+        models=await client.models.list_models(),
+        default=settings.model_name,
+        routing_small_model=settings.routing_small_model or settings.model_name,
+        routing_large_model=settings.routing_large_model or settings.model_name,
+        routing_threshold_tokens=settings.routing_threshold_tokens,
+    )
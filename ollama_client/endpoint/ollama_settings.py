@@ -1,8 +1,13 @@
 from functools import lru_cache
-from pydantic import Field
-from pydantic_settings import BaseSettings, SettingsConfigDict
+from typing import ClassVar, Optional, Union
+from pydantic import Field, field_validator
+
+from llm_engine.settings import EngineSettings
+
+class OllamaSettings(EngineSettings):
+    # OLLAMA_MAX_CONTEXT_LENGTH, OLLAMA_ADMISSION_MAX_CONCURRENT и т. д.; без префикса — общие значения
+    engine_env_prefix: ClassVar[str] = "ollama_"
 
-class OllamaSettings(BaseSettings):
     ollama_url: str = Field(
         default= "http://localhost:11434",
         description="URL хостинга модели Ollama",
@@ -17,26 +22,80 @@ class OllamaSettings(BaseSettings):
 
     request_timeout_seconds: int = Field(
         default=120,
-        description="Таймаут на запрос к хостингу"
+        description="Таймаут на запрос к хостингу (ожидание данных ответа)"
+    )
+
+    connect_timeout_seconds: float = Field(
+        default=5.0,
+        description="Таймаут установки TCP-соединения с Ollama"
+    )
+
+    write_timeout_seconds: float = Field(
+        default=30.0,
+        description="Таймаут отправки тела запроса"
+    )
+
+    pool_timeout_seconds: float = Field(
+        default=10.0,
+        description="Сколько ждать свободного соединения из пула"
+    )
+
+    pool_max_connections: int = Field(
+        default=20,
+        ge=1,
+        description="Максимум одновременных соединений к Ollama"
+    )
+
+    pool_max_keepalive_connections: int = Field(
+        default=10,
+        ge=0,
+        description="Сколько простаивающих keep-alive соединений держать открытыми"
+    )
+
+    keepalive_expiry_seconds: float = Field(
+        default=60.0,
+        description="Через сколько секунд простоя keep-alive соединение закрывается"
+    )
+
+    keep_alive: Union[int, str] = Field(
+        default="30m",
+        description=(
+            "Параметр keep_alive Ollama: сколько держать модель в памяти после запроса — "
+            "длительность Go ('30m', '1h') или число секунд (0 — выгрузить сразу, -1 — держать всегда)"
+        )
+    )
+
+    @field_validator("keep_alive", mode="before")
+    @classmethod
+    def _keep_alive_seconds(cls, value):
+        # Из окружения приходит строка: число секунд Ollama ждёт числом JSON, а не строкой '-1'
+        if isinstance(value, str) and value.strip().lstrip("-").isdigit():
+            return int(value)
+        return value
+
+    models_cache_ttl_seconds: int = Field(
+        default=60,
+        description="Как долго кэшировать список моделей из /api/tags"
+    )
+
+    routing_small_model: Optional[str] = Field(
+        default=None,
+        description="Модель для коротких запросов при model_name='auto' (по умолчанию — model_name)"
     )
 
-    max_context_length: int = Field(
-        default=4096,
-        description="Максимальное число токенов в контексте модели",
-        alias="max_context_length"
+    routing_large_model: Optional[str] = Field(
+        default=None,
+        description="Модель для длинных запросов при model_name='auto' (по умолчанию — model_name)"
     )
 
-    reserved_tokens_for_response: int = Field(
+    routing_threshold_tokens: int = Field(
         default=512,
-        description="Зарезервировано под ответ (используется в truncate)",
-        alias="reserved_tokens_for_response"
+        description="Порог входных токенов (запрос + история), выше которого выбирается большая модель"
     )
 
-    model_config = SettingsConfigDict(
-        frozen=True,
-        case_sensitive=False,
-        env_nested_delimiter="__",
-        env_file=".env"
+    summary_model: Optional[str] = Field(
+        default=None,
+        description="Модель для краткого содержания (по умолчанию — routing_small_model или model_name)"
     )
 
 
@@ -0,0 +1,245 @@
+# client/openai_client.py
+import json
+import logging
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import httpx
+
+from llm_engine.engine import LLMEngine
+from llm_engine.entities import ChatMessage, GenerationStats
+from llm_engine.http_errors import translate_http_errors
+from openai_client.client.openai_connection import openai_connection
+from openai_client.endpoint.openai_settings import OpenAISettings
+from utils import metrics
+from utils.response_cache import ResponseCache, create_response_cache
+from utils.summarizer import HistorySummarizer
+
+logger = logging.getLogger(__name__)
+
+
+class OpenAIClient(LLMEngine):
+    """Асинхронный клиент OpenAI-совместимого сервера (`/v1/chat/completions`).
+
+    Подходит для llama.cpp server, vLLM и других серверов с протоколом OpenAI.
+    Запросы идут через один `httpx.AsyncClient` с пулом keep-alive соединений;
+    потоковые ответы приходят как Server-Sent Events (`data: {...}`, в конце
+    `data: [DONE]`). Ответы на запросы с temperature=0 кэширует роутер в `response_cache`.
+    """
+
+    name = "openai"
+
+    def __init__(self, settings: OpenAISettings):
+        self.settings = settings
+        self.is_connected = False
+        self._http: Optional[httpx.AsyncClient] = None
+        # Модель из настроек, иначе первая из /v1/models (определяется в `connect`)
+        self.model: Optional[str] = settings.openai_model
+        self.response_cache: Optional[ResponseCache] = create_response_cache(settings)
+        # Краткое содержание вытесненной истории диалогов; обновляется в фоне
+        self.summarizer: Optional[HistorySummarizer] = self._create_summarizer()
+
+    def _create_http_client(self) -> httpx.AsyncClient:
+        headers = {}
+        if self.settings.openai_api_key:
+            headers["Authorization"] = f"Bearer {self.settings.openai_api_key}"
+        return httpx.AsyncClient(
+            base_url=self.settings.openai_url,
+            headers=headers,
+            limits=httpx.Limits(
+                max_connections=self.settings.openai_pool_max_connections,
+                max_keepalive_connections=self.settings.openai_pool_max_keepalive_connections,
+                keepalive_expiry=self.settings.openai_keepalive_expiry_seconds,
+            ),
+            timeout=httpx.Timeout(
+                connect=self.settings.openai_connect_timeout_seconds,
+                read=self.settings.openai_request_timeout_seconds,
+                write=self.settings.openai_write_timeout_seconds,
+                pool=self.settings.openai_pool_timeout_seconds,
+            ),
+        )
+
+    async def connect(self) -> bool:
+        """Создаёт пул соединений, проверяет сервер и определяет модель, если она не задана."""
+        if self._http is None:
+            self._http = self._create_http_client()
+        models = await openai_connection(self._http)
+        if models is not None and self.model is None:
+            if not models:
+                logger.error("OpenAI-совместимый сервер не вернул ни одной модели, задайте OPENAI_MODEL")
+                return False
+            self.model = models[0]
+        self.is_connected = models is not None
+        return self.is_connected
+
+    async def start(self) -> None:
+        """Подключается к серверу при старте приложения; без сервера приложение не запускается."""
+        if not await self.connect():
+            await self.aclose()
+            raise RuntimeError(
+                f"Не удалось подключиться к OpenAI-совместимому серверу по адресу {self.settings.openai_url}. "
+                "Убедитесь, что сервер запущен и доступен."
+            )
+        logger.info(f"OpenAI-совместимый сервер: {self.settings.openai_url}, модель {self.model}")
+        await super().start()
+
+    async def aclose(self) -> None:
+        """Останавливает сжатие истории, закрывает пул соединений и дисковый уровень кэша ответов."""
+        await super().aclose()
+        self.is_connected = False
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    def _build_payload(
+        self,
+        prompt: str,
+        history: List[ChatMessage],
+        temperature: float,
+        max_tokens: int,
+        stream: bool,
+    ) -> dict:
+        """Обрезает историю и формирует тело запроса к `/chat/completions`."""
+        logger.info(f"Запрос к движку: OpenAI/{self.model}")
+        logger.debug(f"Параметры генерации: temperature={temperature}, max_tokens={max_tokens}, stream={stream}")
+
+        payload = {
+            "model": self.model,
+            "messages": self._prompt_messages(prompt, history, max_tokens),
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "stream": stream,
+        }
+        if stream and self.settings.openai_stream_usage:
+            payload["stream_options"] = {"include_usage": True}
+        return payload
+
+    @staticmethod
+    def _observe_generation(
+        usage: Optional[dict],
+        started: float,
+        first_token_at: Optional[float],
+        finished: float,
+        stats: Optional[GenerationStats] = None,
+    ) -> None:
+        """Метрики и `stats` генерации: токены — из `usage` ответа, длительности — по часам клиента.
+
+        Граница prefill и декодирования известна только в стриме (первый фрагмент).
+        """
+        usage = usage or {}
+        completion_tokens = usage.get("completion_tokens")
+        metrics.observe_generation(
+            "openai",
+            prompt_tokens=usage.get("prompt_tokens"),
+            completion_tokens=completion_tokens,
+            prefill_seconds=first_token_at - started if first_token_at is not None else None,
+            decode_seconds=finished - first_token_at if first_token_at is not None else None,
+        )
+        if stats is not None:
+            elapsed = finished - started
+            stats.new_tokens = completion_tokens or 0
+            stats.elapsed_seconds = round(elapsed, 4)
+            stats.tokens_per_second = round(stats.new_tokens / elapsed, 2) if elapsed > 0 else 0.0
+
+    def _cache_model(self, **options: Any) -> str:
+        # Одноимённые модели на разных серверах могут различаться
+        return f"{self.settings.openai_url}|{self.model}"
+
+    async def chat(
+        self,
+        prompt: str,
+        history: List[ChatMessage],
+        temperature: float,
+        max_tokens: int,
+        stats: Optional[GenerationStats] = None,
+    ) -> str:
+        if not self.is_connected:
+            raise RuntimeError("OpenAI client is not connected")
+
+        payload = self._build_payload(prompt, history, temperature, max_tokens, stream=False)
+
+        with translate_http_errors("OpenAI-совместимому серверу", self.settings.openai_request_timeout_seconds):
+            started = time.perf_counter()
+            response = await self._http.post("/chat/completions", json=payload)
+            response.raise_for_status()
+
+            response_data = response.json()
+            content = (response_data["choices"][0]["message"].get("content") or "").strip()
+            self._observe_generation(response_data.get("usage"), started, None, time.perf_counter(), stats)
+
+            if not content:
+                raise ValueError("Пустой ответ от OpenAI-совместимого сервера")
+
+            logger.info(f"Успешно получен ответ от OpenAI-совместимого сервера (длина: {len(content)} символов)")
+
+        return content
+
+    async def generate_text(self, messages: List[Dict[str, str]], max_tokens: int) -> str:
+        """Служебная генерация по готовому списку сообщений (краткое содержание истории).
+
+        Кэш ответов и метрики запросов не используются.
+        """
+        if not self.is_connected:
+            raise RuntimeError("OpenAI client is not connected")
+
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "temperature": 0.0,
+            "max_tokens": max_tokens,
+            "stream": False,
+        }
+        with translate_http_errors("OpenAI-совместимому серверу", self.settings.openai_request_timeout_seconds):
+            response = await self._http.post("/chat/completions", json=payload)
+            response.raise_for_status()
+            return response.json()["choices"][0]["message"].get("content") or ""
+
+    async def chat_stream(
+        self,
+        prompt: str,
+        history: List[ChatMessage],
+        temperature: float,
+        max_tokens: int,
+        stats: Optional[GenerationStats] = None,
+    ) -> AsyncIterator[str]:
+        """Потоковая генерация: отдаёт фрагменты ответа по мере их прихода от сервера.
+
+        Сервер отвечает Server-Sent Events: строки `data: {...}` с `choices[0].delta.content`,
+        поток завершает `data: [DONE]`. При `openai_stream_usage` последний объект содержит `usage`.
+        """
+        if not self.is_connected:
+            raise RuntimeError("OpenAI client is not connected")
+
+        payload = self._build_payload(prompt, history, temperature, max_tokens, stream=True)
+
+        parts: List[str] = []
+        usage: Optional[dict] = None
+        first_token_at: Optional[float] = None
+        with translate_http_errors("OpenAI-совместимому серверу", self.settings.openai_request_timeout_seconds):
+            started = time.perf_counter()
+            async with self._http.stream("POST", "/chat/completions", json=payload) as response:
+                response.raise_for_status()
+
+                async for line in response.aiter_lines():
+                    # Пустые строки разделяют события, строки с ':' — комментарии (keep-alive)
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    chunk = json.loads(data)
+                    if chunk.get("error"):
+                        error = chunk["error"]
+                        raise ValueError(error.get("message", error) if isinstance(error, dict) else error)
+
+                    usage = chunk.get("usage") or usage
+                    choices = chunk.get("choices") or []
+                    delta = (choices[0].get("delta") or {}).get("content") if choices else None
+                    if delta:
+                        if first_token_at is None:
+                            first_token_at = time.perf_counter()
+                        parts.append(delta)
+                        yield delta
+
+            self._observe_generation(usage, started, first_token_at, time.perf_counter(), stats)
+            logger.info(f"Потоковый ответ OpenAI-совместимого сервера завершён (длина: {sum(map(len, parts))} символов)")
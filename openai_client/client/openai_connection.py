@@ -0,0 +1,21 @@
+import logging
+from typing import List, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+async def openai_connection(http: httpx.AsyncClient) -> Optional[List[str]]:
+    """
+    Проверяет доступность OpenAI-совместимого сервера по `/models`.
+    Возвращает список моделей сервера или `None`, если сервер недоступен.
+    """
+    try:
+        response = await http.get("/models", timeout=5)
+        if response.status_code != 200:
+            return None
+        return [m["id"] for m in response.json().get("data", []) if isinstance(m, dict) and "id" in m]
+    except (httpx.HTTPError, ValueError) as e:
+        logger.debug(f"OpenAI-совместимый сервер недоступен: {e}")
+        return None
@@ -0,0 +1,10 @@
+from llm_engine.router import create_engine_router
+from openai_client.client.openai_client import OpenAIClient
+from openai_client.endpoint.openai_settings import get_openai_settings
+
+# /openai/chat и /openai/chat/stream с тем же контрактом ChatRequest/ChatResponse, что у остальных движков
+openai_router = create_engine_router(
+    "openai",
+    lambda: OpenAIClient(get_openai_settings()),
+    title="OpenAI-compatible",
+)
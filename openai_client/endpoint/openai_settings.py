@@ -0,0 +1,84 @@
+from functools import lru_cache
+from typing import ClassVar, Optional
+from pydantic import Field
+
+from llm_engine.settings import EngineSettings
+
+class OpenAISettings(EngineSettings):
+    # Общие настройки движка — OPENAI_ADMISSION_MAX_CONCURRENT и т. д.; без префикса — общие значения
+    engine_env_prefix: ClassVar[str] = "openai_"
+
+    openai_enabled: bool = Field(
+        default=False,
+        description="Подключать движок OpenAI-совместимого сервера (/openai/chat); без сервера приложение не стартует"
+    )
+
+    openai_url: str = Field(
+        default="http://localhost:8080/v1",
+        description="Базовый URL OpenAI-совместимого API (llama.cpp server, vLLM, ...), включая /v1"
+    )
+
+    openai_api_key: Optional[str] = Field(
+        default=None,
+        description="Ключ API (заголовок Authorization: Bearer), если сервер его требует"
+    )
+
+    openai_model: Optional[str] = Field(
+        default=None,
+        description="Имя модели в запросах (по умолчанию — первая модель из /v1/models)"
+    )
+
+    openai_stream_usage: bool = Field(
+        default=True,
+        description="Просить число токенов в конце стрима (stream_options.include_usage)"
+    )
+
+    openai_request_timeout_seconds: int = Field(
+        default=120,
+        description="Таймаут на запрос к серверу (ожидание данных ответа)"
+    )
+
+    openai_connect_timeout_seconds: float = Field(
+        default=5.0,
+        description="Таймаут установки TCP-соединения с сервером"
+    )
+
+    openai_write_timeout_seconds: float = Field(
+        default=30.0,
+        description="Таймаут отправки тела запроса"
+    )
+
+    openai_pool_timeout_seconds: float = Field(
+        default=10.0,
+        description="Сколько ждать свободного соединения из пула"
+    )
+
+    openai_pool_max_connections: int = Field(
+        default=20,
+        ge=1,
+        description="Максимум одновременных соединений к серверу"
+    )
+
+    openai_pool_max_keepalive_connections: int = Field(
+        default=10,
+        ge=0,
+        description="Сколько простаивающих keep-alive соединений держать открытыми"
+    )
+
+    openai_keepalive_expiry_seconds: float = Field(
+        default=60.0,
+        description="Через сколько секунд простоя keep-alive соединение закрывается"
+    )
+
+
+@lru_cache()
+def get_openai_settings() -> OpenAISettings:
+    """
+    Получить настройки приложения
+
+    Используют @lru_cache для кэширования - настройки загружаются один раз
+    и переиспользуются при последующих вызовах
+
+    :return: экземпляр OpenAISettings
+    """
+    return OpenAISettings()
@@ -0,0 +1,142 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+from transformers_client.endpoint.qwen3_entities import ChatMessage, GenerationStats
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class BatchItem:
+    """Запрос, ожидающий в очереди планировщика."""
+    prompt: str
+    history: List[ChatMessage]
+    temperature: float
+    max_tokens: int
+    stats: Optional[GenerationStats] = None
+    future: Future = field(default_factory=Future)
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def group_key(self) -> Tuple[bool, float]:
+        """Запросы объединяются в батч, только если у них одинаковые параметры сэмплинга."""
+        return self.temperature > 0.0, self.temperature
+
+
+class Qwen3BatchScheduler:
+    """Динамический батчинг запросов к Qwen3.
+
+    Фоновый поток забирает первый запрос из очереди, затем в течение `max_wait_ms`
+    добирает до `max_batch_size` конкурентных запросов и выполняет их одним вызовом
+    `model.generate` на батче с левым паддингом. Каждый вызывающий получает свой
+    результат через `Future`.
+    """
+
+    def __init__(
+        self,
+        run_batch: Callable[[List[BatchItem]], List[str]],
+        max_batch_size: int,
+        max_wait_ms: int,
+    ):
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait_seconds = max_wait_ms / 1000.0
+        self._queue: "queue.Queue[Optional[BatchItem]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._loop, name="qwen3-batcher", daemon=True)
+        self._thread.start()
+        logger.info(
+            f"Планировщик батчей Qwen3 запущен (max_batch_size={self.max_batch_size}, "
+            f"max_wait_ms={int(self.max_wait_seconds * 1000)})"
+        )
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Останавливает поток планировщика; ждёт текущий батч не дольше `timeout` секунд (`None` — без ограничения)."""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            # Поток фоновый (daemon): допишет батч и завершится сам, ожидающие получат ошибку
+            logger.warning(f"Батч Qwen3 не завершился за {timeout} с, останавливаемся без ожидания")
+        self._thread = None
+
+    def submit(
+        self,
+        prompt: str,
+        history: List[ChatMessage],
+        temperature: float,
+        max_tokens: int,
+        stats: Optional[GenerationStats] = None,
+    ) -> Future:
+        """Ставит запрос в очередь и возвращает `Future` с текстом ответа; `stats` заполняется при генерации."""
+        item = BatchItem(prompt=prompt, history=history, temperature=temperature, max_tokens=max_tokens, stats=stats)
+        self._queue.put(item)
+        return item.future
+
+    def _collect(self, first: BatchItem) -> Tuple[List[BatchItem], bool]:
+        """Добирает запросы к первому, пока не истечёт окно ожидания или не наберётся батч."""
+        items = [first]
+        deadline = time.monotonic() + self.max_wait_seconds
+        while len(items) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                return items, True
+            items.append(item)
+        return items, False
+
+    def _loop(self) -> None:
+        stopping = False
+        while not stopping:
+            first = self._queue.get()
+            if first is None:
+                break
+
+            items, stopping = self._collect(first)
+
+            groups: Dict[Tuple[bool, float], List[BatchItem]] = {}
+            for item in items:
+                groups.setdefault(item.group_key, []).append(item)
+
+            for group in groups.values():
+                # Пропускаем запросы, которые уже отменены вызывающей стороной
+                group = [item for item in group if item.future.set_running_or_notify_cancel()]
+                if not group:
+                    continue
+                logger.debug(f"Выполняется батч Qwen3 из {len(group)} запросов")
+                try:
+                    results = self.run_batch(group)
+                except Exception as e:
+                    for item in group:
+                        item.future.set_exception(e)
+                    continue
+                for item, result in zip(group, results):
+                    item.future.set_result(result)
+
+        # Запросы, оставшиеся в очереди после остановки, завершаем ошибкой
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None and item.future.set_running_or_notify_cancel():
+                item.future.set_exception(RuntimeError("Планировщик Qwen3 остановлен"))
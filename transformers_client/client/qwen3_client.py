@@ -1,23 +1,291 @@
+import asyncio
 import logging
+import threading
+import time
 import torch
-import gc
-from typing import List
-from transformers import AutoTokenizer, AutoModelForCausalLM, GenerationConfig
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from functools import partial
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+from transformers import (
+    AutoTokenizer,
+    AutoModelForCausalLM,
+    GenerationConfig,
+    StoppingCriteria,
+    StoppingCriteriaList,
+    TextIteratorStreamer,
+)
 from accelerate import init_empty_weights, load_checkpoint_and_dispatch
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
 
-from transformers_client.endpoint.qwen3_entities import ChatMessage
+from llm_engine.engine import LLMEngine
+from llm_engine.prompt import SYSTEM_PROMPT, truncate_and_build_messages
+from transformers_client.endpoint.qwen3_entities import ChatMessage, GenerationStats
 from transformers_client.endpoint.qwen3_settings import Qwen3Settings
-from transformers_client.client.qwen3_utils import truncate_and_build_messages
+from transformers_client.client.qwen3_batcher import BatchItem, Qwen3BatchScheduler
+from transformers_client.client.qwen3_kv_cache import PrefixKVCache
+from transformers_client.client.qwen3_profiles import (
+    apply_post_load,
+    benchmark_generation,
+    configure_threads,
+    detect_device,
+    from_pretrained_kwargs,
+    resolve_profile,
+)
+from transformers_client.client.qwen3_speculative import (
+    ForwardCounter,
+    acceptance_from_trace,
+    speculative_generate_kwargs,
+)
+from transformers_client.client.qwen3_utils import strip_think, strip_think_stream
+from utils import metrics
+from utils.memory_policy import MemoryManager, freeze_long_lived, unfreeze
+from utils.response_cache import ResponseCache, create_response_cache, make_cache_key
+from utils.summarizer import HistorySummarizer
+from utils.token_counter import HFTokenizerCounter, TokenCounter, get_default_counter
 
 logger = logging.getLogger(__name__)
 
 
-class Qwen3Client:
+class _CancelCriteria(StoppingCriteria):
+    """Останавливает генерацию, когда потребитель потока перестал читать ответ."""
+
+    def __init__(self, event: threading.Event):
+        self.event = event
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        return torch.full((input_ids.shape[0],), self.event.is_set(), dtype=torch.bool, device=input_ids.device)
+
+
+class _FirstTokenTimer(StoppingCriteria):
+    """Запоминает момент первого сгенерированного токена — границу prefill и декодирования."""
+
+    def __init__(self):
+        self.first_token_at: Optional[float] = None
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+        return torch.zeros((input_ids.shape[0],), dtype=torch.bool, device=input_ids.device)
+
+
+class Qwen3Client(LLMEngine):
+    name = "qwen3"
+
     def __init__(self, settings: Qwen3Settings):
         self.settings = settings
         self.tokenizer = None
         self.model = None
+        # Черновая модель speculative decoding и счётчик forward основной модели
+        self.draft_model = None
+        self.speculative_mode = "off"
+        self._forward_counter: Optional[ForwardCounter] = None
         self.is_loaded = False
+        # До загрузки токенизатора считаем через tiktoken
+        self.token_counter: TokenCounter = get_default_counter()
+        # Отдельный пул для `model.generate`: генерация не занимает event loop
+        # и не конкурирует с общим threadpool Starlette
+        self._executor = ThreadPoolExecutor(
+            max_workers=settings.inference_workers,
+            thread_name_prefix="qwen3-infer",
+        )
+        self._batcher: Optional[Qwen3BatchScheduler] = None
+        if settings.batching_enabled:
+            self._batcher = Qwen3BatchScheduler(
+                run_batch=self._run_batch,
+                max_batch_size=settings.batch_max_size,
+                max_wait_ms=settings.batch_max_wait_ms,
+            )
+        self._kv_cache: Optional[PrefixKVCache] = None
+        if settings.kv_cache_enabled:
+            self._kv_cache = PrefixKVCache(
+                max_bytes=settings.kv_cache_max_mb * 1024 * 1024,
+                max_entries=settings.kv_cache_max_entries,
+                min_prefix_tokens=settings.kv_cache_min_prefix_tokens,
+            )
+        # Ленивая загрузка и выгрузка по простою
+        self._state_lock = threading.Lock()
+        self._loading: Optional[Future] = None
+        self._in_flight = 0
+        self._last_used = time.monotonic()
+        self.last_error: Optional[str] = None
+        # Профиль загрузки и замер скорости — для /health и выбора профиля под машину
+        self.load_report: Dict[str, object] = {}
+        # Профиль загрузки для ключа кэша ответов (`_cache_model`) — вычисляется без загрузки модели
+        self._cache_profile: Optional[str] = None
+        # Очистка памяти по порогам и простою — в фоне, а не после каждого запроса
+        self.memory = MemoryManager(
+            rss_threshold_mb=settings.memory_rss_threshold_mb,
+            allocator_threshold_mb=settings.memory_allocator_threshold_mb,
+            idle_seconds=settings.memory_idle_cleanup_seconds,
+            check_interval_seconds=settings.memory_check_interval_seconds,
+            is_busy=lambda: self._in_flight > 0,
+        )
+        # Готовые ответы на запросы с temperature=0; переживает выгрузку модели
+        self.response_cache: Optional[ResponseCache] = create_response_cache(settings)
+        # Краткое содержание вытесненной истории диалогов; обновляется в фоне
+        self.summarizer: Optional[HistorySummarizer] = self._create_summarizer(counter=lambda: self.token_counter)
+        self._idle_task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        """При `lazy_load=False` загружает модель сразу, при `idle_unload_seconds` запускает выгрузку по простою."""
+        if not self.settings.lazy_load and not await asyncio.to_thread(self.connect):
+            raise RuntimeError("Не удалось загрузить Qwen3")
+        # Один раз при старте, а не при каждой (ленивой) загрузке: полная сборка не попадает на путь запроса
+        await asyncio.to_thread(freeze_long_lived)
+        if self.settings.idle_unload_seconds > 0:
+            self._idle_task = asyncio.create_task(self._unload_when_idle(self.settings.idle_unload_seconds))
+        await super().start()
+
+    async def _unload_when_idle(self, idle_seconds: int) -> None:
+        """Периодически проверяет простой и выгружает модель из памяти."""
+        interval = max(1.0, min(60.0, idle_seconds / 4))
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.unload_if_idle, idle_seconds)
+            except Exception as e:
+                logger.warning(f"Ошибка выгрузки Qwen3: {e}")
+
+    async def aclose(self) -> None:
+        if self._idle_task is not None:
+            self._idle_task.cancel()
+            self._idle_task = None
+        await super().aclose()
+        # Ожидание потоков — не в event loop: остановка остальных движков не ждёт батч Qwen3
+        await asyncio.to_thread(self.close, self.settings.shutdown_timeout_seconds)
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """Останавливает планировщик батчей, очистку памяти и пул инференса; незапущенные задачи отменяются.
+
+        Текущий батч и очистка памяти ждутся не дольше `timeout` секунд каждые (`None` — без ограничения).
+        """
+        if self._batcher is not None:
+            self._batcher.stop(timeout)
+        self.memory.stop(timeout)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    @property
+    def state(self) -> str:
+        """Готовность модели: `ready`, `loading`, `unloaded` или `error` (последняя загрузка не удалась)."""
+        if self.is_loaded:
+            return "ready"
+        if self._loading is not None:
+            return "loading"
+        return "error" if self.last_error else "unloaded"
+
+    @property
+    def in_flight(self) -> int:
+        """Число выполняющихся и ожидающих запросов."""
+        return self._in_flight
+
+    def health(self) -> Dict[str, object]:
+        """Готовность модели, число запросов, отчёт о загрузке и память (для /health)."""
+        return {
+            "state": self.state,
+            "in_flight": self.in_flight,
+            "load": self.load_report,
+            "memory": self.memory.stats(),
+        }
+
+    @property
+    def queue_depth(self) -> int:
+        """Запросы, ожидающие планировщика батчей."""
+        return self._batcher.queue_depth if self._batcher is not None else 0
+
+    def cache_stats(self) -> Dict[str, Dict[str, object]]:
+        """Счётчики кэша ответов и KV-кэша префиксов (для /metrics)."""
+        caches: Dict[str, Dict[str, object]] = {}
+        if self.response_cache is not None:
+            caches["response"] = self.response_cache.stats()
+        if self._kv_cache is not None:
+            caches["kv_prefix"] = {
+                "hits": self._kv_cache.hits,
+                "misses": self._kv_cache.misses,
+                "entries": len(self._kv_cache),
+            }
+        return caches
+
+    def load_async(self) -> Future:
+        """Запускает загрузку модели в фоне и возвращает её `Future`.
+
+        Конкурентные вызовы получают один и тот же `Future` — модель загружается один раз.
+        """
+        with self._state_lock:
+            if self.is_loaded:
+                done: Future = Future()
+                done.set_result(True)
+                return done
+            if self._loading is None:
+                self._loading = Future()
+                threading.Thread(
+                    target=self._load_worker,
+                    args=(self._loading,),
+                    name="qwen3-load",
+                    daemon=True,
+                ).start()
+            return self._loading
+
+    def _load_worker(self, future: Future) -> None:
+        try:
+            self.connect()
+            future.set_result(True)
+        except BaseException as e:
+            self.last_error = str(e)
+            future.set_exception(e)
+        finally:
+            with self._state_lock:
+                self._loading = None
+
+    def ensure_loaded(self) -> None:
+        """Блокирующе дожидается загрузки модели (загружая её при необходимости)."""
+        if not self.is_loaded:
+            self.load_async().result()
+
+    async def aensure_loaded(self) -> None:
+        if not self.is_loaded:
+            await asyncio.wrap_future(self.load_async())
+
+    @contextmanager
+    def _track_use(self) -> Iterator[None]:
+        """Учитывает запрос как выполняющийся: пока он не завершён, модель не выгружается."""
+        with self._state_lock:
+            self._in_flight += 1
+            self._last_used = time.monotonic()
+        try:
+            yield
+        finally:
+            with self._state_lock:
+                self._in_flight -= 1
+                self._last_used = time.monotonic()
+            self.memory.note_activity()
+
+    def unload_if_idle(self, idle_seconds: float) -> bool:
+        """Выгружает модель, если запросов нет дольше `idle_seconds`; возвращает, была ли выгрузка."""
+        with self._state_lock:
+            if not self.is_loaded or self._in_flight > 0:
+                return False
+            idle_for = time.monotonic() - self._last_used
+            if idle_for < idle_seconds:
+                return False
+            # Под блокировкой: новый запрос либо уже учтён в _in_flight, либо увидит
+            # is_loaded=False и загрузит модель заново
+            self.is_loaded = False
+            if self._forward_counter is not None:
+                self._forward_counter.remove()
+                self._forward_counter = None
+            self.model = None
+            self.draft_model = None
+            self.tokenizer = None
+            self.token_counter = get_default_counter()
+            if self._kv_cache is not None:
+                self._kv_cache.clear()
+
+        # Модель, загруженная при старте, заморожена вместе с остальными объектами — возвращаем их сборщику
+        unfreeze()
+        self.memory.run_cleanup("unload")
+        logger.info(f"Qwen3 выгружена после {idle_for:.0f} с простоя")
+        return True
 
     def connect(self) -> bool:
         """
@@ -32,8 +300,11 @@ class Qwen3Client:
         logger.info("ИНИЦИАЛИЗАЦИЯ QWEN3 ЧЕРЕЗ TRANSFORMERS")
         logger.info("=" * 60)
 
-        device = "mps" if torch.backends.mps.is_available() else "cpu"
-        logger.info(f"Обнаруженное устройство: {device}")
+        device = detect_device()
+        profile = resolve_profile(self.settings.load_profile, device)
+        threads = configure_threads(self.settings.num_threads)
+        logger.info(f"Обнаруженное устройство: {device}, профиль: {profile.describe()}")
+        load_kwargs = from_pretrained_kwargs(profile, self.settings.attn_implementation)
 
         try:
             # Загрузка токенизатора
@@ -48,10 +319,9 @@ class Qwen3Client:
             # Прямая загрузка
             self.model = AutoModelForCausalLM.from_pretrained(
                 self.settings.model_name,
-                torch_dtype=torch.float16,
-                device_map="auto",
                 trust_remote_code=True,
-                low_cpu_mem_usage=True
+                low_cpu_mem_usage=True,
+                **load_kwargs
             )
         except Exception as e1:
             logger.warning(f"Прямая загрузка не удалась: {e1}. Пробуем через accelerate...")
@@ -59,79 +329,279 @@ class Qwen3Client:
                 with init_empty_weights():
                     self.model = AutoModelForCausalLM.from_pretrained(
                         self.settings.model_name,
-                        torch_dtype=torch.float16,
+                        torch_dtype=profile.dtype,
+                        attn_implementation=self.settings.attn_implementation,
                         trust_remote_code=True
                     )
                 self.model = load_checkpoint_and_dispatch(
                     self.model,
                     checkpoint=self.settings.model_name,
-                    device_map="auto",
-                    dtype=torch.float16,
+                    device_map=profile.device_map or "cpu",
+                    dtype=profile.dtype,
                     no_split_module_classes=["Qwen2DecoderLayer"]
                 )
             except Exception as e2:
                 logger.error(f"Обе попытки загрузки провалились: {e2}")
                 raise RuntimeError("Не удалось загрузить Qwen3")
 
+        self.model = apply_post_load(self.model, profile, self.settings.torch_compile)
+
+        self.speculative_mode = self.settings.speculative_mode
+        if self.speculative_mode == "draft":
+            self.draft_model = self._load_draft_model(profile, load_kwargs)
+            if self.draft_model is None:
+                self.speculative_mode = "off"
+        if self.speculative_mode != "off":
+            self._forward_counter = ForwardCounter(self.model)
+
+        if self.settings.token_counter_backend == "model":
+            self.token_counter = HFTokenizerCounter(self.tokenizer)
+
+        self.load_report = {
+            "device": device,
+            "profile": profile.name,
+            "dtype": str(profile.dtype).replace("torch.", ""),
+            "quantization": profile.quantization,
+            "attn_implementation": self.settings.attn_implementation,
+            "torch_compile": self.settings.torch_compile,
+            "num_threads": threads,
+            "speculative": self.speculative_mode,
+        }
+        if self.settings.startup_benchmark_tokens > 0:
+            self._run_startup_benchmark()
+
         self.is_loaded = True
-        logger.info("Qwen3 успешно загружена (float16, device_map=auto)")
+        self.last_error = None
+        self._last_used = time.monotonic()
+        logger.info(f"Qwen3 успешно загружена ({profile.describe()}, устройство {device})")
+        if self._kv_cache is not None:
+            self._warm_system_prefix()
+        if self._batcher is not None:
+            self._batcher.start()
+        self.memory.start()
         return True
 
-    def _cleanup_memory(self):
-        """
-        Очистка GPU/MPS/CPU памяти после генерации.
-        """
+    def _load_draft_model(self, profile, load_kwargs: Dict[str, object]):
+        """Загружает черновую модель с тем же профилем; при ошибке speculative decoding отключается."""
+        try:
+            draft = AutoModelForCausalLM.from_pretrained(
+                self.settings.draft_model_name,
+                trust_remote_code=True,
+                low_cpu_mem_usage=True,
+                **load_kwargs
+            )
+            draft = apply_post_load(draft, profile, compile_model=False)
+            logger.info(f"Черновая модель {self.settings.draft_model_name} загружена для speculative decoding")
+            return draft
+        except Exception as e:
+            logger.warning(f"Не удалось загрузить черновую модель {self.settings.draft_model_name}, "
+                           f"speculative decoding отключён: {e}")
+            return None
 
-        if torch.cuda.is_available():
-            torch.cuda.empty_cache()
-        elif torch.backends.mps.is_available():
-            torch.mps.empty_cache()
-        gc.collect()
+    def _run_startup_benchmark(self) -> None:
+        """Замеряет скорость генерации выбранного профиля и пишет её в лог и `load_report`."""
+        try:
+            result = benchmark_generation(self.model, self.tokenizer, self.settings.startup_benchmark_tokens)
+        except Exception as e:
+            logger.warning(f"Замер скорости Qwen3 не удался: {e}")
+            return
+        self.load_report.update(result)
+        logger.info(
+            f"Скорость профиля {self.load_report['profile']}: {result['tokens_per_second']} ток/с, "
+            f"prefill {result['prefill_ms']} мс (потоков: {self.load_report['num_threads']})"
+        )
 
-    def query(
+    def _warm_system_prefix(self) -> None:
+        """Прогревает общий для всех пользователей KV-кэш префикса с `SYSTEM_PROMPT`."""
+        try:
+            tokens = self._tokenize_messages(
+                [{"role": "system", "content": SYSTEM_PROMPT}],
+                add_generation_prompt=False,
+            )
+            with torch.no_grad():
+                outputs = self.model(input_ids=tokens.to(self.model.device), use_cache=True)
+            self._kv_cache.store(tokens[0], outputs.past_key_values, pinned=True)
+            logger.info(f"KV-кэш системного промпта прогрет ({tokens.shape[-1]} токенов)")
+        except Exception as e:
+            logger.warning(f"Не удалось прогреть KV-кэш системного промпта: {e}")
+
+    def _generate(
         self,
-        prompt: str,
-        history: List[ChatMessage],
-        temperature: float,
-        max_tokens: int,
-    ) -> str:
-        if not self.is_loaded:
-            raise RuntimeError("Qwen3 не загружена")
+        input_ids: torch.Tensor,
+        attention_mask: torch.Tensor,
+        gen_config: GenerationConfig,
+        stats: Optional[GenerationStats] = None,
+        **kwargs,
+    ) -> torch.Tensor:
+        """`model.generate` для одного запроса с переиспользованием KV-кэша общего префикса.
 
-        logger.info(f"Запрос к Qwen3 (temperature={temperature}, max_tokens={max_tokens})")
+        Если предыдущий ход диалога (или системный промпт) уже прокэширован, prefill
+        выполняется только для новых токенов. После генерации кэш сохраняется для
+        следующего хода. При включённом speculative decoding кандидаты предлагает
+        черновая модель или поиск по промпту. Возвращает сгенерированные
+        последовательности; `stats`, если передан, заполняется статистикой генерации.
+        """
+        hit = self._kv_cache.lookup(input_ids[0]) if self._kv_cache is not None else None
+        if hit is not None:
+            logger.debug(f"KV-кэш: переиспользовано {hit.prefix_len} из {input_ids.shape[-1]} токенов промпта")
 
-        messages, _ = truncate_and_build_messages(
-            prompt=prompt,
-            history=history,
-            max_total_tokens=self.settings.max_context_length,
-            reserved_for_response=max_tokens,
+        speculative = speculative_generate_kwargs(
+            self.speculative_mode,
+            self.draft_model,
+            self.settings.num_assistant_tokens,
+            self.settings.prompt_lookup_num_tokens,
+            self.settings.prompt_lookup_max_ngram_size,
         )
+        measure = self._forward_counter.measure() if self._forward_counter is not None else nullcontext(None)
+        timer = _FirstTokenTimer()
+        stopping_criteria = StoppingCriteriaList([timer, *kwargs.pop("stopping_criteria", [])])
+
+        started = time.perf_counter()
+        with torch.no_grad(), measure as trace:
+            outputs = self.model.generate(
+                input_ids=input_ids,
+                attention_mask=attention_mask,
+                generation_config=gen_config,
+                past_key_values=hit.cache if hit is not None else None,
+                return_dict_in_generate=True,
+                stopping_criteria=stopping_criteria,
+                **speculative,
+                **kwargs,
+            )
+        finished = time.perf_counter()
+        elapsed = finished - started
+        new_tokens = outputs.sequences.shape[-1] - input_ids.shape[-1]
+        self._observe_generation(input_ids.shape[-1], new_tokens, started, timer, finished)
 
-        # Применяем шаблон чата
+        if self._kv_cache is not None and outputs.past_key_values is not None:
+            cached_len = outputs.past_key_values.get_seq_length()
+            self._kv_cache.store(
+                outputs.sequences[0][:cached_len],
+                outputs.past_key_values,
+                replaces=hit.entry_id if hit is not None else None,
+            )
+
+        if stats is not None:
+            self._fill_stats(stats, new_tokens, elapsed)
+            if trace is not None:
+                stats.speculative = self.speculative_mode
+                prompt_positions = input_ids.shape[-1] - (hit.prefix_len if hit is not None else 0)
+                for key, value in acceptance_from_trace(trace, prompt_positions, new_tokens).items():
+                    setattr(stats, key, value)
+            self._log_stats(stats)
+
+        return outputs.sequences
+
+    @staticmethod
+    def _observe_generation(
+        prompt_tokens: int, new_tokens: int, started: float, timer: _FirstTokenTimer, finished: float
+    ) -> None:
+        first = timer.first_token_at if timer.first_token_at is not None else finished
+        metrics.observe_generation(
+            "qwen3",
+            prompt_tokens=prompt_tokens,
+            completion_tokens=new_tokens,
+            prefill_seconds=first - started,
+            decode_seconds=finished - first,
+        )
+
+    @staticmethod
+    def _fill_stats(stats: GenerationStats, new_tokens: int, elapsed: float) -> None:
+        stats.new_tokens = new_tokens
+        stats.elapsed_seconds = round(elapsed, 4)
+        stats.tokens_per_second = round(new_tokens / elapsed, 2) if elapsed > 0 else 0.0
+
+    @staticmethod
+    def _log_stats(stats: GenerationStats) -> None:
+        message = f"Qwen3: {stats.new_tokens} токенов за {stats.elapsed_seconds:.2f} с ({stats.tokens_per_second} ток/с)"
+        if stats.draft_tokens is not None:
+            message += (f", {stats.speculative}: принято {stats.accepted_tokens} из {stats.draft_tokens} "
+                        f"черновых токенов ({stats.acceptance_rate})")
+        logger.info(message)
+
+    def _tokenize_messages(self, messages: List[Dict[str, str]], add_generation_prompt: bool = True) -> torch.Tensor:
+        """Применяет chat-шаблон и возвращает `input_ids` формы `(1, seq_len)`."""
         tokenized = self.tokenizer.apply_chat_template(
             messages,
-            add_generation_prompt=True,
+            add_generation_prompt=add_generation_prompt,
             return_tensors="pt",
             tokenize=True,
         )
-
-        # Обработка результата apply_chat_template
         if isinstance(tokenized, dict):
-            input_ids = tokenized["input_ids"]
-            attention_mask = tokenized.get("attention_mask")
-        else:
-            input_ids = tokenized
-            attention_mask = None
+            return tokenized["input_ids"]
+        return tokenized
+
+    def _prompt_messages(self, prompt: str, history: List[ChatMessage], max_tokens: int) -> List[Dict[str, str]]:
+        """Системный промпт, обрезанная история и запрос — токены считаются токенизатором модели."""
+        messages, _ = truncate_and_build_messages(
+            prompt=prompt,
+            history=history,
+            max_total_tokens=self.settings.max_context_length,
+            reserved_for_response=max_tokens,
+            counter=self.token_counter,
+        )
+        return messages
+
+    def _prepare_inputs(
+        self,
+        prompt: str,
+        history: List[ChatMessage],
+        max_tokens: int,
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Обрезает историю, применяет chat-шаблон и возвращает `(input_ids, attention_mask)`.
+
+        Предварительная обрезка считает токены токенизатором модели, а итог проверяется
+        по точной длине вывода chat-шаблона: если он не помещается в
+        `max_context_length - max_tokens`, отбрасываются самые старые сообщения истории.
+        """
+        messages = self._prompt_messages(prompt, history, max_tokens)
+
+        input_ids = self._tokenize_messages(messages)
+
+        budget = self.settings.max_context_length - max_tokens
+        # В начале системный промпт (и краткое содержание старой истории), messages[-1] — текущий запрос;
+        # между ними — история
+        first = 1
+        while first < len(messages) - 1 and messages[first]["role"] == "system":
+            first += 1
+        while input_ids.shape[-1] > budget and len(messages) > first + 1:
+            overflow = input_ids.shape[-1] - budget
+            dropped = 0
+            while dropped < overflow and len(messages) > first + 1:
+                dropped += self.token_counter.count(messages.pop(first)["content"]) + 3
+            input_ids = self._tokenize_messages(messages)
+            logger.debug(f"Промпт не помещался в контекст, отброшены старые сообщения (осталось {len(messages)})")
 
         input_ids = input_ids.to(self.model.device)
-        if attention_mask is not None:
-            attention_mask = attention_mask.to(self.model.device)
-        else:
-            pad_id = self.tokenizer.pad_token_id or self.tokenizer.eos_token_id
-            attention_mask = (input_ids != pad_id).long().to(self.model.device)
-
-        # Конфигурация генерации
-        gen_config = GenerationConfig(
+        # Одиночная последовательность без паддинга — внимание на все токены
+        attention_mask = torch.ones_like(input_ids)
+
+        return input_ids, attention_mask
+
+    async def generate_text(self, messages: List[Dict[str, str]], max_tokens: int) -> str:
+        """Служебная генерация по готовому списку сообщений (краткое содержание истории).
+
+        Выполняется в пуле инференса, но мимо кэша ответов, KV-кэша префикса и
+        метрик запросов. Незагруженную модель не загружает.
+        """
+        with self._track_use():
+            if not self.is_loaded:
+                raise RuntimeError("Qwen3 не загружена")
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, partial(self._generate_text, messages, max_tokens))
+
+    def _generate_text(self, messages: List[Dict[str, str]], max_tokens: int) -> str:
+        input_ids = self._tokenize_messages(messages).to(self.model.device)
+        with torch.no_grad():
+            outputs = self.model.generate(
+                input_ids=input_ids,
+                attention_mask=torch.ones_like(input_ids),
+                generation_config=self._generation_config(0.0, max_tokens),
+            )
+        return strip_think(self.tokenizer.decode(outputs[0][input_ids.shape[-1]:], skip_special_tokens=True))
+
+    def _generation_config(self, temperature: float, max_tokens: int) -> GenerationConfig:
+        return GenerationConfig(
             max_new_tokens=max_tokens,
             do_sample=temperature > 0.0,
             temperature=temperature if temperature > 0.0 else None,
@@ -140,28 +610,255 @@ class Qwen3Client:
             eos_token_id=self.tokenizer.eos_token_id,
         )
 
+    def query(
+        self,
+        prompt: str,
+        history: List[ChatMessage],
+        temperature: float,
+        max_tokens: int,
+        stats: Optional[GenerationStats] = None,
+    ) -> str:
+        if not self.is_loaded:
+            raise RuntimeError("Qwen3 не загружена")
+
+        logger.info(f"Запрос к Qwen3 (temperature={temperature}, max_tokens={max_tokens})")
+
+        input_ids, attention_mask = self._prepare_inputs(prompt, history, max_tokens)
+        gen_config = self._generation_config(temperature, max_tokens)
+
         try:
+            outputs = self._generate(input_ids, attention_mask, gen_config, stats=stats)
+
+            input_len = input_ids.shape[-1]
+            decoded = self.tokenizer.decode(outputs[0][input_len:], skip_special_tokens=True)
+            decoded = strip_think(decoded)
+
+            logger.info(f"Ответ от Qwen3 получен (длина: {len(decoded)} символов)")
+            return decoded
+
+        except Exception as e:
+            logger.error(f"Ошибка генерации в Qwen3: {e}")
+            # Например, нехватка памяти — освобождаем кэши в фоне, не задерживая ответ
+            self.memory.request_cleanup("error")
+            raise RuntimeError(f"Ошибка Qwen3: {e}") from e
+
+    def _run_batch(self, items: List[BatchItem]) -> List[str]:
+        """Генерирует ответы для группы запросов одним вызовом `model.generate`.
+
+        Вызывается планировщиком батчей. Запросы дополняются паддингом слева
+        (токенизатор загружен с `padding_side="left"`), `max_new_tokens` берётся
+        по максимальному запросу, а ответ каждого обрезается по его собственному лимиту.
+        Speculative decoding работает только для одиночных запросов — батч генерируется обычным способом.
+        """
+        if len(items) == 1:
+            item = items[0]
+            return [self.query(item.prompt, item.history, item.temperature, item.max_tokens, item.stats)]
+
+        if not self.is_loaded:
+            raise RuntimeError("Qwen3 не загружена")
+
+        max_tokens = max(item.max_tokens for item in items)
+        logger.info(
+            f"Батч-запрос к Qwen3 (batch_size={len(items)}, "
+            f"temperature={items[0].temperature}, max_tokens={max_tokens})"
+        )
+
+        sequences = [
+            self._prepare_inputs(item.prompt, item.history, item.max_tokens)[0][0].tolist()
+            for item in items
+        ]
+        padded = self.tokenizer.pad({"input_ids": sequences}, padding=True, return_tensors="pt")
+        input_ids = padded["input_ids"].to(self.model.device)
+        attention_mask = padded["attention_mask"].to(self.model.device)
+        gen_config = self._generation_config(items[0].temperature, max_tokens)
+
+        try:
+            timer = _FirstTokenTimer()
+            started = time.perf_counter()
             with torch.no_grad():
                 outputs = self.model.generate(
                     input_ids=input_ids,
                     attention_mask=attention_mask,
                     generation_config=gen_config,
+                    stopping_criteria=StoppingCriteriaList([timer]),
                 )
+            finished = time.perf_counter()
+            elapsed = finished - started
+            metrics.observe_batch("qwen3", len(items))
 
             input_len = input_ids.shape[-1]
-            decoded = self.tokenizer.decode(outputs[0][input_len:], skip_special_tokens=True).strip()
+            prompt_lengths = attention_mask.sum(dim=-1).tolist()
+            results = []
+            for item, row, prompt_tokens in zip(items, outputs, prompt_lengths):
+                generated = row[input_len:input_len + item.max_tokens]
+                decoded = self.tokenizer.decode(generated, skip_special_tokens=True)
+                results.append(strip_think(decoded))
+                new_tokens = self._count_generated(generated)
+                # Prefill и декодирование у всех запросов батча общие
+                self._observe_generation(int(prompt_tokens), new_tokens, started, timer, finished)
+                if item.stats is not None:
+                    self._fill_stats(item.stats, new_tokens, elapsed)
 
-            # Очистка от артефактов Qwen
-            if ":</think>" in decoded:
-                decoded = decoded.split(":</think>")[-1].strip()
-            elif "</think>" in decoded:
-                decoded = decoded.split("</think>")[-1].strip()
-
-            logger.info(f"Ответ от Qwen3 получен (длина: {len(decoded)} символов)")
-            self._cleanup_memory()
-            return decoded
+            logger.info(f"Батч ответов от Qwen3 получен (batch_size={len(items)})")
+            return results
 
         except Exception as e:
-            logger.error(f"Ошибка генерации в Qwen3: {e}")
-            self._cleanup_memory()
-            raise RuntimeError(f"Ошибка Qwen3: {e}") from e
\ No newline at end of file
+            logger.error(f"Ошибка батч-генерации в Qwen3: {e}")
+            # Например, нехватка памяти — освобождаем кэши в фоне, не задерживая ответ
+            self.memory.request_cleanup("error")
+            raise RuntimeError(f"Ошибка Qwen3: {e}") from e
+
+    def _count_generated(self, tokens: torch.Tensor) -> int:
+        """Число сгенерированных токенов в строке батча — до первого EOS включительно (дальше паддинг)."""
+        eos = (tokens == self.tokenizer.eos_token_id).nonzero()
+        return int(eos[0]) + 1 if eos.numel() else tokens.shape[0]
+
+    def _cache_model(self, **options: Any) -> str:
+        # Профиль и dtype меняют вывод модели — ответы разных загрузок не смешиваются.
+        # Профиль выводится из настроек и устройства, без загрузки модели
+        if self._cache_profile is None:
+            profile = resolve_profile(self.settings.load_profile, detect_device())
+            self._cache_profile = f"{profile.name}:{str(profile.dtype).replace('torch.', '')}"
+        return f"{self.settings.model_name}:{self._cache_profile}:{self.settings.max_context_length}"
+
+    async def response_cache_key(
+        self,
+        prompt: str,
+        history: List[ChatMessage],
+        temperature: float,
+        max_tokens: int,
+        **options: Any,
+    ) -> Optional[str]:
+        """Ключ кэша ответов — без загрузки модели, чтобы повтор из кэша не держал её в памяти.
+
+        Обрезка истории зависит от токенизатора модели, поэтому ключ строится по
+        истории до обрезки: обрезка детерминирована при тех же модели и `max_context_length`.
+        """
+        if self.response_cache is None or temperature > 0.0:
+            return None
+        messages = [{"role": m.role, "content": m.text} for m in history]
+        messages.append({"role": "user", "content": prompt})
+        return make_cache_key(self.name, self._cache_model(), messages, max_tokens)
+
+    async def chat(
+        self,
+        prompt: str,
+        history: List[ChatMessage],
+        temperature: float,
+        max_tokens: int,
+        stats: Optional[GenerationStats] = None,
+    ) -> str:
+        """Асинхронный запрос к Qwen3.
+
+        При включённом батчинге запрос уходит в очередь планировщика и может быть
+        объединён с конкурентными запросами; иначе генерация выполняется в пуле инференса.
+        Если модель не загружена, запрос дожидается её загрузки.
+        """
+        with self._track_use():
+            await self.aensure_loaded()
+
+            if self._batcher is not None:
+                response = await asyncio.wrap_future(
+                    self._batcher.submit(prompt, history, temperature, max_tokens, stats)
+                )
+            else:
+                loop = asyncio.get_running_loop()
+                response = await loop.run_in_executor(
+                    self._executor,
+                    partial(self.query, prompt, history, temperature, max_tokens, stats),
+                )
+            return response
+
+    async def chat_stream(
+        self,
+        prompt: str,
+        history: List[ChatMessage],
+        temperature: float,
+        max_tokens: int,
+        stats: Optional[GenerationStats] = None,
+    ) -> AsyncIterator[str]:
+        """Асинхронная обёртка `stream_query`: каждый фрагмент ждётся в пуле потоков, а не в event loop."""
+        chunks = self.stream_query(prompt, history, temperature, max_tokens, stats)
+        try:
+            async for delta in iterate_in_threadpool(chunks):
+                yield delta
+        finally:
+            # Клиент ушёл — закрытие генератора останавливает генерацию
+            await run_in_threadpool(chunks.close)
+
+    def stream_query(
+        self,
+        prompt: str,
+        history: List[ChatMessage],
+        temperature: float,
+        max_tokens: int,
+        stats: Optional[GenerationStats] = None,
+    ) -> Iterator[str]:
+        """Потоковая генерация через `TextIteratorStreamer`.
+
+        `model.generate` выполняется в пуле инференса, а фрагменты текста отдаются
+        по мере декодирования. Если потребитель закрывает генератор раньше времени
+        (например, клиент оборвал соединение), генерация останавливается.
+        Если модель не загружена, генератор сначала дожидается её загрузки.
+        """
+        with self._track_use():
+            self.ensure_loaded()
+            yield from self._stream_loaded(prompt, history, temperature, max_tokens, stats)
+
+    def _stream_loaded(
+        self,
+        prompt: str,
+        history: List[ChatMessage],
+        temperature: float,
+        max_tokens: int,
+        stats: Optional[GenerationStats],
+    ) -> Iterator[str]:
+        logger.info(f"Потоковый запрос к Qwen3 (temperature={temperature}, max_tokens={max_tokens})")
+
+        input_ids, attention_mask = self._prepare_inputs(prompt, history, max_tokens)
+        gen_config = self._generation_config(temperature, max_tokens)
+
+        streamer = TextIteratorStreamer(
+            self.tokenizer,
+            skip_prompt=True,
+            skip_special_tokens=True,
+        )
+        cancel_event = threading.Event()
+        errors: List[Exception] = []
+
+        def _generate() -> None:
+            try:
+                if cancel_event.is_set():
+                    # Клиент ушёл, пока запрос ждал свободного воркера
+                    streamer.end()
+                    return
+                self._generate(
+                    input_ids,
+                    attention_mask,
+                    gen_config,
+                    stats=stats,
+                    streamer=streamer,
+                    stopping_criteria=StoppingCriteriaList([_CancelCriteria(cancel_event)]),
+                )
+            except Exception as e:
+                errors.append(e)
+                # Разблокируем читателя стримера, иначе он будет ждать вечно
+                streamer.end()
+
+        future = self._executor.submit(_generate)
+
+        total_chars = 0
+        try:
+            for delta in strip_think_stream(streamer):
+                total_chars += len(delta)
+                yield delta
+        finally:
+            cancel_event.set()
+            future.result()
+
+        if errors:
+            logger.error(f"Ошибка генерации в Qwen3: {errors[0]}")
+            self.memory.request_cleanup("error")
+            raise RuntimeError(f"Ошибка Qwen3: {errors[0]}") from errors[0]
+
+        logger.info(f"Потоковый ответ от Qwen3 завершён (длина: {total_chars} символов)")
@@ -0,0 +1,164 @@
+import copy
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Iterator, Optional
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+
+def _cache_tensors(cache: Any) -> Iterator[torch.Tensor]:
+    """Перебирает тензоры ключей/значений KV-кэша (новый и старый API `DynamicCache`)."""
+    layers = getattr(cache, "layers", None)
+    if layers is not None:
+        for layer in layers:
+            for tensor in (getattr(layer, "keys", None), getattr(layer, "values", None)):
+                if isinstance(tensor, torch.Tensor):
+                    yield tensor
+        return
+    for tensor in list(getattr(cache, "key_cache", [])) + list(getattr(cache, "value_cache", [])):
+        if isinstance(tensor, torch.Tensor):
+            yield tensor
+
+
+def cache_nbytes(cache: Any) -> int:
+    return sum(t.numel() * t.element_size() for t in _cache_tensors(cache))
+
+
+@dataclass
+class KVCacheHit:
+    """Результат поиска: копия кэша, обрезанная до длины совпавшего префикса."""
+    entry_id: int
+    prefix_len: int
+    cache: Any
+
+
+@dataclass
+class _Entry:
+    tokens: torch.Tensor
+    cache: Any
+    nbytes: int
+    pinned: bool = False
+
+
+class PrefixKVCache:
+    """LRU-хранилище KV-кэшей, адресуемое префиксом токенов.
+
+    Для нового запроса ищется запись с самым длинным общим префиксом токенов;
+    её копия обрезается до этого префикса и передаётся в `model.generate`, так что
+    prefill выполняется только для новых токенов. Записи одного диалога вытесняют
+    друг друга (новая запись продолжает старую), остальные вытесняются по LRU при
+    превышении бюджета памяти или числа записей. Закреплённые (`pinned`) записи —
+    например, общий префикс системного промпта — не вытесняются.
+    """
+
+    def __init__(self, max_bytes: int, max_entries: int, min_prefix_tokens: int):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.min_prefix_tokens = min_prefix_tokens
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._next_id = 0
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.reused_tokens = 0
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _common_prefix(a: torch.Tensor, b: torch.Tensor) -> int:
+        n = min(a.shape[0], b.shape[0])
+        if n == 0:
+            return 0
+        mismatch = (a[:n] != b[:n]).nonzero()
+        return n if mismatch.numel() == 0 else int(mismatch[0])
+
+    def lookup(self, input_ids: torch.Tensor) -> Optional[KVCacheHit]:
+        """Ищет запись с самым длинным общим префиксом; `None`, если подходящей нет.
+
+        Хотя бы один токен запроса всегда остаётся непрокэшированным — модели нужно
+        посчитать логиты для последней позиции.
+        """
+        tokens = input_ids.detach().to("cpu").view(-1)
+        limit = tokens.shape[0] - 1
+
+        with self._lock:
+            best_id, best_len = None, 0
+            for entry_id, entry in self._entries.items():
+                prefix = min(self._common_prefix(entry.tokens, tokens), limit)
+                if prefix > best_len:
+                    best_id, best_len = entry_id, prefix
+
+            if best_id is None or best_len < self.min_prefix_tokens:
+                self.misses += 1
+                return None
+
+            entry = self._entries[best_id]
+            self._entries.move_to_end(best_id)
+            self.hits += 1
+            self.reused_tokens += best_len
+
+        # Копируем вне блокировки: записи в хранилище не изменяются, generate работает с копией
+        cache = copy.deepcopy(entry.cache)
+        cache.crop(best_len)
+        return KVCacheHit(entry_id=best_id, prefix_len=best_len, cache=cache)
+
+    def store(
+        self,
+        token_ids: torch.Tensor,
+        cache: Any,
+        pinned: bool = False,
+        replaces: Optional[int] = None,
+    ) -> None:
+        """Сохраняет KV-кэш для последовательности `token_ids` (длина — как у кэша).
+
+        `replaces` — id записи, из которой обслуживался этот ход диалога: она
+        вытесняется новой, чтобы на диалог приходилась одна запись.
+        """
+        tokens = token_ids.detach().to("cpu").view(-1).clone()
+        nbytes = cache_nbytes(cache)
+        if nbytes > self.max_bytes:
+            logger.debug(f"KV-кэш ({nbytes} байт) больше бюджета, не сохраняем")
+            return
+
+        with self._lock:
+            # Запись предыдущего хода и записи, которые новая последовательность продолжает, больше не нужны
+            for entry_id, entry in list(self._entries.items()):
+                if entry.pinned:
+                    continue
+                extended = entry.tokens.shape[0] <= tokens.shape[0] and \
+                    self._common_prefix(entry.tokens, tokens) == entry.tokens.shape[0]
+                if entry_id == replaces or extended:
+                    self._remove(entry_id)
+
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = _Entry(tokens=tokens, cache=cache, nbytes=nbytes, pinned=pinned)
+            self._total_bytes += nbytes
+            self._evict()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def _remove(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id)
+        self._total_bytes -= entry.nbytes
+
+    def _evict(self) -> None:
+        for entry_id in list(self._entries.keys()):
+            if self._total_bytes <= self.max_bytes and len(self._entries) <= self.max_entries:
+                break
+            if self._entries[entry_id].pinned:
+                continue
+            self._remove(entry_id)
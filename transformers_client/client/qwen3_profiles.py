@@ -0,0 +1,163 @@
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+_DTYPES: Dict[str, torch.dtype] = {
+    "fp16": torch.float16,
+    "bf16": torch.bfloat16,
+    "fp32": torch.float32,
+}
+
+
+@dataclass(frozen=True)
+class LoadProfile:
+    """Как загружать модель: тип весов, размещение и квантизация."""
+    name: str
+    dtype: torch.dtype
+    device_map: Optional[str] = "auto"
+    quantization: Optional[str] = None  # None | "dynamic" | "bnb_int8"
+
+    def describe(self) -> str:
+        dtype = str(self.dtype).replace("torch.", "")
+        return f"{self.name} ({dtype}{', ' + self.quantization if self.quantization else ''})"
+
+
+def detect_device() -> str:
+    if torch.cuda.is_available():
+        return "cuda"
+    if torch.backends.mps.is_available():
+        return "mps"
+    return "cpu"
+
+
+def _cpu_supports_bf16() -> bool:
+    """bf16 на CPU быстрее fp32 только при аппаратной поддержке: инструкции AVX512-BF16 или AMX.
+
+    Уровень векторизации ATen (`get_cpu_capability()`) об этом не говорит: AVX512 без BF16
+    эмулирует bf16 медленнее fp32. В torch без проверок `torch.cpu` — по поддержке bf16 в oneDNN;
+    при ошибке — fp32.
+    """
+    try:
+        if hasattr(torch.cpu, "_is_avx512_bf16_supported"):
+            amx = getattr(torch.cpu, "_is_amx_tile_supported", lambda: False)
+            return bool(torch.cpu._is_avx512_bf16_supported() or amx())
+        return torch.backends.mkldnn.is_available() and bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except Exception:
+        return False
+
+
+def _bitsandbytes_available() -> bool:
+    try:
+        import bitsandbytes  # noqa: F401
+    except Exception as e:
+        logger.warning(f"bitsandbytes недоступен: {e}")
+        return False
+    return True
+
+
+def resolve_profile(name: str, device: str) -> LoadProfile:
+    """Превращает имя профиля из настроек в параметры загрузки для устройства.
+
+    - `auto` — fp16 на GPU/MPS; на CPU bf16 при аппаратной поддержке, иначе fp32
+      (fp16-матричные операции на большинстве CPU медленные);
+    - `fp16` / `bf16` / `fp32` — загрузка в указанном типе;
+    - `int8_dynamic` — fp32 на CPU с динамической int8-квантизацией `nn.Linear`;
+    - `bnb_int8` — 8-битные веса bitsandbytes (нужна CUDA); без неё — `int8_dynamic`.
+    """
+    if name == "auto":
+        if device in ("cuda", "mps"):
+            return LoadProfile("auto", torch.float16)
+        return LoadProfile("auto", torch.bfloat16 if _cpu_supports_bf16() else torch.float32)
+
+    if name in _DTYPES:
+        if device == "cpu" and name == "fp16":
+            logger.warning("Профиль fp16 на CPU медленный; рассмотрите bf16, fp32 или int8_dynamic")
+        return LoadProfile(name, _DTYPES[name])
+
+    if name == "bnb_int8":
+        if device == "cuda" and _bitsandbytes_available():
+            return LoadProfile(name, torch.float16, quantization="bnb_int8")
+        logger.warning("bnb_int8 требует CUDA и bitsandbytes — используем int8_dynamic")
+        name = "int8_dynamic"
+
+    if name == "int8_dynamic":
+        if device != "cpu":
+            logger.warning(f"int8_dynamic работает только на CPU, модель будет загружена на CPU вместо {device}")
+        return LoadProfile(name, torch.float32, device_map=None, quantization="dynamic")
+
+    raise ValueError(f"Неизвестный профиль загрузки: {name}")
+
+
+def from_pretrained_kwargs(profile: LoadProfile, attn_implementation: str) -> Dict[str, Any]:
+    """Аргументы `from_pretrained` для профиля."""
+    kwargs: Dict[str, Any] = {
+        "torch_dtype": profile.dtype,
+        "attn_implementation": attn_implementation,
+    }
+    if profile.device_map is not None:
+        kwargs["device_map"] = profile.device_map
+    if profile.quantization == "bnb_int8":
+        from transformers import BitsAndBytesConfig
+        kwargs["quantization_config"] = BitsAndBytesConfig(load_in_8bit=True)
+    return kwargs
+
+
+def apply_post_load(model, profile: LoadProfile, compile_model: bool):
+    """Квантизация после загрузки и `torch.compile`; возвращает модель."""
+    if profile.quantization == "dynamic":
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        logger.info("Применена динамическая int8-квантизация nn.Linear")
+
+    if compile_model:
+        try:
+            # dynamic=True: длина промпта и KV-кэша меняется от запроса к запросу
+            model.forward = torch.compile(model.forward, dynamic=True)
+            logger.info("forward модели скомпилирован через torch.compile")
+        except Exception as e:
+            logger.warning(f"torch.compile недоступен, работаем без компиляции: {e}")
+    return model
+
+
+def configure_threads(num_threads: int) -> int:
+    """Задаёт число intra-op потоков torch (0 — оставить значение по умолчанию); возвращает итоговое."""
+    if num_threads > 0 and torch.get_num_threads() != num_threads:
+        torch.set_num_threads(num_threads)
+        logger.info(f"torch intra-op потоков: {num_threads}")
+    return torch.get_num_threads()
+
+
+def benchmark_generation(model, tokenizer, new_tokens: int) -> Dict[str, float]:
+    """Короткий замер скорости генерации: prefill и декодирование `new_tokens` токенов жадным поиском.
+
+    Прогон для разогрева (компиляция, ленивые инициализации) в замер не входит.
+    """
+    input_ids = tokenizer("Benchmark: count from one to one hundred.", return_tensors="pt")["input_ids"].to(model.device)
+    attention_mask = torch.ones_like(input_ids)
+
+    def run(tokens: int) -> float:
+        started = time.perf_counter()
+        with torch.no_grad():
+            model.generate(
+                input_ids=input_ids,
+                attention_mask=attention_mask,
+                max_new_tokens=tokens,
+                min_new_tokens=tokens,
+                do_sample=False,
+                pad_token_id=tokenizer.eos_token_id,
+            )
+        return time.perf_counter() - started
+
+    # Прогрев на полной длине: с torch.compile иначе в замер попадут перекомпиляции под новые формы
+    run(new_tokens)
+    prefill = run(1)
+    total = run(new_tokens)
+    decode = max(total - prefill, 1e-6)
+    return {
+        "prefill_ms": round(prefill * 1000, 1),
+        "tokens_per_second": round((new_tokens - 1) / decode, 2) if new_tokens > 1 else 0.0,
+    }
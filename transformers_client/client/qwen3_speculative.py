@@ -0,0 +1,90 @@
+import logging
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, Optional
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ForwardTrace:
+    """Вызовы forward целевой модели за одну генерацию."""
+    calls: int = 0
+    positions: int = 0
+
+
+class ForwardCounter:
+    """Считает вызовы forward модели и число обработанных позиций — по потоку генерации.
+
+    При speculative decoding целевая модель на каждом шаге проверяет
+    последний принятый токен плюс черновые кандидаты одним forward, поэтому
+    по длине входов можно восстановить, сколько черновых токенов было
+    предложено, а по числу сгенерированных токенов — сколько принято.
+    """
+
+    def __init__(self, model: torch.nn.Module):
+        self._local = threading.local()
+        self._handle = model.register_forward_pre_hook(self._hook, with_kwargs=True)
+
+    def _hook(self, module, args, kwargs) -> None:
+        trace: Optional[ForwardTrace] = getattr(self._local, "trace", None)
+        if trace is None:
+            return
+        input_ids = kwargs.get("input_ids", args[0] if args else None)
+        if input_ids is None:
+            input_ids = kwargs.get("inputs_embeds")
+        trace.calls += 1
+        if input_ids is not None:
+            trace.positions += input_ids.shape[1]
+
+    @contextmanager
+    def measure(self) -> Iterator[ForwardTrace]:
+        trace = ForwardTrace()
+        self._local.trace = trace
+        try:
+            yield trace
+        finally:
+            self._local.trace = None
+
+    def remove(self) -> None:
+        self._handle.remove()
+
+
+def speculative_generate_kwargs(
+    mode: str,
+    draft_model: Optional[torch.nn.Module],
+    num_assistant_tokens: int,
+    prompt_lookup_num_tokens: int,
+    prompt_lookup_max_ngram_size: int,
+) -> Dict[str, Any]:
+    """Аргументы `model.generate` для выбранного режима (`off`, `draft`, `prompt_lookup`)."""
+    if mode == "draft" and draft_model is not None:
+        return {"assistant_model": draft_model, "num_assistant_tokens": num_assistant_tokens}
+    if mode == "prompt_lookup":
+        return {
+            "prompt_lookup_num_tokens": prompt_lookup_num_tokens,
+            "max_matching_ngram_size": prompt_lookup_max_ngram_size,
+        }
+    return {}
+
+
+def acceptance_from_trace(trace: ForwardTrace, prompt_positions: int, new_tokens: int) -> Dict[str, Optional[float]]:
+    """Оценивает число предложенных и принятых черновых токенов по трассе forward.
+
+    `prompt_positions` — позиции промпта, которые целевая модель обработала сама
+    (без префикса из KV-кэша). Каждый шаг проверки даёт ровно один «собственный»
+    токен целевой модели, остальные новые токены — принятые кандидаты; на всех
+    шагах, кроме первого, на вход подаётся ещё последний принятый токен.
+    """
+    if trace.calls == 0:
+        return {"draft_tokens": None, "accepted_tokens": None, "acceptance_rate": None}
+    proposed = max(0, trace.positions - prompt_positions - (trace.calls - 1))
+    accepted = min(proposed, max(0, new_tokens - trace.calls))
+    return {
+        "draft_tokens": proposed,
+        "accepted_tokens": accepted,
+        "acceptance_rate": round(accepted / proposed, 4) if proposed else None,
+    }
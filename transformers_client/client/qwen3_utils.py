@@ -1,89 +1,58 @@
-import logging
-from typing import List, Dict, Optional, Tuple
+from typing import Iterable, Iterator
 
-from transformers_client.endpoint.qwen3_entities import ChatMessage
+THINK_OPEN: str = "<think>"
+THINK_CLOSE: str = "</think>"
 
-logger = logging.getLogger(__name__)
 
-SYSTEM_PROMPT: str = (
-    "Ты — вежливый и точный ассистент. Отвечай кратко, по делу и только на русском языке. "
-    "Если вопрос неясен — уточни. Не выдумывай фактов."
-)
+def strip_think(decoded: str) -> str:
+    """Убирает из ответа Qwen3 блок рассуждений `<think>...</think>`."""
+    # Очистка от артефактов Qwen
+    if f":{THINK_CLOSE}" in decoded:
+        decoded = decoded.split(f":{THINK_CLOSE}")[-1]
+    elif THINK_CLOSE in decoded:
+        decoded = decoded.split(THINK_CLOSE)[-1]
+    return decoded.strip()
 
 
-try:
-    import tiktoken
-except Exception as e:
-    logger.warning(f"Ошибка импорта библиотеки tiktoken: {e}")
-    tiktoken = None
+def strip_think_stream(chunks: Iterable[str]) -> Iterator[str]:
+    """Потоковый аналог `strip_think`.
 
-
-def count_tokens(text: str) -> int:
-    """Подсчитывает токены текста с использованием `tiktoken`.
-
-    Если `tiktoken` недоступен — возвращает оценку по количеству символов.
+    Пока ответ начинается с `<think>`, фрагменты накапливаются в буфере; после `</think>`
+    отдаётся только остаток. Если блока рассуждений нет — фрагменты проходят без задержки.
+    Если генерация оборвалась внутри блока, буфер отдаётся целиком, как и в `strip_think`.
     """
-    if tiktoken is None:
-        return max(1, len(text) // 4)
-    enc = tiktoken.get_encoding("cl100k_base")
-    return len(enc.encode(text))
-
-
-def truncate_history(
-        history: List[ChatMessage],
-        prompt: str,
-        max_total_tokens: int = 30720,
-        reserved_for_response: int = 512,
-) -> List[ChatMessage]:
-    """Обрезает историю так, чтобы вместиться в лимит токенов.
-
-    Сохраняются самые свежие сообщения.
-    """
-    available_tokens = max_total_tokens - reserved_for_response - count_tokens(prompt)
-    if available_tokens <= 0:
-        return []
-
-    truncated: List[ChatMessage] = []
-    total = 0
-    # Идём с конца — сохраняем новые сообщения
-    for msg in reversed(history):
-        msg_tokens = count_tokens(msg.text) + 3  # +3 для учёта метаданных роли
-        if total + msg_tokens > available_tokens:
-            break
-        truncated.append(msg)
-        total += msg_tokens
-
-    return list(reversed(truncated))
-
-
-def truncate_and_build_messages(
-        prompt: str,
-        history: List[ChatMessage],
-        max_total_tokens: int,
-        reserved_for_response: int,
-        system_prompt: Optional[str] = None,
-) -> Tuple[List[Dict[str, str]], List[ChatMessage]]:
-    """Обрезает историю и формирует список сообщений для send-пейлоада.
-
-    Возвращает кортеж `(messages, safe_history)`.
-    """
-    if system_prompt is None:
-        system_prompt = SYSTEM_PROMPT
-
-    safe_history = truncate_history(
-        history=history,
-        prompt=prompt,
-        max_total_tokens=max_total_tokens,
-        reserved_for_response=reserved_for_response,
-    )
-
-    messages: List[Dict[str, str]] = [{"role": "system", "content": system_prompt}]
-
-    for msg in safe_history:
-        role = "user" if msg.role == "user" else "assistant"
-        messages.append({"role": role, "content": msg.text})
-
-    messages.append({"role": "user", "content": prompt})
-
-    logger.debug(f"Prepared messages (count={len(messages)}) after truncation")
-    return messages, safe_history
\ No newline at end of file
+    buffer = ""
+    passthrough = False
+    started = False
+
+    for chunk in chunks:
+        if not chunk:
+            continue
+
+        if passthrough:
+            if not started:
+                chunk = chunk.lstrip()
+                if not chunk:
+                    continue
+                started = True
+            yield chunk
+            continue
+
+        buffer += chunk
+        head = buffer.lstrip()
+
+        if THINK_CLOSE in buffer:
+            rest = buffer.split(THINK_CLOSE)[-1].lstrip()
+            passthrough = True
+            buffer = ""
+            if rest:
+                started = True
+                yield rest
+        elif head and not THINK_OPEN.startswith(head[:len(THINK_OPEN)]):
+            passthrough = True
+            buffer = ""
+            started = True
+            yield head
+
+    if buffer.strip():
+        yield buffer.strip()
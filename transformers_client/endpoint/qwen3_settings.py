@@ -1,31 +1,193 @@
 from functools import lru_cache
+from typing import ClassVar, Literal
 from pydantic import Field
-from pydantic_settings import BaseSettings, SettingsConfigDict
 
-class Qwen3Settings(BaseSettings):
+from llm_engine.settings import EngineSettings
+
+class Qwen3Settings(EngineSettings):
+    # QWEN3_MAX_CONTEXT_LENGTH, QWEN3_ADMISSION_MAX_CONCURRENT и т. д.; без префикса — общие значения
+    engine_env_prefix: ClassVar[str] = "qwen3_"
+
     model_name: str = Field(
         default= "Qwen/Qwen3-1.7B",
-        description="Наименование модели",
-        alias="model_name"
+        description="Наименование модели"
     )
 
     max_context_length: int = Field(
         default=28672,
-        description="Максимальное число токенов в контексте модели",
-        alias="max_context_length"
+        description="Максимальное число токенов в контексте модели"
     )
 
     reserved_tokens_for_response: int = Field(
         default=1024,
-        description="Зарезервировано под ответ (используется в truncate)",
-        alias="reserved_tokens_for_response"
+        description="Зарезервировано под ответ (используется в truncate)"
+    )
+
+    token_counter_backend: Literal["model", "tiktoken"] = Field(
+        default="model",
+        description="Чем считать токены при обрезке истории: 'model' — токенизатором Qwen3, 'tiktoken' — cl100k_base"
+    )
+
+    load_profile: Literal["auto", "fp16", "bf16", "fp32", "int8_dynamic", "bnb_int8"] = Field(
+        default="auto",
+        description="Профиль загрузки: 'auto' — fp16 на GPU/MPS, bf16/fp32 на CPU; "
+                    "'int8_dynamic' — динамическая int8-квантизация (CPU); 'bnb_int8' — bitsandbytes (CUDA)"
+    )
+
+    attn_implementation: Literal["sdpa", "eager", "flash_attention_2"] = Field(
+        default="sdpa",
+        description="Реализация внимания (sdpa — torch.nn.functional.scaled_dot_product_attention)"
+    )
+
+    torch_compile: bool = Field(
+        default=False,
+        description="Компилировать forward модели через torch.compile (дольше старт, быстрее генерация)"
+    )
+
+    num_threads: int = Field(
+        default=0,
+        ge=0,
+        description="Число intra-op потоков torch на CPU (0 — по умолчанию torch, обычно число ядер)"
+    )
+
+    startup_benchmark_tokens: int = Field(
+        default=16,
+        ge=0,
+        description="Сколько токенов сгенерировать для замера скорости после загрузки (0 — не замерять)"
+    )
+
+    speculative_mode: Literal["off", "draft", "prompt_lookup"] = Field(
+        default="off",
+        description="Speculative decoding: 'draft' — черновая модель draft_model_name, "
+                    "'prompt_lookup' — кандидаты из n-грамм промпта (без второй модели)"
+    )
+
+    draft_model_name: str = Field(
+        default="Qwen/Qwen3-0.6B",
+        description="Черновая модель для speculative_mode='draft' (с тем же токенизатором, что и основная)"
+    )
+
+    num_assistant_tokens: int = Field(
+        default=5,
+        ge=1,
+        description="Сколько токенов черновая модель предлагает за шаг (начальное значение, дальше подстраивается)"
+    )
+
+    prompt_lookup_num_tokens: int = Field(
+        default=10,
+        ge=1,
+        description="Сколько токенов-кандидатов брать из промпта за шаг при prompt_lookup"
+    )
+
+    prompt_lookup_max_ngram_size: int = Field(
+        default=3,
+        ge=1,
+        description="Максимальная длина n-граммы, по которой ищется совпадение в промпте"
+    )
+
+    lazy_load: bool = Field(
+        default=True,
+        description="Загружать модель при первом запросе, а не при старте API"
+    )
+
+    idle_unload_seconds: int = Field(
+        default=900,
+        ge=0,
+        description="Выгружать модель после стольких секунд без запросов (0 — не выгружать)"
+    )
+
+    memory_rss_threshold_mb: int = Field(
+        default=0,
+        ge=0,
+        description="Фоновая очистка памяти, когда RSS процесса выше порога (0 — отключено)"
+    )
+
+    memory_allocator_threshold_mb: int = Field(
+        default=512,
+        ge=0,
+        description="Фоновая очистка, когда кэш аллокатора CUDA/MPS больше порога (0 — отключено)"
+    )
+
+    memory_idle_cleanup_seconds: int = Field(
+        default=60,
+        ge=0,
+        description="Фоновая очистка после стольких секунд без запросов (0 — отключено)"
+    )
+
+    memory_check_interval_seconds: float = Field(
+        default=5.0,
+        gt=0,
+        description="Как часто фоновый поток проверяет пороги очистки памяти"
+    )
+
+    inference_workers: int = Field(
+        default=1,
+        ge=1,
+        description="Размер пула потоков для генерации (одновременных вызовов model.generate)"
+    )
+
+    shutdown_timeout_seconds: float = Field(
+        default=10,
+        ge=0,
+        description="Сколько ждать при остановке приложения завершения текущего батча и очистки памяти"
+    )
+
+    batching_enabled: bool = Field(
+        default=True,
+        description="Объединять конкурентные запросы в батчи для одного вызова model.generate"
+    )
+
+    batch_max_size: int = Field(
+        default=4,
+        ge=1,
+        description="Максимальный размер батча"
+    )
+
+    batch_max_wait_ms: int = Field(
+        default=10,
+        ge=0,
+        description="Сколько ждать (мс) попутные запросы после первого, прежде чем запускать батч"
+    )
+
+    kv_cache_enabled: bool = Field(
+        default=True,
+        description="Переиспользовать KV-кэш общего префикса токенов между ходами диалога"
+    )
+
+    kv_cache_max_mb: int = Field(
+        default=1024,
+        ge=1,
+        description="Бюджет памяти под сохранённые KV-кэши (МБ)"
+    )
+
+    kv_cache_max_entries: int = Field(
+        default=32,
+        ge=1,
+        description="Максимальное число сохранённых KV-кэшей (примерно — число активных диалогов)"
+    )
+
+    kv_cache_min_prefix_tokens: int = Field(
+        default=16,
+        ge=1,
+        description="Минимальная длина совпавшего префикса, при которой кэш переиспользуется"
+    )
+
+    admission_max_concurrent: int = Field(
+        default=4,
+        ge=1,
+        description="Сколько запросов к Qwen3 выполняется одновременно (обычно batch_max_size); остальные ждут в очереди"
+    )
+
+    admission_max_queue: int = Field(
+        default=32,
+        ge=0,
+        description="Максимум ожидающих запросов; сверх — сразу 503 с Retry-After"
     )
 
-    model_config = SettingsConfigDict(
-        frozen=True,
-        case_sensitive=False,
-        env_nested_delimiter="__",
-        env_file=".env"
+    admission_queue_timeout_seconds: float = Field(
+        default=300,
+        ge=0,
+        description="Сколько запрос может ждать слота, прежде чем получит 503 (0 — без ограничения)"
     )
 
 
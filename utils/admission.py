@@ -0,0 +1,225 @@
+import asyncio
+import logging
+import math
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, Optional
+
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionRejected(Exception):
+    """Запрос не допущен: 429 — превышен лимит пользователя, 503 — сервер перегружен."""
+
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Допуск запросов к одному движку: ограничение параллелизма, очередь и справедливость.
+
+    - одновременно выполняется не больше `max_concurrent` запросов;
+    - у одного пользователя не больше `per_user_limit` запросов (выполняемых и
+      ожидающих) — сверх лимита сразу 429;
+    - ожидающих не больше `max_queue` — сверх сразу 503; дождавшийся
+      `queue_timeout_seconds` без слота тоже получает 503;
+    - освободившийся слот отдаётся пользователям по кругу (round-robin), внутри
+      пользователя — по порядку, поэтому один активный клиент не вытесняет остальных.
+
+    `Retry-After` оценивается по средней длительности запроса и длине очереди.
+    Все методы вызываются из одного event loop, блокировки не нужны.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_concurrent: int,
+        max_queue: int,
+        per_user_limit: int,
+        queue_timeout_seconds: float,
+    ):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.per_user_limit = per_user_limit
+        self.queue_timeout_seconds = queue_timeout_seconds
+
+        self._running = 0
+        self._waiting = 0
+        self._per_user: Dict[str, int] = {}
+        # Очереди ожидающих по пользователям; порядок ключей — порядок обхода round-robin
+        self._queues: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        # Скользящее среднее длительности запроса — для Retry-After
+        self._avg_seconds = 1.0
+
+        self.admitted = 0
+        self.rejected: Dict[str, int] = {"user_limit": 0, "queue_full": 0, "queue_timeout": 0}
+
+    # --- допуск ---
+
+    def _retry_after(self, ahead: int) -> int:
+        """Через сколько секунд стоит повторить запрос, если перед ним `ahead` запросов."""
+        return max(1, math.ceil(self._avg_seconds * (ahead + 1) / self.max_concurrent))
+
+    def _reject(self, reason: str, status_code: int, detail: str, ahead: int) -> AdmissionRejected:
+        self.rejected[reason] += 1
+        metrics.observe_admission_rejected(self.name, reason)
+        return AdmissionRejected(status_code, detail, self._retry_after(ahead))
+
+    async def acquire(self, user: str) -> None:
+        """Ждёт слот для запроса пользователя `user` или бросает `AdmissionRejected`."""
+        if self._per_user.get(user, 0) >= self.per_user_limit:
+            raise self._reject(
+                "user_limit", 429,
+                f"Слишком много одновременных запросов (не больше {self.per_user_limit})",
+                self._per_user[user],
+            )
+
+        if self._running < self.max_concurrent and self._waiting == 0:
+            self._running += 1
+            self._per_user[user] = self._per_user.get(user, 0) + 1
+            self.admitted += 1
+            return
+
+        if self._waiting >= self.max_queue:
+            raise self._reject("queue_full", 503, "Сервер перегружен, повторите позже", self._waiting)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(user, deque()).append(waiter)
+        self._waiting += 1
+        self._per_user[user] = self._per_user.get(user, 0) + 1
+        metrics.set_admission_waiting(self.name, self._waiting)
+
+        try:
+            await asyncio.wait_for(waiter, timeout=self.queue_timeout_seconds or None)
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                # Слот выдан одновременно с отменой — возвращаем его
+                self.release(user)
+            else:
+                self._forget(user, waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                raise self._reject("queue_timeout", 503, "Очередь не продвинулась вовремя, повторите позже", self._waiting)
+            raise
+        self.admitted += 1
+
+    def _forget(self, user: str, waiter: asyncio.Future) -> None:
+        """Убирает из очереди ожидающего, который ушёл (отмена или таймаут)."""
+        queue = self._queues.get(user)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            self._waiting -= 1
+            if not queue:
+                del self._queues[user]
+        self._decrement_user(user)
+        metrics.set_admission_waiting(self.name, self._waiting)
+
+    def _decrement_user(self, user: str) -> None:
+        count = self._per_user.get(user, 0) - 1
+        if count > 0:
+            self._per_user[user] = count
+        else:
+            self._per_user.pop(user, None)
+
+    def release(self, user: str, elapsed: Optional[float] = None) -> None:
+        """Освобождает слот и передаёт его следующему пользователю по кругу."""
+        self._running -= 1
+        self._decrement_user(user)
+        if elapsed is not None:
+            self._avg_seconds = 0.8 * self._avg_seconds + 0.2 * elapsed
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        while self._running < self.max_concurrent and self._queues:
+            user, queue = next(iter(self._queues.items()))
+            waiter = queue.popleft()
+            self._waiting -= 1
+            if queue:
+                # Пользователь уходит в конец круга
+                self._queues.move_to_end(user)
+            else:
+                del self._queues[user]
+            if waiter.done():
+                continue
+            self._running += 1
+            waiter.set_result(None)
+        metrics.set_admission_waiting(self.name, self._waiting)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "running": self._running,
+            "waiting": self._waiting,
+            "users": len(self._per_user),
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "avg_seconds": round(self._avg_seconds, 3),
+        }
+
+
+class AdmissionMiddleware:
+    """ASGI-middleware допуска для путей движков.
+
+    `routes` сопоставляет префикс пути с именем атрибута `app.state`, где лежит
+    `AdmissionController` движка (его создаёт lifespan роутера). Слот занят всё
+    время ответа, включая потоковую передачу. Пользователь берётся из
+    `scope["state"]`, поэтому middleware должна стоять после `AuthMiddleware`.
+    """
+
+    def __init__(self, app: ASGIApp, routes: Dict[str, str]):
+        self.app = app
+        self.routes = routes
+
+    def _controller(self, scope: Scope) -> Optional[AdmissionController]:
+        path = scope["path"]
+        for prefix, attribute in self.routes.items():
+            if path.startswith(prefix):
+                return getattr(scope["app"].state, attribute, None)
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        controller = self._controller(scope) if scope["type"] == "http" and scope["method"] == "POST" else None
+        if controller is None:
+            await self.app(scope, receive, send)
+            return
+
+        user = scope.get("state", {}).get("username")
+        if not user:
+            client = scope.get("client")
+            user = f"ip:{client[0]}" if client else "anonymous"
+
+        try:
+            await controller.acquire(user)
+        except AdmissionRejected as e:
+            logger.info(f"Запрос {user} к {controller.name} отклонён ({e.status_code}): {e.detail}")
+            response = JSONResponse(
+                {"detail": e.detail},
+                status_code=e.status_code,
+                headers={"Retry-After": str(e.retry_after)},
+            )
+            await response(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            controller.release(user, time.perf_counter() - started)
+
+
+def create_admission_controller(name: str, settings) -> AdmissionController:
+    """Контроллер допуска по настройкам движка (`admission_*`)."""
+    return AdmissionController(
+        name=name,
+        max_concurrent=settings.admission_max_concurrent,
+        max_queue=settings.admission_max_queue,
+        per_user_limit=settings.admission_per_user_limit,
+        queue_timeout_seconds=settings.admission_queue_timeout_seconds,
+    )
@@ -0,0 +1,212 @@
+import gc
+import logging
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+try:
+    import psutil
+except Exception as e:
+    logger.warning(f"Ошибка импорта библиотеки psutil: {e}")
+    psutil = None
+
+try:
+    import torch
+except Exception:
+    torch = None
+
+
+def current_rss_bytes() -> Optional[int]:
+    """Резидентная память процесса; `None`, если `psutil` недоступен."""
+    if psutil is None:
+        return None
+    return psutil.Process().memory_info().rss
+
+
+def allocator_cached_bytes() -> int:
+    """Память, которую кэширующий аллокатор CUDA/MPS держит, но не использует."""
+    if torch is None:
+        return 0
+    try:
+        if torch.cuda.is_available():
+            return torch.cuda.memory_reserved() - torch.cuda.memory_allocated()
+        if torch.backends.mps.is_available():
+            return torch.mps.driver_allocated_memory() - torch.mps.current_allocated_memory()
+    except Exception as e:
+        logger.debug(f"Не удалось получить статистику аллокатора: {e}")
+    return 0
+
+
+def release_memory() -> None:
+    """Полная сборка мусора и возврат кэша аллокатора CUDA/MPS. Без `synchronize`."""
+    gc.collect()
+    if torch is None:
+        return
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+    elif torch.backends.mps.is_available():
+        torch.mps.empty_cache()
+
+
+def freeze_long_lived() -> None:
+    """Переносит все текущие объекты в постоянное поколение GC — один раз, при старте приложения.
+
+    Полные проходы сборщика перестают обходить модули, настройки и загруженную при
+    старте модель — паузы GC короче. Повторный вызов сначала размораживает прежние
+    объекты, чтобы постоянное поколение не росло.
+    """
+    gc.unfreeze()
+    gc.collect()
+    gc.freeze()
+
+
+def unfreeze() -> None:
+    """Возвращает замороженные объекты под управление GC (перед выгрузкой модели)."""
+    gc.unfreeze()
+
+
+class MemoryManager:
+    """Политика очистки памяти вне пути запроса.
+
+    Фоновый поток раз в `check_interval_seconds` решает, нужна ли очистка:
+
+    - `rss` — RSS процесса выше `rss_threshold_mb`;
+    - `allocator` — кэш аллокатора CUDA/MPS больше `allocator_threshold_mb`;
+    - `idle` — после последней активности прошло `idle_seconds`, и с прошлой
+      очистки запросы были;
+    - явный запрос через `request_cleanup` (причина — переданная строка).
+
+    Очистки по порогам не чаще раза в `min_interval_seconds`; по простою —
+    только когда `is_busy()` ложно. Порог 0 отключает соответствующее правило.
+    """
+
+    def __init__(
+        self,
+        rss_threshold_mb: int = 0,
+        allocator_threshold_mb: int = 0,
+        idle_seconds: float = 0,
+        check_interval_seconds: float = 5.0,
+        min_interval_seconds: float = 30.0,
+        is_busy: Callable[[], bool] = lambda: False,
+    ):
+        self.rss_threshold_bytes = rss_threshold_mb * 1024 * 1024
+        self.allocator_threshold_bytes = allocator_threshold_mb * 1024 * 1024
+        self.idle_seconds = idle_seconds
+        self.check_interval_seconds = check_interval_seconds
+        self.min_interval_seconds = min_interval_seconds
+        self.is_busy = is_busy
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._requested: Optional[str] = None
+        self._last_activity = time.monotonic()
+        self._last_cleanup = 0.0
+        self._dirty = False
+
+        self.runs: Dict[str, int] = {"rss": 0, "allocator": 0, "idle": 0, "requested": 0}
+        self.total_seconds = 0.0
+        self.last_seconds = 0.0
+        self.last_reason: Optional[str] = None
+        self.freed_rss_bytes = 0
+
+    # --- жизненный цикл ---
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="memory-manager", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Останавливает фоновый поток; ждёт текущую очистку не дольше `timeout` секунд (`None` — без ограничения)."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._wakeup.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    # --- события ---
+
+    def note_activity(self) -> None:
+        """Отмечает запрос: от этого момента отсчитывается простой."""
+        self._last_activity = time.monotonic()
+        self._dirty = True
+
+    def request_cleanup(self, reason: str = "requested") -> None:
+        """Просит фоновый поток выполнить очистку при ближайшей возможности."""
+        self._requested = reason
+        self._wakeup.set()
+
+    # --- решение и очистка ---
+
+    def _due_reason(self) -> Optional[str]:
+        if self._requested is not None:
+            return self._requested
+
+        now = time.monotonic()
+        if now - self._last_cleanup >= self.min_interval_seconds:
+            if self.rss_threshold_bytes > 0:
+                rss = current_rss_bytes()
+                if rss is not None and rss > self.rss_threshold_bytes:
+                    return "rss"
+            if self.allocator_threshold_bytes > 0 and allocator_cached_bytes() > self.allocator_threshold_bytes:
+                return "allocator"
+
+        if self.idle_seconds > 0 and self._dirty and now - self._last_activity >= self.idle_seconds \
+                and not self.is_busy():
+            return "idle"
+        return None
+
+    def run_cleanup(self, reason: str) -> float:
+        """Выполняет очистку в текущем потоке и учитывает её в счётчиках; возвращает длительность."""
+        rss_before = current_rss_bytes()
+        started = time.perf_counter()
+        release_memory()
+        elapsed = time.perf_counter() - started
+        rss_after = current_rss_bytes()
+
+        with self._lock:
+            self.runs[reason] = self.runs.get(reason, 0) + 1
+            self.total_seconds += elapsed
+            self.last_seconds = elapsed
+            self.last_reason = reason
+            if rss_before is not None and rss_after is not None and rss_before > rss_after:
+                self.freed_rss_bytes += rss_before - rss_after
+            self._last_cleanup = time.monotonic()
+            self._dirty = False
+            # Любая очистка выполняет и отложенный запрос
+            self._requested = None
+
+        logger.debug(f"Очистка памяти ({reason}) заняла {elapsed * 1000:.1f} мс")
+        return elapsed
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            self._wakeup.wait(self.check_interval_seconds)
+            self._wakeup.clear()
+            if self._stop.is_set():
+                break
+            try:
+                reason = self._due_reason()
+                if reason is not None:
+                    self.run_cleanup(reason)
+            except Exception as e:
+                logger.warning(f"Ошибка фоновой очистки памяти: {e}")
+
+    def stats(self) -> Dict[str, object]:
+        """Счётчики: сколько раз и по какой причине выполнялась очистка и сколько она заняла."""
+        with self._lock:
+            return {
+                "runs": dict(self.runs),
+                "total_seconds": round(self.total_seconds, 4),
+                "last_seconds": round(self.last_seconds, 4),
+                "last_reason": self.last_reason,
+                "freed_rss_bytes": self.freed_rss_bytes,
+                "rss_bytes": current_rss_bytes(),
+            }
@@ -0,0 +1,201 @@
+import logging
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+try:
+    from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Gauge, Histogram, generate_latest
+    from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+except Exception as e:
+    logger.warning(f"Ошибка импорта библиотеки prometheus_client: {e}")
+    REGISTRY = None
+
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+_TOKEN_BUCKETS = (1, 8, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+_TPS_BUCKETS = (1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 200, 300, 500, 1000)
+_STORAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+# Движки, чьё состояние (очередь, кэши) читается при каждом опросе /metrics
+_engines: Dict[str, Any] = {}
+
+if REGISTRY is not None:
+    REQUEST_SECONDS = Histogram(
+        "llm_request_duration_seconds", "Время обработки запроса к модели (для стрима — до последнего фрагмента)",
+        ["engine", "mode", "status"], buckets=_LATENCY_BUCKETS,
+    )
+    FIRST_TOKEN_SECONDS = Histogram(
+        "llm_time_to_first_token_seconds", "Время от запроса до первого фрагмента ответа в стриме",
+        ["engine"], buckets=_LATENCY_BUCKETS,
+    )
+    PREFILL_SECONDS = Histogram(
+        "llm_prefill_seconds", "Обработка промпта до первого сгенерированного токена",
+        ["engine"], buckets=_LATENCY_BUCKETS,
+    )
+    DECODE_SECONDS = Histogram(
+        "llm_decode_seconds", "Генерация токенов после первого",
+        ["engine"], buckets=_LATENCY_BUCKETS,
+    )
+    PROMPT_TOKENS = Histogram(
+        "llm_prompt_tokens", "Токенов в промпте", ["engine"], buckets=_TOKEN_BUCKETS,
+    )
+    COMPLETION_TOKENS = Histogram(
+        "llm_completion_tokens", "Сгенерированных токенов", ["engine"], buckets=_TOKEN_BUCKETS,
+    )
+    TOKENS_PER_SECOND = Histogram(
+        "llm_decode_tokens_per_second", "Скорость декодирования", ["engine"], buckets=_TPS_BUCKETS,
+    )
+    BATCH_SIZE = Histogram(
+        "llm_batch_size", "Размер батча одного вызова генерации", ["engine"], buckets=(1, 2, 3, 4, 6, 8, 12, 16, 32),
+    )
+    IN_FLIGHT = Gauge(
+        "llm_requests_in_flight", "Запросы к модели, обрабатываемые сейчас", ["engine"],
+    )
+    ADMISSION_REJECTED = Counter(
+        "llm_admission_rejected", "Запросы, отклонённые контролем допуска", ["engine", "reason"],
+    )
+    ADMISSION_WAITING = Gauge(
+        "llm_admission_waiting", "Запросы, ожидающие слота в очереди допуска", ["engine"],
+    )
+    STORAGE_SECONDS = Histogram(
+        "storage_operation_duration_seconds", "Длительность операций хранилища",
+        ["backend", "operation"], buckets=_STORAGE_BUCKETS,
+    )
+
+
+def available() -> bool:
+    return REGISTRY is not None
+
+
+class RequestObserver:
+    """Метрики одного запроса: задержка, время до первого фрагмента, статус и число запросов в работе."""
+
+    def __init__(self, engine: str, mode: str):
+        self.engine = engine
+        self.mode = mode
+        self.status = "ok"
+        self.started = time.perf_counter()
+        self._first_seen = False
+        if REGISTRY is not None:
+            IN_FLIGHT.labels(engine).inc()
+
+    def first_chunk(self) -> None:
+        if self._first_seen:
+            return
+        self._first_seen = True
+        if REGISTRY is not None:
+            FIRST_TOKEN_SECONDS.labels(self.engine).observe(time.perf_counter() - self.started)
+
+    def finish(self) -> None:
+        if REGISTRY is None:
+            return
+        IN_FLIGHT.labels(self.engine).dec()
+        REQUEST_SECONDS.labels(self.engine, self.mode, self.status).observe(time.perf_counter() - self.started)
+
+
+@contextmanager
+def track_request(engine: str, mode: str) -> Iterator[RequestObserver]:
+    """Оборачивает обработку запроса; статус `error` при исключении, `cancelled` при обрыве стрима."""
+    observer = RequestObserver(engine, mode)
+    try:
+        yield observer
+    except GeneratorExit:
+        observer.status = "cancelled"
+        raise
+    except BaseException:
+        observer.status = "error"
+        raise
+    finally:
+        observer.finish()
+
+
+def observe_generation(
+    engine: str,
+    prompt_tokens: Optional[int] = None,
+    completion_tokens: Optional[int] = None,
+    prefill_seconds: Optional[float] = None,
+    decode_seconds: Optional[float] = None,
+) -> None:
+    """Учитывает одну генерацию; неизвестные движку величины передаются как `None`."""
+    if REGISTRY is None:
+        return
+    if prompt_tokens is not None:
+        PROMPT_TOKENS.labels(engine).observe(prompt_tokens)
+    if completion_tokens is not None:
+        COMPLETION_TOKENS.labels(engine).observe(completion_tokens)
+    if prefill_seconds is not None:
+        PREFILL_SECONDS.labels(engine).observe(prefill_seconds)
+    if decode_seconds is not None:
+        DECODE_SECONDS.labels(engine).observe(decode_seconds)
+        # Первый токен приходится на prefill
+        if completion_tokens is not None and completion_tokens > 1 and decode_seconds > 0:
+            TOKENS_PER_SECOND.labels(engine).observe((completion_tokens - 1) / decode_seconds)
+
+
+def observe_batch(engine: str, size: int) -> None:
+    if REGISTRY is not None:
+        BATCH_SIZE.labels(engine).observe(size)
+
+
+def observe_admission_rejected(engine: str, reason: str) -> None:
+    if REGISTRY is not None:
+        ADMISSION_REJECTED.labels(engine, reason).inc()
+
+
+def set_admission_waiting(engine: str, waiting: int) -> None:
+    if REGISTRY is not None:
+        ADMISSION_WAITING.labels(engine).set(waiting)
+
+
+@contextmanager
+def time_storage(backend: str, operation: str) -> Iterator[None]:
+    """Замеряет операцию хранилища (успешную или нет)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if REGISTRY is not None:
+            STORAGE_SECONDS.labels(backend, operation).observe(time.perf_counter() - started)
+
+
+def register_engine(name: str, client: Any) -> None:
+    """Регистрирует клиент движка: его очередь и кэши попадают в /metrics."""
+    _engines[name] = client
+
+
+def unregister_engine(name: str) -> None:
+    _engines.pop(name, None)
+
+
+class _EngineCollector:
+    """Состояние движков на момент опроса: глубина очереди и счётчики кэшей."""
+
+    def collect(self):
+        queue_depth = GaugeMetricFamily("llm_queue_depth", "Запросы в очереди на генерацию", labels=["engine"])
+        cache_lookups = CounterMetricFamily(
+            "llm_cache_lookups", "Обращения к кэшам движка", labels=["engine", "cache", "result"]
+        )
+        cache_entries = GaugeMetricFamily("llm_cache_entries", "Записей в кэше", labels=["engine", "cache"])
+
+        for name, client in list(_engines.items()):
+            depth = getattr(client, "queue_depth", None)
+            if depth is not None:
+                queue_depth.add_metric([name], depth)
+            for cache_name, stats in client.cache_stats().items():
+                cache_lookups.add_metric([name, cache_name, "hit"], stats.get("hits", 0))
+                cache_lookups.add_metric([name, cache_name, "miss"], stats.get("misses", 0))
+                cache_entries.add_metric([name, cache_name], stats.get("entries", 0))
+
+        yield queue_depth
+        yield cache_lookups
+        yield cache_entries
+
+
+if REGISTRY is not None:
+    REGISTRY.register(_EngineCollector())
+
+
+def render() -> Tuple[bytes, str]:
+    """Текст метрик в формате Prometheus и его content-type."""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
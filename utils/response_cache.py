@@ -0,0 +1,229 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def make_cache_key(engine: str, model: str, messages: List[Dict[str, str]], max_tokens: int) -> str:
+    """Ключ кэша: движок, модель, итоговые сообщения после обрезки истории и лимит ответа."""
+    payload = json.dumps(
+        {"engine": engine, "model": model, "messages": messages, "max_tokens": max_tokens},
+        ensure_ascii=False,
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Кэш ответов детерминированных (temperature=0) генераций.
+
+    Первый уровень — LRU в памяти на `max_entries` записей, второй (если задан
+    `disk_path`) — таблица SQLite, переживающая перезапуск и общая для процессов.
+    Записи старше `ttl_seconds` считаются устаревшими на обоих уровнях
+    (0 — без ограничения срока). Потокобезопасен.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl_seconds: float = 3600,
+        disk_path: Optional[str] = None,
+        disk_max_entries: int = 100_000,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_path = disk_path
+        self.disk_max_entries = disk_max_entries
+
+        self._lock = threading.Lock()
+        # key -> (expires_at, text); expires_at = 0 — без срока
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+
+        self._disk_lock = threading.Lock()
+        self._disk: Optional[sqlite3.Connection] = None
+        self._disk_writes = 0
+        if disk_path:
+            self._disk = self._open_disk(disk_path)
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+
+    @property
+    def has_disk(self) -> bool:
+        return self._disk is not None
+
+    # --- диск ---
+
+    @staticmethod
+    def _open_disk(path: str) -> Optional[sqlite3.Connection]:
+        try:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY,"
+                " text TEXT NOT NULL,"
+                " expires_at REAL NOT NULL,"
+                " accessed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+            return conn
+        except sqlite3.Error as e:
+            logger.warning(f"Дисковый кэш ответов {path} недоступен, работаем только в памяти: {e}")
+            return None
+
+    def _disk_get(self, key: str, now: float) -> Optional[Tuple[float, str]]:
+        try:
+            with self._disk_lock:
+                row = self._disk.execute(
+                    "SELECT expires_at, text FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    return None
+                if row[0] and row[0] <= now:
+                    self._disk.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    return None
+                self._disk.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+                return row[0], row[1]
+        except sqlite3.Error as e:
+            logger.warning(f"Ошибка чтения дискового кэша ответов: {e}")
+            return None
+
+    def _disk_put(self, key: str, expires_at: float, text: str, now: float) -> None:
+        try:
+            with self._disk_lock:
+                self._disk.execute(
+                    "INSERT OR REPLACE INTO responses (key, text, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                    (key, text, expires_at, now),
+                )
+                self._disk_writes += 1
+                # Подрезаем таблицу не на каждой записи
+                if self._disk_writes % 100 == 0:
+                    self._disk_prune(now)
+        except sqlite3.Error as e:
+            logger.warning(f"Ошибка записи дискового кэша ответов: {e}")
+
+    def _disk_prune(self, now: float) -> None:
+        self._disk.execute("DELETE FROM responses WHERE expires_at > 0 AND expires_at <= ?", (now,))
+        self._disk.execute(
+            "DELETE FROM responses WHERE key IN ("
+            " SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.disk_max_entries,),
+        )
+
+    # --- память ---
+
+    def _remember(self, key: str, expires_at: float, text: str) -> None:
+        """Кладёт запись в LRU; вызывается под `_lock`."""
+        self._entries[key] = (expires_at, text)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    # --- API ---
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, text = entry
+                if expires_at and expires_at <= now:
+                    del self._entries[key]
+                    self.expired += 1
+                else:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return text
+
+        if self._disk is not None:
+            entry = self._disk_get(key, now)
+            if entry is not None:
+                with self._lock:
+                    self._remember(key, *entry)
+                    self.hits += 1
+                    self.disk_hits += 1
+                return entry[1]
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, text: str) -> None:
+        if not text:
+            return
+        now = time.time()
+        expires_at = now + self.ttl_seconds if self.ttl_seconds > 0 else 0.0
+        with self._lock:
+            self._remember(key, expires_at, text)
+        if self._disk is not None:
+            self._disk_put(key, expires_at, text, now)
+
+    async def aget(self, key: str) -> Optional[str]:
+        """`get` для event loop: обращение к диску выполняется в потоке."""
+        if self._disk is None:
+            return self.get(key)
+        return await asyncio.to_thread(self.get, key)
+
+    async def aput(self, key: str, text: str) -> None:
+        if self._disk is None:
+            self.put(key, text)
+        else:
+            await asyncio.to_thread(self.put, key, text)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+        if self._disk is not None:
+            with self._disk_lock:
+                self._disk.execute("DELETE FROM responses")
+
+    def close(self) -> None:
+        if self._disk is not None:
+            with self._disk_lock:
+                self._disk.close()
+                self._disk = None
+
+    def stats(self) -> Dict[str, object]:
+        """Счётчики попаданий и промахов для `/health`."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expired": self.expired,
+                "disk": self.disk_path if self._disk is not None else None,
+            }
+
+
+def create_response_cache(settings) -> Optional[ResponseCache]:
+    """Кэш ответов по настройкам движка (`response_cache_*`); `None`, если кэш выключен."""
+    if not settings.response_cache_enabled:
+        return None
+    return ResponseCache(
+        max_entries=settings.response_cache_max_entries,
+        ttl_seconds=settings.response_cache_ttl_seconds,
+        disk_path=settings.response_cache_path,
+        disk_max_entries=settings.response_cache_disk_max_entries,
+    )
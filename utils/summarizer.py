@@ -0,0 +1,308 @@
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from utils.token_counter import TokenCounter, get_default_counter
+
+logger = logging.getLogger(__name__)
+
+# Роль сообщения истории с кратким содержанием: `truncate_and_build_messages` ставит его сразу после системного промпта
+SUMMARY_ROLE: str = "summary"
+SUMMARY_HEADER: str = "Краткое содержание предыдущей части диалога (старые сообщения в контекст не вошли):\n"
+
+SUMMARY_INSTRUCTION: str = (
+    "Ты сжимаешь историю диалога пользователя с ассистентом. Составь краткое содержание: "
+    "факты, договорённости, имена, числа, решения и открытые вопросы. "
+    "Пиши по-русски, без вступлений и оценок."
+)
+
+# Слишком длинное сообщение при сжатии обрезается (≈4 символа на токен)
+_CHARS_PER_TOKEN = 4
+
+GenerateFn = Callable[[List[Dict[str, str]], int], Awaitable[str]]
+
+
+def message_hash(message: Any) -> str:
+    return hashlib.sha1(f"{message.role}\n{message.text}".encode("utf-8")).hexdigest()
+
+
+def build_summary_request(previous: Optional[str], messages: List[Any], max_chars: int) -> List[Dict[str, str]]:
+    """Сообщения для модели: прежнее краткое содержание плюс новые вытесненные сообщения."""
+    lines = []
+    for m in messages:
+        author = "Пользователь" if m.role == "user" else "Ассистент"
+        lines.append(f"[{author}]: {m.text[:max_chars]}")
+    parts = []
+    if previous:
+        parts.append(f"Краткое содержание более ранней части диалога:\n{previous}")
+    parts.append("Новые сообщения:\n" + "\n".join(lines))
+    parts.append("Напиши обновлённое краткое содержание всего диалога.")
+    return [
+        {"role": "system", "content": SUMMARY_INSTRUCTION},
+        {"role": "user", "content": "\n\n".join(parts)},
+    ]
+
+
+# Сколько последних учтённых сообщений запоминается, чтобы найти место продолжения
+# (одного мало: короткие ответы вроде «Да» повторяются)
+_TAIL_MESSAGES = 4
+
+
+@dataclass
+class RunningSummary:
+    text: str
+    # Хэши последних учтённых сообщений — по ним находится продолжение
+    tail: List[str]
+    covered: int
+
+
+def _find_continuation(hashes: List[str], tail: List[str]) -> Optional[int]:
+    """Позиция сразу после последнего учтённого сообщения; `None`, если его нет в истории.
+
+    В начале окна истории предшественников может быть меньше, чем в `tail`, —
+    тогда сравнивается только доступная часть.
+    """
+    for end in range(len(hashes), 0, -1):
+        k = min(len(tail), end)
+        if hashes[end - k:end] == tail[-k:]:
+            return end
+    return None
+
+
+class HistorySummarizer:
+    """Скользящее краткое содержание старой части диалога вместо простого отбрасывания.
+
+    На пути запроса (`apply`) только считается, какие сообщения не помещаются в
+    контекст, и подставляется уже готовое краткое содержание диалога — первым
+    сообщением истории с ролью `SUMMARY_ROLE`. Если вытеснены сообщения, которых
+    в нём ещё нет, обновление запускается в фоне: модель сворачивает прежнее
+    краткое содержание и новые сообщения в новое (порциями не длиннее
+    `max_input_tokens`). Следующий запрос того же диалога получит обновлённый текст.
+
+    Краткие содержания хранятся в памяти (LRU на `max_entries` диалогов), ключ —
+    пользователь и диалог. Одновременно выполняется одно обновление, для каждого
+    диалога — не больше одного; после ошибки диалог `retry_after_seconds` не обновляется.
+    `apply` можно вызывать из любого потока, задачи выполняются в event loop, переданном `start`.
+    """
+
+    def __init__(
+        self,
+        engine: str,
+        generate: GenerateFn,
+        truncate: Callable[..., List[Any]],
+        message_cls: Any,
+        system_prompt: str,
+        max_summary_tokens: int = 256,
+        max_input_tokens: int = 2048,
+        max_entries: int = 1024,
+        retry_after_seconds: float = 60.0,
+        counter: Optional[Callable[[], TokenCounter]] = None,
+    ):
+        self.engine = engine
+        self.generate = generate
+        self.truncate = truncate
+        self.message_cls = message_cls
+        self.system_prompt = system_prompt
+        self.max_summary_tokens = max_summary_tokens
+        self.max_input_tokens = max_input_tokens
+        self.max_entries = max_entries
+        self.retry_after_seconds = retry_after_seconds
+        # Счётчик токенов движка (у Qwen3 меняется при загрузке модели); по умолчанию — tiktoken
+        self.counter = counter or get_default_counter
+
+        self._lock = threading.Lock()
+        self._summaries: "OrderedDict[str, RunningSummary]" = OrderedDict()
+        self._running: Set[str] = set()
+        self._retry_at: Dict[str, float] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+        self.hits = 0
+        self.misses = 0
+        self.updates = 0
+        self.failures = 0
+
+    def start(self) -> None:
+        """Привязывает фоновые обновления к текущему event loop (вызывается в lifespan)."""
+        self._loop = asyncio.get_running_loop()
+        self._semaphore = asyncio.Semaphore(1)
+
+    async def aclose(self) -> None:
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._loop = None
+
+    # --- путь запроса ---
+
+    def apply(
+        self,
+        key: str,
+        history: List[Any],
+        prompt: str,
+        max_total_tokens: int,
+        reserved_for_response: int,
+        counter: Optional[TokenCounter] = None,
+    ) -> List[Any]:
+        """Добавляет в начало истории краткое содержание вытесненных сообщений, если оно уже готово.
+
+        Вытесненные сообщения считаются с запасом под краткое содержание
+        (`max_summary_tokens`), поэтому граница не сдвигается, когда оно появляется.
+        """
+        if not history:
+            return history
+        if counter is None:
+            counter = self.counter()
+
+        budget = max_total_tokens - counter.count(self.system_prompt) - counter.count(SUMMARY_HEADER) \
+            - self.max_summary_tokens - 3
+        kept = self.truncate(history, prompt, budget, reserved_for_response, counter=counter)
+        evicted = history[:len(history) - len(kept)]
+        if not evicted:
+            return history
+
+        with self._lock:
+            current = self._summaries.get(key)
+            if current is not None:
+                self._summaries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+        pending = self._pending(current, history, len(evicted))
+        if pending:
+            self._schedule(key, pending)
+
+        if current is None:
+            return history
+        return [self.message_cls.model_construct(role=SUMMARY_ROLE, text=current.text)] + history
+
+    @staticmethod
+    def _pending(current: Optional[RunningSummary], history: List[Any], evicted: int) -> List[Any]:
+        """Вытесненные сообщения (первые `evicted` в истории), которых ещё нет в кратком содержании."""
+        if current is None:
+            return history[:evicted]
+        end = _find_continuation([message_hash(m) for m in history], current.tail)
+        if end is None:
+            # Окно истории ушло дальше последнего учтённого сообщения
+            return history[:evicted]
+        # end > evicted — краткое содержание уже охватывает больше, чем вытеснено сейчас
+        return history[end:evicted]
+
+    def _schedule(self, key: str, messages: List[Any]) -> None:
+        loop = self._loop
+        if loop is None:
+            return
+        with self._lock:
+            if key in self._running or time.monotonic() < self._retry_at.get(key, 0.0):
+                return
+            self._running.add(key)
+        try:
+            loop.call_soon_threadsafe(self._start_task, key, list(messages))
+        except RuntimeError:
+            # Event loop уже закрыт (остановка приложения)
+            with self._lock:
+                self._running.discard(key)
+
+    def _start_task(self, key: str, messages: List[Any]) -> None:
+        task = asyncio.ensure_future(self._update(key, messages))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    # --- фоновое обновление ---
+
+    def _take_chunk(self, messages: List[Any], counter: TokenCounter) -> int:
+        """Сколько сообщений с начала списка войдёт в один запрос на сжатие (хотя бы одно)."""
+        total = 0
+        for i, m in enumerate(messages):
+            total += counter.count(m.text) + 3
+            if total > self.max_input_tokens and i > 0:
+                return i
+        return len(messages)
+
+    async def _update(self, key: str, messages: List[Any]) -> None:
+        counter = self.counter()
+        try:
+            async with self._semaphore:
+                while messages:
+                    size = self._take_chunk(messages, counter)
+                    chunk, messages = messages[:size], messages[size:]
+                    with self._lock:
+                        current = self._summaries.get(key)
+                    started = time.perf_counter()
+                    text = (await self.generate(
+                        build_summary_request(
+                            current.text if current else None, chunk, self.max_input_tokens * _CHARS_PER_TOKEN
+                        ),
+                        self.max_summary_tokens,
+                    )).strip()
+                    if not text:
+                        raise ValueError("модель вернула пустое краткое содержание")
+                    summary = RunningSummary(
+                        text=text,
+                        tail=((current.tail if current else []) + [message_hash(m) for m in chunk])[-_TAIL_MESSAGES:],
+                        covered=(current.covered if current else 0) + len(chunk),
+                    )
+                    with self._lock:
+                        self._summaries[key] = summary
+                        self._summaries.move_to_end(key)
+                        while len(self._summaries) > self.max_entries:
+                            self._summaries.popitem(last=False)
+                        self._retry_at.pop(key, None)
+                        self.updates += 1
+                    logger.info(
+                        f"{self.engine}: краткое содержание диалога обновлено за {time.perf_counter() - started:.2f} с "
+                        f"(+{len(chunk)} сообщений, всего {summary.covered})"
+                    )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            with self._lock:
+                self.failures += 1
+                self._retry_at[key] = time.monotonic() + self.retry_after_seconds
+            logger.warning(f"{self.engine}: не удалось обновить краткое содержание диалога: {e}")
+        finally:
+            with self._lock:
+                self._running.discard(key)
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "entries": len(self._summaries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "updates": self.updates,
+                "failures": self.failures,
+                "running": len(self._running),
+            }
+
+
+def create_history_summarizer(
+    engine: str,
+    settings,
+    generate: GenerateFn,
+    truncate: Callable[..., List[Any]],
+    message_cls: Any,
+    system_prompt: str,
+    counter: Optional[Callable[[], TokenCounter]] = None,
+) -> Optional[HistorySummarizer]:
+    """Суммаризатор истории по настройкам движка (`summary_*`); `None`, если выключен."""
+    if not settings.summary_enabled:
+        return None
+    return HistorySummarizer(
+        engine=engine,
+        generate=generate,
+        truncate=truncate,
+        message_cls=message_cls,
+        system_prompt=system_prompt,
+        max_summary_tokens=settings.summary_max_tokens,
+        max_input_tokens=settings.summary_max_input_tokens,
+        max_entries=settings.summary_cache_max_entries,
+        counter=counter,
+    )
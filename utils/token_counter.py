@@ -0,0 +1,147 @@
+import hashlib
+import logging
+import os
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from functools import lru_cache
+from typing import List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+except Exception as e:
+    logger.warning(f"Ошибка импорта библиотеки tiktoken: {e}")
+    tiktoken = None
+
+TOKEN_COUNT_CACHE_SIZE = int(os.getenv("TOKEN_COUNT_CACHE_SIZE", "8192"))
+
+
+@lru_cache(maxsize=1)
+def get_encoder():
+    """Возвращает единственный на процесс экземпляр энкодера `cl100k_base`.
+
+    `None`, если `tiktoken` не установлен или словарь не удалось загрузить
+    (например, нет доступа к сети при первом запуске).
+    """
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning(f"Не удалось загрузить энкодер cl100k_base, используем оценку по символам: {e}")
+        return None
+
+
+class TokenCountMemo:
+    """Ограниченный LRU-кэш «хэш содержимого → число токенов».
+
+    Ключ — дайджест текста, а не сам текст, поэтому память не растёт вместе с длиной сообщений.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[bytes, int]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(text: str) -> bytes:
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+    def get(self, key: bytes):
+        with self._lock:
+            value = self._data.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: bytes, value: int) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+
+class TokenCounter(ABC):
+    """Базовый счётчик токенов с мемоизацией по хэшу содержимого.
+
+    Наследники реализуют абстрактный `_encode_lengths` — подсчёт для списка текстов одним вызовом.
+    У каждого счётчика своя память: разные токенизаторы дают разные числа.
+    """
+
+    name: str = "base"
+
+    def __init__(self, cache_size: int = TOKEN_COUNT_CACHE_SIZE):
+        self.memo = TokenCountMemo(cache_size)
+
+    @abstractmethod
+    def _encode_lengths(self, texts: List[str]) -> List[int]:
+        """Число токенов каждого текста (без мемоизации)."""
+
+    def count(self, text: str) -> int:
+        return self.count_many([text])[0]
+
+    def count_many(self, texts: Sequence[str]) -> List[int]:
+        """Считает токены для списка текстов; незакэшированные кодируются одним батчем."""
+        keys = [TokenCountMemo.key(text) for text in texts]
+        counts: List[Optional[int]] = [self.memo.get(key) for key in keys]
+
+        missing = [i for i, count in enumerate(counts) if count is None]
+        if missing:
+            lengths = self._encode_lengths([texts[i] for i in missing])
+            for i, length in zip(missing, lengths):
+                counts[i] = length
+                self.memo.put(keys[i], length)
+
+        return counts  # type: ignore[return-value]
+
+
+class TiktokenCounter(TokenCounter):
+    """Подсчёт через `tiktoken` (`cl100k_base`); без него — оценка по количеству символов."""
+
+    name = "tiktoken"
+
+    def _encode_lengths(self, texts: List[str]) -> List[int]:
+        enc = get_encoder()
+        if enc is None:
+            return [max(1, len(text) // 4) for text in texts]
+        return [len(ids) for ids in enc.encode_batch(texts)]
+
+
+class HFTokenizerCounter(TokenCounter):
+    """Подсчёт настоящим токенизатором модели (Hugging Face), батчем за один вызов."""
+
+    name = "model"
+
+    def __init__(self, tokenizer, cache_size: int = TOKEN_COUNT_CACHE_SIZE):
+        super().__init__(cache_size)
+        self.tokenizer = tokenizer
+
+    def _encode_lengths(self, texts: List[str]) -> List[int]:
+        encoded = self.tokenizer(texts, add_special_tokens=False)["input_ids"]
+        return [len(ids) for ids in encoded]
+
+
+_default_counter = TiktokenCounter()
+
+
+def get_default_counter() -> TokenCounter:
+    """Счётчик по умолчанию (`tiktoken`), общий для всего процесса."""
+    return _default_counter
+
+
+def count_tokens(text: str) -> int:
+    """Подсчитывает токены текста с использованием `tiktoken`.
+
+    Результат кэшируется по хэшу содержимого: при каждом ходе диалога
+    пересчитываются только новые сообщения.
+    Если `tiktoken` недоступен — возвращает оценку по количеству символов.
+    """
+    return _default_counter.count(text)